@@ -11,29 +11,126 @@ Description: This tool allows a user to upload a dataset and quickly see
 
 Required: graph.html and graph.hexf (the existing data network, both created from 
          file named "create_graph") saved in a folder called 'assets' 
+         (graph.snapshot, also created by "create_graph", is loaded instead 
+         of graph.gexf if it is there). Networks drawn by the tool are kept 
+         in a separate folder (artifactDir) of limited size
+
+Requirements: myFunctions.py, headerMatch.py, dash, flask_caching, cachelib,
+             networkx, pandas, numpy, scipy
 
 @author: cmcinerney
 """
     
-import base64
-import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, MATCH
 import dash_core_components as dcc
 import dash_html_components as html
 from collections import OrderedDict
 
+import hashlib
+
 import pandas as pd
 import networkx as nx
-from datetime import datetime
-from flask import Flask
+from flask import Flask, abort, send_from_directory
+from werkzeug.security import safe_join
 from flask_caching import Cache
 
-from myFunctions import draw_graph3, parse_contents
+from myFunctions import draw_graph3, overlayDelta, placeNewNodes, detectCommunities, groupSmallCommunities, communityGraph, parse_contents, uploadFormat, parseUpload, previewPage, readWeights, graphIndex, cachedMatchIndexBatch, graphVersion, readGraphSnapshot, snapshotToGraph, storeArtifact, pruneArtifacts
+from headerMatch import headerIndex, lookupHeaders
 
 # general configuration
 graphName = 'Afghanistan_test'      # name for default/initial graph to load
+clusterViewMinNodes = 2000          # networks with more datasets than this are shown as an overview of clusters of datasets
+minClusterSize = 2                  # datasets in smaller clusters (e.g. linked to no others) are shown together as one unclustered group
+renderDeltas = True                 # add uploaded datasets to the network already shown, otherwise redraw and save the whole network for each upload
+fuzzyMatchVars = False              # match uploaded vars to similar vars of the network (e.g. "ADM1_EN" to "Admin1 Name"), not only identical ones
+fuzzyThreshold = 0.7                # how similar (0-1) vars must be to match when fuzzyMatchVars is used
+uploadWorkers = 8                   # number of uploaded files read at the same time
+maxConcurrentUploads = 2            # number of uploads each server process reads at the same time, others wait
+uploadWaitTimeout = 60              # seconds an upload waits for its turn before the user is asked to try again
+cacheType = os.environ.get('DEM_CACHE_TYPE', 'simple')  # where uploads and their matches are cached: 'simple' (memory of each process), 'filesystem' or 'redis' (shared by worker processes)
+cacheDir = os.environ.get('DEM_CACHE_DIR', 'upload_cache')  # folder of the 'filesystem' cache
+cacheRedisUrl = 'redis://localhost:6379/0'  # server of the 'redis' cache (its size is limited by the server's maxmemory)
+cacheThreshold = 500                # maximum number of cached items ('simple' and 'filesystem'), the least recently used are removed first
+cacheTimeout = 3600                 # seconds cached items are kept after they were last used
+artifactDir = 'artifacts'           # folder of the networks drawn by the tool (cluster pages, networks redrawn with uploads)
+artifactMaxBytes = 500 * 2**20      # maximum size of artifactDir, the least recently used networks are removed first
+artifactMaxAge = 7 * 24 * 3600      # seconds drawn networks are kept after they were last used
+previewPageSize = 20                # rows per page of the preview of uploaded files
+maxPreviewBytes = 20 * 2**20        # largest preview of an uploaded file kept in the cache (only its first rows are shown if it is bigger), so the cache holds at most about cacheThreshold times this
+
+# =============================================================================
+# Load the existing graph and weights once, and index the hxls/vars of its
+# nodes so uploads can be matched without re-reading them
+# =============================================================================
+
+hxls_weights, vars_weights = readWeights('hxl_dictionary_weighted.xlsx', 'var_dictionary_weighted.xlsx')
+#use the snapshot of the graph if there is one, it loads much faster than gexf
+#(its token arrays are indexed directly)
+if os.path.isdir(".\\assets\\" + graphName + ".snapshot"):
+    snapshot = readGraphSnapshot(".\\assets\\" + graphName + ".snapshot")
+    G_base = snapshotToGraph(snapshot)
+else:
+    snapshot = None
+    G_base = nx.read_gexf(".\\assets\\" + graphName + ".gexf")
+graph_index = graphIndex(G_base, hxls_weights, vars_weights, snapshot)
+#matches are cached under this version, so they are found again after a
+#restart but not once the graph, weights or matching settings change
+graph_version = graphVersion([".\\assets\\" + graphName + ".snapshot", ".\\assets\\" + graphName + ".gexf",
+                              'hxl_dictionary_weighted.xlsx', 'var_dictionary_weighted.xlsx'],
+                             fuzzyMatchVars, fuzzyThreshold)
+header_index = headerIndex(list(graph_index['vars']), threshold=fuzzyThreshold) if fuzzyMatchVars else None
+
+#large networks are shown as an overview of clusters of datasets (see
+#create_graph), each cluster can then be opened on its own
+cluster_view = G_base.number_of_nodes() > clusterViewMinNodes
+clusters = {}
+if cluster_view:
+    if not all('community' in d for n, d in G_base.nodes(data=True)):
+        detectCommunities(G_base, min_size=minClusterSize)
+    else:
+        groupSmallCommunities(G_base, minClusterSize)
+    for n, d in G_base.nodes(data=True):
+        clusters.setdefault(d['community'], []).append(n)
+
+#drawn networks are kept in their own folder (not assets), named after the
+#version of the graph or the uploads they show, and removed once unused
+pruneArtifacts(artifactDir, artifactMaxBytes, artifactMaxAge)
+if cluster_view:
+    overview_page = graphName + "_clusters-" + graph_version[:16] + ".html"
+    storeArtifact(artifactDir, overview_page,
+                  lambda path: draw_graph3(communityGraph(G_base), path,
+                                           physics=not all('x' in d for n, d in G_base.nodes(data=True))),
+                  artifactMaxBytes, artifactMaxAge)
+
+
+def artifact_url(name, write):
+    """
+    Returns the url of a network drawn by the tool, drawing it with
+    write(path) if it isn't in the store of drawn networks.
+    """
+    storeArtifact(artifactDir, name, write, artifactMaxBytes, artifactMaxAge)
+    return app.get_relative_path('/artifacts/' + name)
+
+
+def cluster_page(cluster):
+    """
+    Returns the url of the network of one cluster of datasets (drawn the first
+    time it is opened) or of the overview of all clusters.
+    """
+    if not cluster_view:
+        return app.get_asset_url(graphName + ".html")
+    if cluster is None or cluster == 'overview':
+        return artifact_url(overview_page, lambda path: draw_graph3(communityGraph(G_base), path,
+                                                                    physics=not all('x' in d for n, d in G_base.nodes(data=True))))
+    G_cluster = G_base.subgraph(clusters[int(cluster)])
+    return artifact_url(graphName + "_cluster" + str(cluster) + "-" + graph_version[:16] + ".html",
+                        lambda path: draw_graph3(G_cluster.copy(), path,
+                                                 physics=not all('x' in d for n, d in G_cluster.nodes(data=True))))
 
 # =============================================================================
 # Setup Dash layout
@@ -42,8 +139,25 @@ graphName = 'Afghanistan_test'      # name for default/initial graph to load
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
-cache = Cache(app.server, config={'CACHE_TYPE': 'simple'})
-cache.clear()
+server = app.server
+
+
+#serve the networks drawn by the tool from their store
+@server.route('/artifacts/<path:name>')
+def serve_artifact(name):
+    #names that lead out of the store (e.g. "../app.py") aren't served or touched
+    path = safe_join(artifactDir, name)
+    if path is None:
+        abort(404)
+    if os.path.isfile(path):
+        #mark the network as used, so it is removed last
+        os.utime(path)
+    return send_from_directory(os.path.abspath(artifactDir), name)
+#the 'filesystem' cache is made by fileSystemCache (cachelib), see myFunctions
+cache = Cache(app.server, config={'CACHE_TYPE': 'myFunctions.fileSystemCache' if cacheType == 'filesystem' else cacheType,
+                                  'CACHE_DIR': cacheDir, 'CACHE_REDIS_URL': cacheRedisUrl,
+                                  'CACHE_THRESHOLD': cacheThreshold, 'CACHE_DEFAULT_TIMEOUT': cacheTimeout,
+                                  'CACHE_KEY_PREFIX': graphName + '-'})
 
 #define colours and formatting
 colors = {
@@ -113,6 +227,17 @@ app.layout = html.Div([
         multiple=True
     ),
     
+    #choose a cluster of datasets to show (large networks only)
+    dcc.Dropdown(
+        id='cluster-view',
+        options=[{'label': 'All clusters', 'value': 'overview'}] + [
+            {'label': ('Unclustered' if c == -1 else 'Cluster ' + str(c)) + ' (' + str(len(members)) + ' datasets)', 'value': str(c)}
+            for c, members in sorted(clusters.items(), key=lambda item: (item[0] == -1, item[0]))],
+        value='overview',
+        clearable=False,
+        style={'display': 'block' if cluster_view else 'none'}
+    ),
+    
     html.Div(id = 'neighbours',
         children='This is where list of datasets will be', 
         style={
@@ -125,7 +250,7 @@ app.layout = html.Div([
         }),
     #insert network graph
     html.Iframe(id = 'graph-iframe',
-                height=2000,width=900,src=app.get_asset_url(graphName + ".html"),
+                height=2000,width=900,src=cluster_page('overview'),
         style={
             'width': '78%',
             'height': '800px',
@@ -146,7 +271,14 @@ app.layout = html.Div([
         }),
     
     #uploaded dataset displayed at bottom
-    html.Div(id='output-data-upload')
+    html.Div(id='output-data-upload'),
+    
+    #keys of the uploaded files parsed and cached on the server
+    dcc.Store(id='upload-keys'),
+    
+    #new nodes/edges to add to the network shown in the iframe
+    dcc.Store(id='graph-delta'),
+    html.Div(id='graph-delta-applied', style={'display': 'none'})
 ])
 
 
@@ -164,126 +296,257 @@ def close_modal(n):
 # Define callbacks
 # =============================================================================
 
-@app.callback(Output('output-data-upload', 'children'),
+#add the uploaded node and its edges to the pyvis network in the iframe (its
+#vis.js nodes/edges/network are globals of the iframe page), replacing the
+#ones added by the previous upload. Edges to datasets that aren't shown are
+#linked to their cluster in the overview, and the new node is added again
+#whenever another network is loaded in the iframe
+app.clientside_callback(
+    """
+    function(delta) {
+        var frame = document.getElementById('graph-iframe');
+        if (!delta || !frame) {
+            return '';
+        }
+        function apply() {
+            var win = frame.contentWindow;
+            if (!win || !win.nodes || !win.edges) {
+                return;
+            }
+            if (win.overlay) {
+                win.edges.remove(win.overlay.edges);
+                win.nodes.remove(win.overlay.nodes);
+            }
+            var edges = [];
+            delta.edges.forEach(function(e) {
+                var edge = Object.assign({}, e);
+                if (win.nodes.get(edge.to) === null) {
+                    if (edge.cluster && win.nodes.get(edge.cluster) !== null) {
+                        edge.to = edge.cluster;
+                    } else {
+                        return;
+                    }
+                }
+                edges.push(edge);
+            });
+            win.nodes.add(delta.nodes);
+            win.edges.add(edges);
+            win.overlay = {
+                nodes: delta.nodes.map(function(n) { return n.id; }),
+                edges: edges.map(function(e) { return e.id; })
+            };
+            if (win.network && delta.nodes.length > 0) {
+                win.network.focus(delta.nodes[0].id, {animation: true});
+            }
+        }
+        frame.onload = apply;
+        apply();
+        return '';
+    }
+    """,
+    Output('graph-delta-applied', 'children'),
+    [Input('graph-delta', 'data')])
+
+upload_slots = threading.BoundedSemaphore(maxConcurrentUploads)
+
+#decode and parse each uploaded file once (at the same time), the results are
+#cached on the server under a hash of the file and only the keys are sent to
+#the browser, for the preview and matching callbacks. The hxls/vars are cached
+#apart from the frame of the file, so matching doesn't load the whole file
+@app.callback(Output('upload-keys', 'data'),
               [Input('upload-data', 'contents')],
               [State('upload-data', 'filename'),
                State('upload-data', 'last_modified')])
-def update_output(list_of_contents, list_of_names, list_of_dates):
-    if list_of_contents is not None:
-        children = [
-            parse_contents(c, n, d) for c, n, d in
-            zip(list_of_contents, list_of_names, list_of_dates)]
+def store_uploads(list_of_contents, list_of_names, list_of_dates):
+    if list_of_contents is None:
+        return None
+    #limit the memory and cpu used by large uploads arriving at the same time
+    if not upload_slots.acquire(timeout=uploadWaitTimeout):
+        return [{'key' : None, 'name' : name, 'date' : date, 'busy' : True}
+                for name, date in zip(list_of_names, list_of_dates)]
+    def read_upload(contents, name):
+        #the file is read according to its format, so that is part of the key
+        key = hashlib.sha1((str(uploadFormat(name)) + ',' + contents).encode('utf-8')).hexdigest()
+        if not cache.cache.has(key):
+            try:
+                upload, df = parseUpload(contents, name, max_preview_bytes=maxPreviewBytes)
+            except Exception as e:
+                print('Couldn\'t load resource: ', name, e)
+                upload, df = None, None
+            if upload is None:
+                return {'key' : None, 'name' : name}
+            #the frame first, so it is there once the key is found
+            cache.set(key + '-frame', df)
+            cache.set(key, upload)
+        return {'key' : key, 'name' : name}
+    try:
+        with ThreadPoolExecutor(max_workers=uploadWorkers) as executor:
+            stored = list(executor.map(read_upload, list_of_contents, list_of_names))
+    finally:
+        upload_slots.release()
+    for upload, date in zip(stored, list_of_dates):
+        upload['date'] = date
+    return stored
+
+@app.callback(Output('output-data-upload', 'children'),
+              [Input('upload-keys', 'data')])
+def update_output(stored):
+    if stored is not None:
+        #the same file uploaded twice is only shown once, under all its names
+        names = {}
+        for u in stored:
+            if u['key'] is not None:
+                names.setdefault(u['key'], []).append(u['name'])
+        children = []
+        for u in stored:
+            if u['key'] is None:
+                children.append(parse_contents(None, u['name'], None, u['date'], busy=u.get('busy', False)))
+            elif u['key'] in names:
+                children.append(parse_contents(u['key'], ', '.join(dict.fromkeys(names.pop(u['key']))), cache.get(u['key']), u['date'],
+                                               page_size=previewPageSize))
         return children
 
+#send the rows of the page shown of a preview from the cached frame (the only
+#callback that reads it)
+@app.callback(Output({'type' : 'upload-table', 'index' : MATCH}, 'data'),
+              [Input({'type' : 'upload-table', 'index' : MATCH}, 'page_current'),
+               Input({'type' : 'upload-table', 'index' : MATCH}, 'page_size')],
+              [State({'type' : 'upload-table', 'index' : MATCH}, 'id')])
+def update_preview_page(page_current, page_size, table_id):
+    return previewPage(cache.get(table_id['index'] + '-frame'), page_current, page_size)
+
     
 @app.callback([
               Output('graph-iframe', 'src'),
               Output('neighbours', 'children'),
-              Output('meta_data', 'children')
-              ],[Input('upload-data', 'contents')],
-              [State('upload-data', 'filename'),
-               State('upload-data', 'last_modified')])
-def update_graph_output(list_of_contents, list_of_names, list_of_dates):
-    if list_of_contents is not None:
-        hxls_weights = pd.read_excel('hxl_dictionary_weighted.xlsx', usecols = ['HXL', 'Weight'])
-        hxls_weights = hxls_weights.set_index('HXL').T.to_dict('records')[0]
-        vars_weights = pd.read_excel('var_dictionary_weighted.xlsx', usecols = ['Var_name', 'Weight'])
-        vars_weights = vars_weights.set_index('Var_name').T.to_dict('records')[0]
-        content_type, content_string = list_of_contents[0].split(',')
-        decoded = base64.b64decode(content_string)
-        #import graph of existing nodes/edges
-        G = nx.read_gexf(".\\assets\\" + graphName + ".gexf")
-        #extract first two rows of new file to find vars and hxls
-        try:
-            if "csv" in list_of_names[0].lower():
-                vars_hxls = pd.read_csv(io.StringIO(decoded.decode('utf-8')),header=None,nrows=2)
-            elif "xls" in list_of_names[0].lower():
-                vars_hxls = pd.read_excel(io.BytesIO(decoded),header=None,nrows=2)
-            else:
-                print("Resource is not of appropriate filetype")
-                return
-        except:
-            print('Resource not found')         
-            return   
-        #assuming vars in 1st row and hxls in 2nd row, extract them from new data
-        h = vars_hxls.iloc[1,:].str.lower().str.replace(" ","")
-        h = [n for n in h if str(n).lower() != 'nan']
-        v = vars_hxls.iloc[0,:].str.lower().str.replace(" ","")
-        v = [n for n in v if str(n).lower() != 'nan']
-        G.add_node(9999, title = list_of_names[0], color=colors['text'],hxls=",".join(h),variables=",".join(v))
-        #loop through hxls and vars attached to each node and find any in common with new file
+              Output('meta_data', 'children'),
+              Output('graph-delta', 'data')
+              ],[Input('upload-keys', 'data'),
+                 Input('cluster-view', 'value')],
+              [State('graph-delta', 'data')])
+def update_graph_output(stored, cluster, current_delta):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    if 'cluster-view.value' in triggered:
+        #show another cluster, keeping the uploaded node (if there is one)
+        return cluster_page(cluster), dash.no_update, dash.no_update, current_delta
+    if stored is not None:
+        #the graph of existing nodes/edges (loaded at startup) isn't changed, the
+        #new nodes and their edges are added to an overlay graph
+        G_base = graph_index['graph']
+        overlay = nx.Graph()
+        #the vars and hxls of the new files were read when they were uploaded
+        uploads, names, keys, failed = [], [], [], []
+        for u in stored:
+            upload = cache.get(u['key']) if u['key'] else None
+            if upload is None:
+                failed.append(u['name'] + (' (still being processed, the server is busy, please upload it again)' if u.get('busy') else ''))
+                continue
+            h, v = upload['hxls'], upload['vars']
+            #replace vars with the similar vars of the network they match
+            if header_index is not None:
+                matched_vars = lookupHeaders(header_index, v)
+                v = list(dict.fromkeys(matched_vars[n] or n for n in v))
+            uploads.append((h, v))
+            names.append(u['name'])
+            keys.append(u['key'])
+        #each new file gets its own node, all of them are added before their edges
+        upload_ids = ['upload-' + str(ind_u + 1) for ind_u in range(len(uploads))]
+        for upload_id, name, (h, v) in zip(upload_ids, names, uploads):
+            overlay.add_node(upload_id, title = name, color=colors['text'],hxls=",".join(h),variables=",".join(v))
+        #look up the hxls and vars of all the new files in the index at once to find the nodes they have in common
+        #(files matched before are found in the cache)
         neighbours = []
-        #array of data about the new data set [total cons, hxl cons, var cons, av hxl cons, avg var cons, total edge weight]
-        meta_data = [0,0,0,0,0,0]         
-        for n in G.nodes():
-            if n != 9999:
-                hxls = G.nodes()[n]['hxls'].split(",") 
-                variables = G.nodes()[n]['variables'].split(",") 
-                intersect_hxls = set(h).intersection(set(hxls))
-                intersect_vars = set(v).intersection(set(variables))
-                if len(intersect_hxls) + len(intersect_vars) > 0:
-                    jud_weight = 0 
-                    for hxl in intersect_hxls: 
-                        #sum weights of each hxl if in dictionary, else +0.5 (default)
-                        try:jud_weight += hxls_weights[hxl]
-                        except:jud_weight += 0.5
-                    for var in intersect_vars: 
-                        #sum weights of each hxl if in dictionary, else +0.5 (default)
-                        try:jud_weight += vars_weights[var]
-                        except:jud_weight += 0.5
-                    meta_data[5] += jud_weight
-                    print(jud_weight)
-                    G.add_edge(n,9999, weight = jud_weight, title = ', '.join(map(str, intersect_hxls)) + ', '.join(map(str, intersect_vars)),color=colors['text'])
-                    # collect meta data
-                    meta_data[0] += 1
-                    if len(intersect_hxls) > 0:
-                        meta_data[1] += 1
-                        meta_data[2] += len(intersect_hxls)
-                    if len(intersect_vars) > 0:
-                        meta_data[3] += 1
-                        meta_data[4] += len(intersect_vars)
-                    #display the names of the datasets that the new data shares variables with
-                    #needed to use html.Br() to get new line to display
-                    neighbours.append(G.nodes()[n]['title'])                    
-                    neighbours.append(html.Br())
-        
-        # update meta data
-        if meta_data[1] > 0: 
-            meta_data[2] = meta_data[2]/meta_data[1]
-        if meta_data[3] > 0: 
-            meta_data[4] = meta_data[4]/meta_data[3]
-        
-        # append meta data to html element
         data_readout = []
-        data_readout.append('Total # of connected datasets: ')
-        data_readout.append(meta_data[0])
-        data_readout.append(html.Br())
-        data_readout.append('# of datasets with HXL tags in common: ')
-        data_readout.append(meta_data[1])
-        data_readout.append(html.Br())
-        data_readout.append('Average # of HXL tags in common: ')
-        data_readout.append(meta_data[2])
-        data_readout.append(html.Br())
-        data_readout.append('# of datasets with variables in common: ')
-        data_readout.append(meta_data[3])
-        data_readout.append(html.Br())
-        data_readout.append('Average # of variables in common: ')
-        data_readout.append(meta_data[4])
-        data_readout.append(html.Br())
-        data_readout.append('Total edge weight:')
-        data_readout.append(meta_data[5])
-        data_readout.append(html.Br())
-        dt = datetime.now().strftime("%Y%m%d%H%M%S")
-        draw_graph3(G,output_filename='.\\assets\\updatedgraph'+dt+'.html')
-        nx.write_gexf(G, '.\\assets\\updatedgraph'+dt+'.gexf') 
-        src=app.get_asset_url("updatedgraph"+dt+".html")
+        connected = set()
+        total_weight = 0
+        for upload_id, name, matches in zip(upload_ids, names, cachedMatchIndexBatch(graph_index, uploads, keys, cache, graph_version)):
+            #array of data about the new data set [total cons, hxl cons, var cons, av hxl cons, avg var cons, total edge weight]
+            meta_data = [0,0,0,0,0,0]
+            titles = []
+            for n, intersect_hxls, intersect_vars, jud_weight in matches:
+                meta_data[5] += jud_weight
+                if 'community' in G_base.nodes[n]:
+                    overlay.add_node(n, community = G_base.nodes[n]['community'])
+                overlay.add_edge(upload_id, n, weight = jud_weight, title = ', '.join(map(str, intersect_hxls)) + ', '.join(map(str, intersect_vars)),color=colors['text'])
+                # collect meta data
+                meta_data[0] += 1
+                if len(intersect_hxls) > 0:
+                    meta_data[1] += 1
+                    meta_data[2] += len(intersect_hxls)
+                if len(intersect_vars) > 0:
+                    meta_data[3] += 1
+                    meta_data[4] += len(intersect_vars)
+                #display the names of the datasets that the new data shares variables with
+                #needed to use html.Br() to get new line to display
+                titles.append(G_base.nodes()[n]['title'])
+                titles.append(html.Br())
+                connected.add(n)
+            total_weight += meta_data[5]
+            
+            # update meta data
+            if meta_data[1] > 0: 
+                meta_data[2] = meta_data[2]/meta_data[1]
+            if meta_data[3] > 0: 
+                meta_data[4] = meta_data[4]/meta_data[3]
+            
+            #list the datasets and meta data of each file under its name
+            neighbours.append(html.B(name))
+            neighbours.append(html.Br())
+            neighbours.extend(titles)
+            neighbours.append(html.Br())
+            data_readout.append(html.B(name))
+            data_readout.append(html.Br())
+            data_readout.append('Total # of connected datasets: ')
+            data_readout.append(meta_data[0])
+            data_readout.append(html.Br())
+            data_readout.append('# of datasets with HXL tags in common: ')
+            data_readout.append(meta_data[1])
+            data_readout.append(html.Br())
+            data_readout.append('Average # of HXL tags in common: ')
+            data_readout.append(meta_data[2])
+            data_readout.append(html.Br())
+            data_readout.append('# of datasets with variables in common: ')
+            data_readout.append(meta_data[3])
+            data_readout.append(html.Br())
+            data_readout.append('Average # of variables in common: ')
+            data_readout.append(meta_data[4])
+            data_readout.append(html.Br())
+            data_readout.append('Total edge weight:')
+            data_readout.append(meta_data[5])
+            data_readout.append(html.Br())
+        if len(names) > 1:
+            data_readout.append(html.B('All uploaded files'))
+            data_readout.append(html.Br())
+            data_readout.append('Total # of connected datasets: ')
+            data_readout.append(len(connected))
+            data_readout.append(html.Br())
+            data_readout.append('Total edge weight:')
+            data_readout.append(total_weight)
+            data_readout.append(html.Br())
+        if len(failed) > 0:
+            data_readout.append('Files that couldn\'t be read: ' + ', '.join(failed))
+            data_readout.append(html.Br())
+        #if the network has fixed node positions put the new nodes next to their neighbours
+        placeNewNodes(G_base, overlay)
+        if renderDeltas:
+            #send only the new nodes and their edges to the network already shown
+            src = dash.no_update
+            delta = overlayDelta(overlay)
+        else:
+            #redraw the whole graph with the new nodes, unless the same files
+            #were drawn before
+            name = "updatedgraph-" + hashlib.sha1((graph_version + repr(list(zip(keys, names)))).encode('utf-8')).hexdigest()[:20]
+            G = nx.compose(G_base, overlay)
+            artifact_url(name + ".gexf", lambda path: nx.write_gexf(G, path))
+            src = artifact_url(name + ".html", lambda path: draw_graph3(G,output_filename=path,physics=not all('x' in d for n, d in G.nodes(data=True))))
+            delta = None
         neighbours.insert(0,html.Br())
         neighbours.insert(0,"Your data shares variables/HXL tags with these datasets: ")
         neighbours = html.P(neighbours)
-        return src, neighbours, data_readout
+        return src, neighbours, data_readout, delta
     else:
-        src=app.get_asset_url(graphName + ".html")
-        return src, [], []
+        src=cluster_page(cluster)
+        return src, [], [], None
 
 
 if __name__ == '__main__':
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Description: compares the time taken to extract the variables and hxls (the
+            first two rows) of csv/xlsx/xls files using readHeaderRows (only
+            reads the rows needed) and the pandas path used previously
+            (pd.read_csv/pd.read_excel with nrows=2). Large test files are
+            generated, or the files in a specified folder (e.g. the HDX data
+            downloaded by create_graph) can be used instead.
+
+Requirements: myFunctions.py, pandas, openpyxl, xlrd (for xls files only)
+"""
+
+# =============================================================================
+# User inputs
+# =============================================================================
+
+dataPath = ''               # folder of csv/xls/xlsx files to benchmark, leave empty to generate test files
+benchPath = './benchmark'   # where to write the generated test files
+numRows = 100000            # number of rows in the generated files
+numCols = 20                # number of columns in the generated files
+repeats = 3                 # number of times each file is read, the best time is reported
+
+# =============================================================================
+# Import libs
+# =============================================================================
+
+import os
+import time
+
+import pandas as pd
+import openpyxl
+
+from myFunctions import readHeaderRows
+
+
+def best_time(function, repeats):
+    times = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# =============================================================================
+# Generate large test files
+# =============================================================================
+if dataPath == '':
+    os.makedirs(benchPath, exist_ok=True)
+    header = ['variable ' + str(c) for c in range(numCols)]
+    hxls = ['#tag' + str(c) for c in range(numCols)]
+
+    csv_file = os.path.join(benchPath, 'benchmark.csv')
+    if not os.path.isfile(csv_file):
+        print('Writing ' + csv_file)
+        with open(csv_file, 'w') as f:
+            f.write(','.join(header) + '\n' + ','.join(hxls) + '\n')
+            for r in range(numRows):
+                f.write(','.join(str(r * c) for c in range(numCols)) + '\n')
+
+    xlsx_file = os.path.join(benchPath, 'benchmark.xlsx')
+    if not os.path.isfile(xlsx_file):
+        print('Writing ' + xlsx_file)
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(header)
+        ws.append(hxls)
+        for r in range(numRows):
+            ws.append([r * c for c in range(numCols)])
+        wb.save(xlsx_file)
+    dataPath = benchPath
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+files = [f for f in sorted(os.listdir(dataPath)) if os.path.splitext(f)[1][1:].lower() in ['csv', 'xls', 'xlsx']]
+total_pandas = 0
+total_headers = 0
+print('{:<50} {:>10} {:>12} {:>12} {:>8}'.format('file', 'size (MB)', 'pandas (s)', 'headers (s)', 'speedup'))
+for f in files:
+    file_name = os.path.join(dataPath, f)
+    file_format = os.path.splitext(f)[1][1:].lower()
+    if file_format == 'csv':
+        pandas_read = lambda: pd.read_csv(file_name, header=None, nrows=2)
+    else:
+        pandas_read = lambda: pd.read_excel(file_name, header=None, nrows=2)
+    try:
+        t_pandas = best_time(pandas_read, repeats)
+        t_headers = best_time(lambda: readHeaderRows(file_name, file_format, nrows=2), repeats)
+    except Exception as e:
+        print('Couldn\'t load resource: ', f, e)
+        continue
+    total_pandas += t_pandas
+    total_headers += t_headers
+    print('{:<50} {:>10.1f} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(f[:50], os.path.getsize(file_name)/1e6, t_pandas, t_headers, t_pandas/max(t_headers, 1e-9)))
+
+print('{:<50} {:>10} {:>12.3f} {:>12.3f} {:>7.1f}x'.format('total', '', total_pandas, total_headers, total_pandas/max(total_headers, 1e-9)))
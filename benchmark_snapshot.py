@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Description: compares the load time and file size of a data environment
+            graph saved as GEXF and as a snapshot (writeGraphSnapshot). A
+            random graph is generated, or an existing GEXF file (e.g. one
+            created by create_graph) can be used instead.
+
+Requirements: myFunctions.py, networkx, numpy, scipy
+"""
+
+# =============================================================================
+# User inputs
+# =============================================================================
+
+gexfFile = ''               # existing gexf graph to benchmark, leave empty to generate a random graph
+benchPath = './benchmark'   # where to write the test files
+numNodes = 2000             # number of datasets in the generated graph
+numTokens = 5000            # number of distinct vars/hxls in the generated graph
+tokensPerNode = 10          # number of vars and of hxls in each generated dataset
+repeats = 3                 # number of times each file is loaded, the best time is reported
+
+# =============================================================================
+# Import libs
+# =============================================================================
+
+import os
+import random
+import time
+
+import networkx as nx
+
+from myFunctions import sparseEdgeAttributes, addEdges, writeGraphSnapshot, readGraphSnapshot, snapshotToGraph
+
+
+def best_time(function, repeats):
+    times = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+# =============================================================================
+# Generate a random graph
+# =============================================================================
+os.makedirs(benchPath, exist_ok=True)
+if gexfFile == '':
+    random.seed(0)
+    vars_tokens = ['var' + str(t) for t in range(numTokens)]
+    hxls_tokens = ['#tag' + str(t) for t in range(numTokens)]
+    dict_of_vars = {ind_x : random.sample(vars_tokens, tokensPerNode) for ind_x in range(numNodes)}
+    dict_of_hxls = {ind_x : random.sample(hxls_tokens, tokensPerNode) for ind_x in range(numNodes)}
+    G = nx.Graph()
+    for ind_x in range(numNodes):
+        G.add_node(ind_x, title = 'dataset ' + str(ind_x), hxls = ",".join(dict_of_hxls[ind_x]), variables = ",".join(dict_of_vars[ind_x]))
+    addEdges(G, sparseEdgeAttributes(dict_of_hxls, {}))
+    addEdges(G, sparseEdgeAttributes(dict_of_vars, {}))
+    gexfFile = os.path.join(benchPath, 'benchmark.gexf')
+    nx.write_gexf(G, gexfFile)
+else:
+    G = nx.read_gexf(gexfFile)
+snapshotPath = os.path.join(benchPath, 'benchmark.snapshot')
+writeGraphSnapshot(G, snapshotPath)
+print('Graph with ' + str(G.number_of_nodes()) + ' nodes and ' + str(G.number_of_edges()) + ' edges')
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+t_gexf = best_time(lambda: nx.read_gexf(gexfFile), repeats)
+t_snapshot = best_time(lambda: readGraphSnapshot(snapshotPath), repeats)
+t_graph = best_time(lambda: snapshotToGraph(readGraphSnapshot(snapshotPath)), repeats)
+size_gexf = os.path.getsize(gexfFile)
+size_snapshot = folder_size(snapshotPath)
+
+print('{:<30} {:>10} {:>12}'.format('', 'size (MB)', 'load (s)'))
+print('{:<30} {:>10.2f} {:>12.3f}'.format('gexf (nx.read_gexf)', size_gexf/1e6, t_gexf))
+print('{:<30} {:>10.2f} {:>12.3f}'.format('snapshot (arrays)', size_snapshot/1e6, t_snapshot))
+print('{:<30} {:>10} {:>12.3f}'.format('snapshot (networkx graph)', '', t_graph))
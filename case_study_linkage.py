@@ -5,16 +5,20 @@ Created on Sun Jul 26 15:01:43 2020
 Descrption: Case study record linkage attempt for 3 datasets relating to
             Afghanistan
 
-REquirements: recordlinkage, pandas
+REquirements: recordlinkage, pandas, linkagePipeline.py
 @author: cmcinerney
 """
 
 
+import os
+
 import pandas as pd
 import recordlinkage
 
 
-from recordlinkage.preprocessing import clean, phonetic
+from recordlinkage.preprocessing import phonetic
+
+from linkagePipeline import preprocessFrame, linkBlocks
 
 #Import datasets
 PATH_REACH_DATASET = "C:/Users/cmcinerney/Desktop/UNOCHA Fellowship/Afghanistan_microdata/Case study datasets/Harmonised/reach_afg_dataset_protection_assessment_of_conflict_affected_populations_may2018_harmonised.xlsx"
@@ -23,152 +27,135 @@ PATH_REACH17_DATASET = "C:/Users/cmcinerney/Desktop/UNOCHA Fellowship/Afghanista
 
 PATH_SDC_DATASET = "C:/Users/cmcinerney/Desktop/UNOCHA Fellowship/Afghanistan_microdata/Case study datasets/Harmonised/sdc-afg-msna-microdata-harmonised.xlsx"
 
+CACHE_PATH = "linkage_cache"    # cleaned datasets are cached in this folder
 
+#string variables to clean in each dataset
+CLEAN_COLUMNS = {'reach18' : ['province', 'district', 'origin_country', 'origin_province', 'hoh_sex', 'hoh_dis'],
+                 'reach17' : ['province', 'district', 'hoh_sex', 'hoh_dis', 'origin_country', 'origin_province'],
+                 'sdc' : ['province', 'district', 'hoh_sex']}
 
-df_reach18 = pd.read_excel(PATH_REACH_DATASET)
-df_reach17 = pd.read_excel(PATH_REACH17_DATASET)
-df_sdc = pd.read_excel(PATH_SDC_DATASET)
-
-# =============================================================================
-# Preprocessing the data to increase likelihood of finding linkages
-# =============================================================================
-#string variables to clean
-df_reach18.province = clean(df_reach18.province, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach18.district = clean(df_reach18.district, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach18.origin_country = clean(df_reach18.origin_country, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach18.origin_province = clean(df_reach18.origin_province, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach18.hoh_sex = clean(df_reach18.hoh_sex, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach18.hoh_dis = clean(df_reach18.hoh_dis, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-
-df_sdc.province = clean(df_sdc.province, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_sdc.district = clean(df_sdc.district, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_sdc.hoh_sex = clean(df_sdc.hoh_sex, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-
-df_reach17.province = clean(df_reach17.province, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach17.district = clean(df_reach17.district, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach17.hoh_sex = clean(df_reach17.hoh_sex, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach17.hoh_dis = clean(df_reach17.hoh_dis, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach17.origin_country = clean(df_reach17.origin_country, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-df_reach17.origin_province = clean(df_reach17.origin_province, lowercase=True, replace_by_none='[^ \\-\\_A-Za-z0-9]+', replace_by_whitespace='[\\-\\_]', strip_accents=None, remove_brackets=True, encoding='utf-8', decode_error='strict')
-
-
-#phonetic encoding for place names
-# df_reach18.province = phonetic(df_reach18.province, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
-# df_reach18.district = phonetic(df_reach18.district, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
-# df_reach17.province = phonetic(df_reach17.province, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
-# df_reach17.district = phonetic(df_reach17.district, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
-# df_sdc.province = phonetic(df_sdc.province, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
-# df_sdc.district = phonetic(df_sdc.district, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
-
-
+MATCHES_FILE = "matches.csv"    # matches are appended to this csv file as they are found
+MATCH_THRESHOLD = 15            # pairs with a sum of similarities above this are matches
+MATCH_CHUNK_SIZE = 50000        # number of candidate pairs compared at a time (limits the memory used)
+NUM_WORKERS = 1                 # number of processes linking blocks in parallel (e.g. os.cpu_count())
 
-# =============================================================================
-# Subset data so that it only contains Pakistani refugees (this is a type of blocking?)
-# =============================================================================
-
-df_reach18_ref = df_reach18[df_reach18.displacement_status == 'Refugee']
-df_reach17_ref = df_reach17[df_reach17['displacement/are_displaced_afghan'] == 'no'] 
-df_sdc_ref = df_sdc[df_sdc.refugees == 'yes']
-
-
-
-# =============================================================================
-# Indexing - make record pairs
-# =============================================================================
-
-#start with two reach datasets
-print(len(df_reach18_ref)* len(df_reach17_ref))
-# =516,060 possible pairs
-
-# df_reach18_ref['province'].value_counts()
-# df_reach17_ref['province'].value_counts()
+#Blocking - only comparing pairs of records that are identical on some attributes
+BLOCKING_VARS = ["province", "displacement_year"] #, 'displacement_month','arrival_month','hoh_sex','hoh_age','hh_size','hh_families'
 
-# df_reach18_ref['district'].value_counts()
-# df_reach17_ref['district'].value_counts()
+#similarity measurement algorithms: (recordlinkage.Compare method, column, column, arguments)
+COMPARISONS = [
+    #displacement info
+    ('string', 'district', 'district', {'method' : 'jarowinkler'}),
+    ('numeric', 'displacement_month', 'displacement_month', {}),
+    ('numeric', 'arrival_month', 'arrival_month', {}),
+    ('numeric', 'arrival_year', 'arrival_year', {}),
+    ('string', 'origin_province', 'origin_province', {'method' : 'jarowinkler'}),
+
+    #household head attributes
+    ('exact', 'hoh_sex', 'hoh_sex', {}),
+    ('numeric', 'hoh_age', 'hoh_age', {'offset' : 2}), #if age is =- 2 years then exact match
+    ('string', 'hoh_dis', 'hoh_dis', {'method' : 'jarowinkler'}),
+
+    #household attributes
+    ('exact', 'hh_families', 'hh_families', {}),
+    ('numeric', 'hh_size', 'hh_size', {}),
+    ('numeric', 'female_children', 'female_children', {}),
+    ('numeric', 'male_children', 'male_children', {}),
+    ('numeric', 'female_adults', 'female_adults', {}),
+    ('numeric', 'male_adults', 'male_adults', {}),
+    ('numeric', 'female_elders', 'female_elders', {}),
+    ('numeric', 'male_elders', 'male_elders', {}),
+]
 
 
-#Blocking - only comparing pairs of records that are identical on some attributes
-indexer = recordlinkage.Index()
-blocking_vars = ["province", "displacement_year"] #, 'displacement_month','arrival_month','hoh_sex','hoh_age','hh_size','hh_families'
-indexer = recordlinkage.BlockIndex(on=blocking_vars)
-candidate_links = indexer.index(df_reach18_ref, df_reach17_ref)
-print (len(candidate_links))
-# = 134,220
 
-# =============================================================================
-# Compare records
-# =============================================================================
+# everything below only runs in the main process (processes used for linking
+# blocks in parallel import this script again on Windows)
+if __name__ == '__main__':
 
-# initialise class
-comp = recordlinkage.Compare()
+    # =============================================================================
+    # Preprocessing the data to increase likelihood of finding linkages (the
+    # cleaned frames are cached in CACHE_PATH, so the excel files are only read
+    # and cleaned again when they or the columns to clean change)
+    # =============================================================================
+    df_reach18 = preprocessFrame(PATH_REACH_DATASET, CLEAN_COLUMNS['reach18'], CACHE_PATH)
+    df_reach17 = preprocessFrame(PATH_REACH17_DATASET, CLEAN_COLUMNS['reach17'], CACHE_PATH)
+    df_sdc = preprocessFrame(PATH_SDC_DATASET, CLEAN_COLUMNS['sdc'], CACHE_PATH)
 
-# initialise similarity measurement algorithms
-#displacement info
-comp.string('district', 'district', method='jarowinkler', label = 'district')
-comp.numeric('displacement_month', 'displacement_month', label = 'displacement_month')
-comp.numeric('arrival_month', 'arrival_month', label = 'arrival_month')
-comp.numeric('arrival_year', 'arrival_year', label = 'arrival_year')
-comp.string('origin_province', 'origin_province', method='jarowinkler', label = 'origin_province')
 
+    #phonetic encoding for place names
+    # df_reach18.province = phonetic(df_reach18.province, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
+    # df_reach18.district = phonetic(df_reach18.district, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
+    # df_reach17.province = phonetic(df_reach17.province, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
+    # df_reach17.district = phonetic(df_reach17.district, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
+    # df_sdc.province = phonetic(df_sdc.province, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
+    # df_sdc.district = phonetic(df_sdc.district, method = 'soundex', concat=True, encoding='utf-8', decode_error='strict')
 
 
-#household head attributes
-comp.exact('hoh_sex', 'hoh_sex', label = 'hoh_sex')
-comp.numeric('hoh_age', 'hoh_age', offset  = 2, label = 'hoh_age') #if age is =- 2 years then exact match
-comp.string('hoh_dis', 'hoh_dis', method='jarowinkler', label = 'hoh_dis')
 
-#household attributes
-comp.exact('hh_families', 'hh_families', label = 'hh_families')
-comp.numeric('hh_size', 'hh_size', label = 'hh_size')
-comp.numeric('female_children', 'female_children', label = 'female_children')
-comp.numeric('male_children', 'male_children', label = 'male_children')
-comp.numeric('female_adults', 'female_adults', label = 'female_adults')
-comp.numeric('male_adults', 'male_adults', label = 'male_adults')
-comp.numeric('female_elders', 'female_elders', label = 'female_elders')
-comp.numeric('male_elders', 'male_elders', label = 'male_elders')
+    # =============================================================================
+    # Subset data so that it only contains Pakistani refugees (this is a type of blocking?)
+    # =============================================================================
 
+    df_reach18_ref = df_reach18[df_reach18.displacement_status == 'Refugee']
+    df_reach17_ref = df_reach17[df_reach17['displacement/are_displaced_afghan'] == 'no'] 
+    df_sdc_ref = df_sdc[df_sdc.refugees == 'yes']
 
 
-# the method .compute() returns the DataFrame with the feature vectors.
-features = comp.compute(candidate_links, df_reach18_ref, df_reach17_ref)
 
+    # =============================================================================
+    # Indexing, comparing and classifying record pairs block by block
+    # =============================================================================
+    #start with two reach datasets
+    print(len(df_reach18_ref)* len(df_reach17_ref))
+    # =516,060 possible pairs
 
-# =============================================================================
-# Classification step
-# =============================================================================
+    # df_reach18_ref['province'].value_counts()
+    # df_reach17_ref['province'].value_counts()
 
-# Classification step
-matches = features[features.sum(axis=1) > 15]
-print(len(matches))
+    # df_reach18_ref['district'].value_counts()
+    # df_reach17_ref['district'].value_counts()
 
-#write out matches to a html file
-#render dataframe as html
-html = matches.to_html()
+    #the candidate pairs of each block are compared MATCH_CHUNK_SIZE at a time and
+    #the matches written to MATCHES_FILE as they are found, so memory stays
+    #bounded however many pairs there are
+    summary = linkBlocks(df_reach18_ref, df_reach17_ref, BLOCKING_VARS, COMPARISONS, MATCH_THRESHOLD, MATCHES_FILE,
+                         chunk_size=MATCH_CHUNK_SIZE, numWorkers=NUM_WORKERS)
+    print(summary['pairs'])
+    # = 134,220
+    print(summary['matches'])
 
-#write html to file
-text_file = open("index.html", "w")
-text_file.write(html)
-text_file.close()
+    #write out matches to a html file
+    #render dataframe as html
+    matches = pd.read_csv(MATCHES_FILE, index_col=['index_a', 'index_b']) if summary['matches'] > 0 else pd.DataFrame()
+    html = matches.to_html()
 
+    #write html to file
+    text_file = open("index.html", "w")
+    text_file.write(html)
+    text_file.close()
 
 
-df_reach18_ref_subset = df_reach18_ref[["province", "district", "displacement_year", 'displacement_month', "origin_province", 'arrival_month','hoh_sex','hoh_age', "hoh_dis", 'hh_size','hh_families','female_children','female_adults','female_elders','male_children','male_adults','male_elders']]
-df_reach17_ref_subset = df_reach17_ref[["province", "district", "displacement_year", 'displacement_month', "origin_province", 'arrival_month','hoh_sex','hoh_age', "hoh_dis", 'hh_size','hh_families','female_children','female_adults','female_elders','male_children','male_adults','male_elders']]
 
+    df_reach18_ref_subset = df_reach18_ref[["province", "district", "displacement_year", 'displacement_month', "origin_province", 'arrival_month','hoh_sex','hoh_age', "hoh_dis", 'hh_size','hh_families','female_children','female_adults','female_elders','male_children','male_adults','male_elders']]
+    df_reach17_ref_subset = df_reach17_ref[["province", "district", "displacement_year", 'displacement_month', "origin_province", 'arrival_month','hoh_sex','hoh_age', "hoh_dis", 'hh_size','hh_families','female_children','female_adults','female_elders','male_children','male_adults','male_elders']]
 
 
-recordlinkage.write_annotation_file(
-    "annotation_carol.json",
-    candidate_links[0:51],
-    df_reach18_ref_subset,
-    df_reach17_ref_subset,
-    dataset_a_name="df_reach18_ref",
-    dataset_b_name="df_reach17_ref"
-)
+    #the candidate pairs are no longer all kept in memory, so the pairs to
+    #annotate are the first matches
+    recordlinkage.write_annotation_file(
+        "annotation_carol.json",
+        matches.index[0:51],
+        df_reach18_ref_subset,
+        df_reach17_ref_subset,
+        dataset_a_name="df_reach18_ref",
+        dataset_b_name="df_reach17_ref"
+    )
 
 
-result = recordlinkage.read_annotation_file('annotation_carol_result.json')
-print(result.links)
+    if os.path.isfile('annotation_carol_result.json'):
+        result = recordlinkage.read_annotation_file('annotation_carol_result.json')
+        print(result.links)
 
-poss_link18 = df_reach18_ref.loc[10407,:]
-poss_link17 = df_reach17_ref.loc[6432,:]
+    # poss_link18 = df_reach18_ref.loc[10407,:]
+    # poss_link17 = df_reach17_ref.loc[6432,:]
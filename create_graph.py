@@ -13,7 +13,7 @@ Description: creates a graph and visualises it, saving a gexf and html file in
             hxl_dictionary_weighted.xlsx respectively. These can also be
             altered according to expert judgement. 
             
-Requirements: myFunctions.py
+Requirements: myFunctions.py, networkx, pandas, numpy, scipy
 
 Optional: var_dictionary_weighted.xlsx, hxl_dictionary_weighted.xlsx
 
@@ -34,7 +34,34 @@ countryOfInterest = 'Afghanistan'       # filter HDX results by country
 tagOfInterest = ''                      # filter HDX results by tag
 numOfDataSets = 400                     # process this many datasets, make large (1000) to process all
 downloadFromHDX = False                 # search the HDX and download data, otherwise just load the data already in dataPath
+headersOnlyFromHDX = False              # with downloadFromHDX, only fetch the first 2 rows of each resource (csv files with HTTP Range requests), nothing is saved to dataPath
+downloadThreads = 8                     # number of resources downloaded from HDX at once
+downloadsPerHost = 4                    # maximum number of downloads from the same host at once
+downloadRetries = 3                     # number of times to retry a failed download (partial downloads are resumed)
+maxTokenDF = None                       # ignore hxls/vars found in more than this many datasets (or this fraction of datasets if < 1) when finding edges, e.g. 0.3, None to use all
+backboneTopK = None                     # keep only each dataset's k strongest edges (by weight), None to turn off
+backboneMinProp = None                  # remove edges with a smaller proportion of hxls/vars in common (prop), None to turn off
+backboneAlpha = None                    # keep only edges significant at this level under the disparity filter, e.g. 0.05, None to turn off
+weightScheme = 'expert'                 # weights of shared hxls/vars: 'expert' (excel docs, others get 0.5), 'idf' (automatic, rarer hxls/vars weigh more) or 'combined' (excel docs, others automatic)
+saveTokenStats = True                   # save the number of datasets each hxl/var is found in and the pairs found together (graphName_tokens.csv, graphName_cooccurrence.csv)
+fuzzyMatchVars = False                  # treat similar vars (e.g. "Admin1 Name", "admin1_name", "ADM1_EN") as the same var, saving the matches to graphName_header_map.csv
+fuzzyThreshold = 0.7                    # how similar (0-1) vars must be to match when fuzzyMatchVars is used
 include_weights = True                  #include weights specified in excel doc, otherwise edges have equal weights of 1
+headerCachePath = graphPath + 'header_cache.sqlite'   # cache of the vars/hxls extracted from each file (only new/changed files are read), '' to turn off
+numWorkers = 1                          # number of processes reading files in parallel (e.g. os.cpu_count()), 1 reads them one at a time
+chunkSize = 16                          # number of files sent to a worker process at a time
+edgeEngine = 'sparse'                   #'sparse' (vectorised sparse matrix products, needs scipy), 'index' (inverted index) or 'minhash' (approximate, for very large collections) to find the edges
+minhashThreshold = 0.3                  # with edgeEngine = 'minhash', only link datasets with at least this Jaccard similarity (hxls/vars in common / hxls/vars in either)
+minhashPerm = 128                       # with edgeEngine = 'minhash', length of the MinHash signatures (longer is more accurate but slower)
+minhashBands = None                     # with edgeEngine = 'minhash', number of LSH bands and rows per band (more bands find more edges but compare more pairs),
+minhashRows = None                      # None to choose them from minhashThreshold. Check the trade-off with evaluate_minhash.py
+computePositions = True                 # calculate the node positions here (saved with the graph) rather than in the browser when the html is opened
+layoutIterations = 50                   # number of iterations used to calculate the node positions
+clusterView = True                      # group datasets into clusters and save an overview network of the clusters (graphName_clusters.html) for large networks
+minClusterSize = 2                      # datasets in smaller clusters (e.g. linked to no others) are put together in one unclustered group
+writeGexf = True                        # save the graph as gexf (e.g. to open in Gephi)
+writeSnapshot = True                    # save the graph as a compact snapshot folder, loaded much faster by app.py
+save_intersections = True               #save the hxls/vars shared by each pair of datasets to a json file next to the graphs
 
 # =============================================================================
 # Import libs and configure
@@ -50,185 +77,254 @@ import sys
 from hdx.utilities.easy_logging import setup_logging
 from hdx.hdx_configuration import Configuration
 from hdx.data.dataset import Dataset
-from collections import Counter
 
-from myFunctions import filterListbyCountry, filterListbyTag, draw_graph3
+from headerMatch import normaliseHeader, matchHeaders
+from tokenStats import tokenStatistics, idfWeights, combineWeights, tokenTable, cooccurrenceTable
+from myFunctions import filterListbyCountry, filterListbyTag, draw_graph3, readWeights, downloadFiles, fetchAllHeaderRows, openHeaderCache, lookupHeaderCache, storeHeaderCache, extractHeaderRows, sharedTokenPairs, edgeAttributes, sparseEdgeAttributes, minhashEdgeAttributes, addEdges, filterCommonTokens, pruneEdges, savePairStore, writeGraphSnapshot, computeLayout, detectCommunities, communityGraph
 setup_logging()
 
-# =============================================================================
-# Download from HDX
-# =============================================================================
-if downloadFromHDX:
-    # We only need to read data
-    try:
-        Configuration.create(hdx_site='prod', user_agent='A_Quick_Example', hdx_read_only=True)
-    except:
-        print("Configuration exists already")
+# everything below only runs in the main process (worker processes used for
+# reading files in parallel import this script again on Windows)
+if __name__ == '__main__':
 
     # =============================================================================
-    # Filter Results from HDX
+    # Download from HDX
     # =============================================================================
+    if downloadFromHDX:
+        # We only need to read data
+        try:
+            Configuration.create(hdx_site='prod', user_agent='A_Quick_Example', hdx_read_only=True)
+        except:
+            print("Configuration exists already")
 
-    queryResult = Dataset.search_in_hdx(countryOfInterest)
+        # =============================================================================
+        # Filter Results from HDX
+        # =============================================================================
 
-    filteredResults = filterListbyCountry(queryResult, [countryOfInterest])
-    #filteredResults = filterListbyTag(filteredResults, ['hxl'])
+        queryResult = Dataset.search_in_hdx(countryOfInterest)
 
+        filteredResults = filterListbyCountry(queryResult, [countryOfInterest])
+        #filteredResults = filterListbyTag(filteredResults, ['hxl'])
 
-    # =============================================================================
-    # Download all (filtered) dataset resources to local machine
-    # =============================================================================
-    resources = Dataset.get_all_resources(filteredResults)
-
-
-    #loop through all resources and identify all csv or xlsx then download the file from the url
-    resources_csv = []
-    num_of_datasets = 0    
-    for x in resources:        
-        if x['format'].lower() in fileTypes:
-            # if the file isn't already there, try to download it
-            if not os.path.isfile(dataPath + x['name'] + '.' + x['format']):
-                try:
-                    print('Downloading ',dataPath + x['name'] + '.' + x['format'])
-                    url, path = x.download(folder=dataPath)
-                except:
-                    print('Download failed: ', sys.exc_info()[0])
+
+        # =============================================================================
+        # Download all (filtered) dataset resources to local machine
+        # =============================================================================
+        resources = Dataset.get_all_resources(filteredResults)
+
+
+        #loop through all resources and identify all csv or xlsx then download the files 
+        #that aren't already there from their urls, several at a time
+        resources_csv = []
+        num_of_datasets = 0    
+        resources_valid = [x for x in resources if x['format'].lower() in fileTypes]
+        if headersOnlyFromHDX:
+            #don't download anything, the headers are fetched from the urls below
+            resources_csv = [{"name" : x['name'], "format" : x['format'], "url" : x['url']} for x in resources_valid]
+            num_of_datasets = len(resources_csv)
+            resources_valid = []
+        #resources with the same name would be saved to the same file, keep the first
+        targets = {}
+        for x in resources_valid:
+            targets.setdefault(os.path.join(dataPath, x['name'] + '.' + x['format']), x)
+        if len(targets) < len(resources_valid):
+            print('Skipping ' + str(len(resources_valid) - len(targets)) + ' resources with the same name as another')
+        resources_valid = list(targets.values())
+        downloads = [(x['url'], file_name) for file_name, x in targets.items()]
+        downloads = [(url, file_name) for url, file_name in downloads if not os.path.isfile(file_name)]
+        print('Downloading ' + str(len(downloads)) + ' resources')
+        for result in downloadFiles(downloads, numThreads=downloadThreads, perHostLimit=downloadsPerHost, retries=downloadRetries):
+            if result['error'] is not None:
+                print('Download failed: ', result['file'], result['error'])
         
+        for x in resources_valid:
             # if file already existed or has downloaded successfully
-            if os.path.isfile(dataPath + x['name'] + '.' + x['format']):                           
+            if os.path.isfile(os.path.join(dataPath, x['name'] + '.' + x['format'])):                           
                 num_of_datasets += 1
                 resources_csv.append({"name" : x['name'], "format" : x['format']})
 
-# =============================================================================
-# Load data from local folder
-# =============================================================================
-else:
-    files = [f for f in os.listdir(dataPath) if os.path.isfile(os.path.join(dataPath, f))]
-    resources_csv = [{"name" : os.path.splitext(f)[0], "format" : os.path.splitext(os.path.join(dataPath, f))[1][1:]} for f in files]
-    num_of_datasets = len(resources_csv)
+    # =============================================================================
+    # Load data from local folder
+    # =============================================================================
+    else:
+        files = [f for f in os.listdir(dataPath) if os.path.isfile(os.path.join(dataPath, f))]
+        resources_csv = [{"name" : os.path.splitext(f)[0], "format" : os.path.splitext(os.path.join(dataPath, f))[1][1:]} for f in files]
+        num_of_datasets = len(resources_csv)
 
-print("Found " + str(len(resources_csv)) + " resources, using " + str(min(len(resources_csv),numOfDataSets)))
+    print("Found " + str(len(resources_csv)) + " resources, using " + str(min(len(resources_csv),numOfDataSets)))
 
-# =============================================================================
-# loop through all datasets (resources) and build graph 
-# =============================================================================
-#create empty lists, empty graphs, empty sets in the matrices   
-dict_of_hxls = {}
-set_of_all_hxls = []
-matrix_intersect_hxls = [[{} for x in range(num_of_datasets)] for y in range(num_of_datasets)]
-matrix_intersect_hxls_num = [[0 for x in range(num_of_datasets)] for y in range(num_of_datasets)]
-dict_of_vars = {}
-set_of_all_vars = []
-matrix_intersect_vars = [[{} for x in range(num_of_datasets)] for y in range(num_of_datasets)]
-matrix_intersect_vars_num = [[0 for x in range(num_of_datasets)] for y in range(num_of_datasets)]
-G=nx.Graph()
-
-#import file containing weights for particular vars/hxls
-hxls_weights = pd.read_excel('hxl_dictionary_weighted.xlsx', usecols = ['HXL', 'Weight'])
-hxls_weights = hxls_weights.set_index('HXL').T.to_dict('records')[0]
-vars_weights = pd.read_excel('var_dictionary_weighted.xlsx', usecols = ['Var_name', 'Weight'])
-vars_weights = vars_weights.set_index('Var_name').T.to_dict('records')[0]
-
-#loop through all resources, adding nodes for datasets and
-#edges if they share variables or hxls
-for ind_x, x in enumerate(resources_csv[0:min(numOfDataSets,len(resources_csv))]):
-        #import first 2 rows from each csv
+    # =============================================================================
+    # loop through all datasets (resources) and build graph 
+    # =============================================================================
+    #create empty lists and empty graph
+    dict_of_hxls = {}
+    dict_of_vars = {}
+    G=nx.Graph()
+
+    #import file containing weights for particular vars/hxls
+    hxls_weights, vars_weights = readWeights('hxl_dictionary_weighted.xlsx', 'var_dictionary_weighted.xlsx')
+
+    #open cache of the vars/hxls already extracted from each file
+    header_cache = openHeaderCache(headerCachePath) if headerCachePath != '' else None
+
+    #extract the first 2 rows (vars/hxls) of every file that isn't in the cache,
+    #in parallel if numWorkers > 1, then merge the results in resource order
+    resources_to_add = resources_csv[0:min(numOfDataSets,len(resources_csv))]
+    header_rows = {}
+    tasks = []
+    digests = {}
+    remote = []
+    for ind_x, x in enumerate(resources_to_add):
         file_name = dataPath + '/' + x['name'] + '.' + x['format']
-        print("Adding resource to graph: " + x['name'])
-        print(file_name)
+        if x['format'].lower() not in ['csv', 'xlsx', 'xls']:
+            continue
+        if 'url' in x:
+            remote.append(ind_x)
+            continue
         try:
-            if x['format'].lower() == 'csv':
-                vars_hxls = pd.read_csv(file_name,header=None,nrows=2)
-            elif x['format'].lower() == 'xlsx' or x['format'].lower() == 'xls':
-                vars_hxls = pd.read_excel(file_name,header=None,nrows=2)
-            else:
+            cached, digests[ind_x] = lookupHeaderCache(header_cache, file_name) if header_cache is not None else (None, None)
+        except:
+            cached, digests[ind_x] = None, None
+        if cached is not None:
+            header_rows[ind_x] = (cached, None)
+            #found by its contents under another path or time, store it under this one
+            if digests[ind_x] is not None:
+                storeHeaderCache(header_cache, file_name, cached, 2, digests[ind_x])
+        else:
+            tasks.append((ind_x, file_name, x['format']))
+    print("Reading " + str(len(tasks)) + " new or changed resources, " + str(len(header_rows)) + " found in cache")
+    results = extractHeaderRows([(file_name, file_format, 2) for ind_x, file_name, file_format in tasks], numWorkers, chunkSize)
+    for (ind_x, file_name, file_format), (rows, error) in zip(tasks, results):
+        header_rows[ind_x] = (rows, error)
+        if header_cache is not None and error is None:
+            storeHeaderCache(header_cache, file_name, rows, 2, digests[ind_x])
+    #resources on HDX (headersOnlyFromHDX), only their first rows are fetched
+    if len(remote) > 0:
+        results = fetchAllHeaderRows([(resources_to_add[ind_x]['url'], resources_to_add[ind_x]['format']) for ind_x in remote], 2,
+                                     numThreads=downloadThreads, perHostLimit=downloadsPerHost, retries=downloadRetries)
+        header_rows.update(zip(remote, results))
+
+    #loop through all resources, adding nodes for datasets
+    for ind_x, x in enumerate(resources_to_add):
+            file_name = x['url'] if 'url' in x else dataPath + '/' + x['name'] + '.' + x['format']
+            print("Adding resource to graph: " + x['name'])
+            print(file_name)
+            if ind_x not in header_rows:
                 print("Can\'t load " + x['format'] + " files")
                 continue
-        except:
-            print('Couldn\'t load resource: ', sys.exc_info()[0])
-            continue
-        # check if it got any actual data
-        if vars_hxls.size == 0:
-            print('Resource is empty')
-            continue
-        #extract the first row of each file and append to list of variables
-        #remove spaces and nans
-        v = [str(n).replace(" ","") for n in vars_hxls.iloc[0,:] if str(n).lower() != 'nan']
-        #v = [x.replace(" ","") for x in v]     
-        dict_of_vars.update({ind_x : v})
-        #extract the second row of each file and append to list of hxls
-        #remove spaces and nans
-        h = [str(n).replace(" ","") for n in vars_hxls.iloc[1,:] if str(n).lower() != 'nan']
-        #check for # in string before adding
-        h = [n for n in h if '#' in str(n).lower()]
-        dict_of_hxls.update({ind_x : h})
-        #create list of all resource names (datasets) for graph
-        G.add_node(ind_x, title = x['name'], hxls = ",".join(h), variables = ",".join(v))
-        
-        # =============================================================================
-        # loop through array of hxls and add edges to graph           
-        # =============================================================================
-        for index, (ind_j, j) in enumerate(dict_of_hxls.items()):
-            # don't check a node against itself
-            if ind_j == ind_x:
+            vars_hxls, error = header_rows[ind_x]
+            if error is not None:
+                print('Couldn\'t load resource: ', error)
                 continue
-            for ind_e, e in enumerate(j):
-                set_of_all_hxls.append(j[ind_e])
-            #intersection of set of hxls of current node with previous                        
-            intersect_hxls = set(j).intersection(set(dict_of_hxls[ind_x]))
-            matrix_intersect_hxls[ind_x][ind_j] = intersect_hxls
-            matrix_intersect_hxls_num[ind_x][ind_j] = len(intersect_hxls)
-            if len(intersect_hxls) > 0:
-                #check if edges should be weighted, if not all edges have weight 1
-                if include_weights == True:
-                    count = len(intersect_hxls)
-                    #proportion of hxls in common (denominator: total hxls in smaller dataset)
-                    prop = round(len(intersect_hxls)/min(len(set(j)), len(set(dict_of_hxls[ind_x]))), 2)
-                    #use "expert judgement" weights 
-                    jud_weight = 0 
-                    for hxl in intersect_hxls: 
-                        #sum weights of each hxl if in dictionary, else +0.5 (default)
-                        try:jud_weight += hxls_weights[hxl]
-                        except:jud_weight += 0.5
-                else:
-                    jud_weight = 1
-                G.add_edge(ind_x, ind_j, weight = jud_weight, title = '<br> '.join(map(str, matrix_intersect_hxls[ind_x][ind_j])), prop = prop, count = count)
-
-        # =============================================================================
-        # loop through array of vars and fill in empty matrix with intersecting sets            
-        # =============================================================================
-        for index, (ind_j, j) in enumerate(dict_of_vars.items()):
-            # don't check a node against itself
-            if ind_j == ind_x:
+            # check if it got any actual data
+            if len(vars_hxls) == 0:
+                print('Resource is empty')
                 continue
-            for ind_e, e in enumerate(j):
-                set_of_all_vars.append(j[ind_e])
-            #intersection of set of vars of current node with previous                        
-            intersect_vars = set(j).intersection(set(dict_of_vars[ind_x]))
-            matrix_intersect_vars[ind_x][ind_j] = intersect_vars
-            matrix_intersect_vars_num[ind_x][ind_j] = len(intersect_vars)
-            if len(intersect_vars) > 0:
-                count = len(intersect_vars)
-                prop = round(len(intersect_vars)/min(len(set(j)), len(set(dict_of_vars[ind_x]))), 2)
-                #use "expert judgement" weights 
-                jud_weight = 0 
-                for var in intersect_vars:
-                    #sum weights of each var if in dictionary, else +0.5 (default)
-                    try:jud_weight += vars_weights[var]
-                    except:jud_weight += 0.5
-                #if edge already exists add var names and sum with existing weight
-                if G.has_edge(ind_x, ind_j):
-                    G.edges[ind_x,ind_j]['weight'] = G.edges[ind_x,ind_j]['weight'] + jud_weight
-                    G.edges[ind_x,ind_j]['title'] = G.edges[ind_x,ind_j]['title'] + '<br> '+'<br> '.join(map(str, matrix_intersect_vars[ind_x][ind_j]))
-                else:
-                    G.add_edge(ind_x, ind_j, weight = jud_weight, title = '<br> '.join(map(str, matrix_intersect_vars[ind_x][ind_j])), prop = prop, count = count)
-        
-#count number of times hxls/vars occur in all datasets
-set_of_all_hxls = Counter(set_of_all_hxls)
-set_of_all_vars = Counter(set_of_all_vars)
+            #extract the first row of each file and append to list of variables
+            #remove spaces and nans
+            v = [str(n).replace(" ","") for n in vars_hxls[0] if n is not None and str(n).lower() != 'nan']
+            #v = [x.replace(" ","") for x in v]     
+            dict_of_vars.update({ind_x : v})
+            #extract the second row of each file (if there is one) and append to list of hxls
+            #remove spaces and nans
+            h = [str(n).replace(" ","") for n in (vars_hxls[1] if len(vars_hxls) > 1 else []) if n is not None and str(n).lower() != 'nan']
+            #check for # in string before adding
+            h = [n for n in h if '#' in str(n).lower()]
+            dict_of_hxls.update({ind_x : h})
+            #create list of all resource names (datasets) for graph
+            G.add_node(ind_x, title = x['name'], hxls = ",".join(h), variables = ",".join(v))
+
+    if header_cache is not None:
+        header_cache.commit()
+        header_cache.close()
+
+    #replace similar vars with one canonical var (the most common one)
+    if fuzzyMatchVars:
+        header_map = matchHeaders([var for v in dict_of_vars.values() for var in v], threshold = fuzzyThreshold)
+        dict_of_vars = {ind_x : list(dict.fromkeys(header_map[var] for var in v)) for ind_x, v in dict_of_vars.items()}
+        for ind_x, v in dict_of_vars.items():
+            G.nodes[ind_x]['variables'] = ",".join(v)
+        print("Matched " + str(len(header_map)) + " distinct vars to " + str(len(set(header_map.values()))) + " vars")
+        pd.DataFrame([(var, normaliseHeader(var), canonical) for var, canonical in sorted(header_map.items(), key = lambda item: (item[1], item[0]))],
+                     columns = ['variable', 'normalised', 'canonical']).to_csv(graphPath + graphName + "_header_map.csv", index = False)
+
+    # =============================================================================
+    # count the number of datasets each hxl/var is found in (and the pairs found
+    # together), used for automatic idf weights and saved as tables
+    # =============================================================================
+    hxls_stats = tokenStatistics(dict_of_hxls.values(), cooccurrence = saveTokenStats)
+    vars_stats = tokenStatistics(dict_of_vars.values(), cooccurrence = saveTokenStats)
+    hxls_weights = combineWeights(hxls_weights, idfWeights(hxls_stats), weightScheme)
+    vars_weights = combineWeights(vars_weights, idfWeights(vars_stats), weightScheme)
+    if saveTokenStats:
+        pd.concat([tokenTable(hxls_stats, hxls_weights).assign(type = 'hxl'),
+                   tokenTable(vars_stats, vars_weights).assign(type = 'var')]).to_csv(graphPath + graphName + "_tokens.csv", index = False)
+        pd.concat([cooccurrenceTable(hxls_stats).assign(type = 'hxl'),
+                   cooccurrenceTable(vars_stats).assign(type = 'var')]).to_csv(graphPath + graphName + "_cooccurrence.csv", index = False)
+
+    # =============================================================================
+    # find pairs of datasets sharing hxls/vars and calculate their edges, either
+    # with an inverted index (token -> datasets containing it), so only pairs with
+    # something in common are visited, or with sparse matrix products over the
+    # dataset x token incidence matrix (much faster for large graphs), or
+    # approximately with MinHash/LSH, linking only similar pairs of datasets.
+    # The intersections are kept in sparse pair stores: dictionaries of
+    # (dataset id, dataset id) -> set of shared hxls/vars, query them with
+    # pairIntersection(matrix_intersect_hxls, ind_a, ind_b)
+    # =============================================================================
+    #hxls/vars found in too many datasets can be left out when finding edges
+    edge_hxls, edge_vars = dict_of_hxls, dict_of_vars
+    if maxTokenDF is not None:
+        edge_hxls, removed_hxls = filterCommonTokens(dict_of_hxls, maxTokenDF)
+        edge_vars, removed_vars = filterCommonTokens(dict_of_vars, maxTokenDF)
+        print("Ignoring " + str(len(removed_hxls)) + " hxls and " + str(len(removed_vars)) + " vars found in too many datasets: "
+              + ", ".join(sorted(removed_hxls, key=removed_hxls.get, reverse=True) + sorted(removed_vars, key=removed_vars.get, reverse=True)))
+    if edgeEngine == 'sparse':
+        #note: "expert judgement" weights are always used for vars
+        hxls_edges = sparseEdgeAttributes(edge_hxls, hxls_weights, include_weights)
+        vars_edges = sparseEdgeAttributes(edge_vars, vars_weights)
+        matrix_intersect_hxls = {pair : set(attrs['tokens']) for pair, attrs in hxls_edges.items()}
+        matrix_intersect_vars = {pair : set(attrs['tokens']) for pair, attrs in vars_edges.items()}
+    elif edgeEngine == 'minhash':
+        hxls_edges = minhashEdgeAttributes(edge_hxls, hxls_weights, include_weights, threshold = minhashThreshold,
+                                           num_perm = minhashPerm, bands = minhashBands, rows = minhashRows)
+        vars_edges = minhashEdgeAttributes(edge_vars, vars_weights, threshold = minhashThreshold,
+                                           num_perm = minhashPerm, bands = minhashBands, rows = minhashRows)
+        matrix_intersect_hxls = {pair : set(attrs['tokens']) for pair, attrs in hxls_edges.items()}
+        matrix_intersect_vars = {pair : set(attrs['tokens']) for pair, attrs in vars_edges.items()}
+    else:
+        matrix_intersect_hxls = sharedTokenPairs(edge_hxls)
+        matrix_intersect_vars = sharedTokenPairs(edge_vars)
+        hxls_edges = edgeAttributes(matrix_intersect_hxls, edge_hxls, hxls_weights, include_weights)
+        vars_edges = edgeAttributes(matrix_intersect_vars, edge_vars, vars_weights)
+    if save_intersections:
+        savePairStore({'hxls' : matrix_intersect_hxls, 'vars' : matrix_intersect_vars}, graphPath + graphName + "_intersections.json")
+
+    #add edges for hxls first, then add vars to those edges (or create new edges)
+    addEdges(G, hxls_edges)
+    addEdges(G, vars_edges)
+
+    #keep only the backbone of strong edges
+    if backboneTopK is not None or backboneMinProp is not None or backboneAlpha is not None:
+        num_of_edges = G.number_of_edges()
+        removed = pruneEdges(G, top_k=backboneTopK, min_prop=backboneMinProp, alpha=backboneAlpha)
+        print("Removed " + str(removed) + " of " + str(num_of_edges) + " edges, " + str(G.number_of_edges()) + " left")
+
+    #calculate the node positions so the browser doesn't need to run the physics
+    if computePositions:
+        computeLayout(G, iterations=layoutIterations)
+
+    #group the datasets into clusters for the overview of large networks
+    if clusterView:
+        detectCommunities(G, min_size=minClusterSize)
 
-#write graph file 
-nx.write_gexf(G, graphPath + graphName + ".gexf")        
+    #write graph file (gexf for Gephi, snapshot for fast loading in app.py)
+    if writeGexf:
+        nx.write_gexf(G, graphPath + graphName + ".gexf")        
+    if writeSnapshot:
+        writeGraphSnapshot(G, graphPath + graphName + ".snapshot")
         
-#visualise the graph
-draw_graph3(G,graphPath + graphName + ".html")
\ No newline at end of file
+    #visualise the graph
+    draw_graph3(G,graphPath + graphName + ".html", physics = not computePositions)
+    if clusterView:
+        draw_graph3(communityGraph(G),graphPath + graphName + "_clusters.html", physics = not computePositions)
\ No newline at end of file
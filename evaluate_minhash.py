@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Description: evaluates the approximate 'minhash' edge engine of create_graph
+            against the exact edges ('sparse' engine) on a sample of
+            datasets: the time taken, the number of edges and the precision
+            and recall of the approximate edges for several thresholds and
+            numbers of bands. The vars/hxls are read from the files in a
+            folder (e.g. the HDX data downloaded by create_graph), or random
+            datasets are generated.
+
+Requirements: myFunctions.py, minHash.py, numpy, scipy
+"""
+
+# =============================================================================
+# User inputs
+# =============================================================================
+
+dataPath = ''                   # folder of csv/xls/xlsx files to sample, leave empty to generate random datasets
+sampleSize = 2000               # number of datasets to compare
+numTokens = 5000                # number of distinct vars in the generated datasets
+thresholds = [0.1, 0.3, 0.5]    # Jaccard similarity thresholds to evaluate
+numPerm = 128                   # length of the MinHash signatures
+bandSettings = [None, 32, 64]   # numbers of bands to evaluate (rows = numPerm // bands), None to choose them from the threshold
+
+# =============================================================================
+# Import libs
+# =============================================================================
+
+import os
+import random
+import time
+
+from myFunctions import readHeaderRows, sparseEdgeAttributes, minhashEdgeAttributes, compareEdges
+
+# =============================================================================
+# Sample datasets
+# =============================================================================
+random.seed(0)
+if dataPath == '':
+    #datasets made of runs of related vars plus a few random ones
+    tokens = ['var' + str(t) for t in range(numTokens)]
+    dict_of_vars = {}
+    for ind_x in range(sampleSize):
+        start = random.randrange(numTokens)
+        dict_of_vars[ind_x] = [tokens[(start + t) % numTokens] for t in range(random.randint(3, 20))] + random.sample(tokens, 3)
+else:
+    files = [f for f in sorted(os.listdir(dataPath)) if os.path.splitext(f)[1][1:].lower() in ['csv', 'xls', 'xlsx']]
+    dict_of_vars = {}
+    for f in random.sample(files, min(sampleSize, len(files))):
+        try:
+            rows = readHeaderRows(os.path.join(dataPath, f), os.path.splitext(f)[1][1:].lower(), nrows=1)
+        except Exception as e:
+            print('Couldn\'t load resource: ', f, e)
+            continue
+        if len(rows) > 0:
+            dict_of_vars[f] = [str(n).replace(" ","") for n in rows[0] if n is not None and str(n).lower() != 'nan']
+print('Comparing ' + str(len(dict_of_vars)) + ' datasets')
+
+# =============================================================================
+# Evaluate
+# =============================================================================
+start = time.perf_counter()
+exact_edges = sparseEdgeAttributes(dict_of_vars, {})
+t_exact = time.perf_counter() - start
+print('{:<10} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12}'.format('threshold', 'bands', 'time (s)', 'edges', 'above', 'precision', 'recall', 'recall above'))
+print('{:<10} {:>6} {:>10.3f} {:>10} {:>10} {:>10} {:>10} {:>12}'.format('exact', '', t_exact, len(exact_edges), '', '', '', ''))
+for threshold in thresholds:
+    for bands in bandSettings:
+        rows = numPerm // bands if bands is not None else None
+        start = time.perf_counter()
+        approx_edges = minhashEdgeAttributes(dict_of_vars, {}, threshold=threshold, num_perm=numPerm, bands=bands, rows=rows)
+        t_approx = time.perf_counter() - start
+        scores = compareEdges(exact_edges, approx_edges, dict_of_vars, threshold)
+        print('{:<10} {:>6} {:>10.3f} {:>10} {:>10} {:>10.3f} {:>10.3f} {:>12.3f}'.format(
+            threshold, str(bands) if bands is not None else 'auto', t_approx, scores['approx_edges'],
+            scores['exact_above_threshold'], scores['precision'], scores['recall'], scores['recall_above_threshold']))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Description: gunicorn settings for running the Data Environment Mapping tool
+            in production:
+
+                gunicorn -c gunicorn.conf.py wsgi:server
+
+            Settings can be changed with environment variables (e.g.
+            DEM_WORKERS=4) or gunicorn's command line options. More than one
+            worker needs a shared cache in app.py (cacheType 'filesystem' or
+            'redis'), so the uploads and previews cached by one worker are
+            found by the others (e.g. DEM_CACHE_TYPE=filesystem). With the
+            'simple' cache only one worker is started.
+"""
+
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get('DEM_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('DEM_WORKERS', multiprocessing.cpu_count()))
+#each worker handles several requests at once with threads, uploads are
+#limited to maxConcurrentUploads (app.py) at a time per worker
+worker_class = 'gthread'
+threads = int(os.environ.get('DEM_THREADS', 4))
+#load the graph and index once in the master process, workers share it
+preload_app = True
+#large uploads and redrawing the network can take a while
+timeout = int(os.environ.get('DEM_TIMEOUT', 120))
+#restart workers now and then so memory they un-share isn't kept forever
+max_requests = int(os.environ.get('DEM_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+accesslog = '-'
+
+
+def on_starting(server):
+    """
+    Runs one worker if the cache of app.py isn't shared by the workers: the
+    'simple' cache is kept in the memory of each worker, so an upload cached
+    by one worker wouldn't be found by the worker asked for its matches or
+    preview. With preload_app the app is already loaded here.
+    """
+    if 'app' not in sys.modules:
+        #without preload_app, load it to read its settings
+        import wsgi
+    app = sys.modules['app']
+    if app.cacheType not in ['filesystem', 'redis'] and server.num_workers > 1:
+        server.log.warning("cacheType '%s' of app.py isn't shared by worker processes, running 1 worker instead of %d",
+                           app.cacheType, server.num_workers)
+        server.num_workers = 1
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Description: fuzzy matching of column headers (variables), so that e.g.
+            "Admin1 Name", "admin1_name" and "ADM1_EN" are recognised as the
+            same variable. Headers are first normalised (accents, case,
+            camelCase and separators, common abbreviations), then similar
+            normalised headers are found with MinHash/LSH over their
+            character n-grams, so only candidate pairs are scored rather than
+            every pair of headers. Matching headers are grouped and mapped to
+            one canonical header.
+
+Requirements: minHash.py, numpy, scipy
+"""
+
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from minHash import sortedUnique, flatMinhashSignatures, lshParameters, lshCandidatePairs
+
+#words replaced when normalising headers (after splitting into words)
+ABBREVIATIONS = {'adm' : 'admin', 'en' : 'name', 'nm' : 'name', 'nom' : 'name',
+                 'yr' : 'year', 'mth' : 'month', 'dt' : 'date', 'no' : 'number',
+                 'num' : 'number', 'nb' : 'number', 'pop' : 'population',
+                 'lat' : 'latitude', 'lon' : 'longitude', 'lng' : 'longitude',
+                 'long' : 'longitude', 'prov' : 'province', 'dist' : 'district',
+                 'org' : 'organisation', 'organization' : 'organisation',
+                 'desc' : 'description', 'qty' : 'quantity', 'pct' : 'percent',
+                 'perc' : 'percent', 'hh' : 'household', 'hhs' : 'households'}
+
+
+_CAMEL_CASE = re.compile(r'([a-z])([A-Z])')
+_ACRONYM = re.compile(r'([A-Z]+)([A-Z][a-z])')
+_WORDS = re.compile(r'[a-z]+|[0-9]+')
+_NUMBERS = re.compile(r'[0-9]+')
+
+#normalised headers only contain spaces, letters and digits, numbered 0-36
+#so each character n-gram is an integer in base 37
+_SYMBOLS = np.zeros(256, dtype=np.int64)
+_SYMBOLS[ord('a'):ord('z')+1] = np.arange(1, 27)
+_SYMBOLS[ord('0'):ord('9')+1] = np.arange(27, 37)
+
+
+def normaliseHeader(header, abbreviations=ABBREVIATIONS):
+    '''
+    Normalises a column header: removes accents, splits camelCase, letters
+    from numbers and words on any separator, lowercases and expands
+    abbreviations, e.g. "ADM1_EN", "Admin1Name" and "admin 1 name" all
+    become "admin 1 name".
+
+    Input:
+        - header
+        - dictionary of word -> replacement
+
+    Output:
+        - normalised header (words separated by single spaces)
+    '''
+    text = str(header)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _ACRONYM.sub(r'\1 \2', _CAMEL_CASE.sub(r'\1 \2', text))
+    return ' '.join(abbreviations.get(w, w) for w in _WORDS.findall(text.lower()))
+
+
+def headerShingles(keys, ngram=3):
+    '''
+    Splits normalised headers into character n-grams (with a space added at
+    either end, so short headers and word boundaries count), all at once with
+    numpy. Each n-gram is numbered, so n-grams are the same number in every
+    process and session.
+
+    Input:
+        - list of normalised headers
+        - length of the n-grams (at most 12)
+
+    Output:
+        - numpy array of the unique n-grams of each header, header after
+          header, and numpy array of the number of n-grams of each header
+    '''
+    padded = [' ' + k + ' ' * max(1, ngram - 1 - len(k)) for k in keys]
+    if len(padded) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    symbols = _SYMBOLS[np.frombuffer(''.join(padded).encode('ascii', 'replace'), dtype=np.uint8)]
+    lengths = np.array([len(k) for k in padded], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    positions = np.arange(len(symbols) - ngram + 1)
+    owner = np.repeat(np.arange(len(keys)), lengths)[positions]
+    positions = positions[positions + ngram <= ends[owner]]
+    codes = np.zeros(len(positions), dtype=np.int64)
+    for k in range(ngram):
+        codes = codes * 37 + symbols[positions + k]
+    #one row per unique (header, n-gram)
+    owner_codes = sortedUnique(np.repeat(np.arange(len(keys)), lengths)[positions] * (37 ** ngram) + codes)
+    owner = owner_codes // (37 ** ngram)
+    return (owner_codes % (37 ** ngram)).astype(np.uint64), np.bincount(owner, minlength=len(keys))
+
+
+def _jaccard(codes_a, lengths_a, codes_b, lengths_b, pairs):
+    #exact n-gram Jaccard similarity of pairs of headers (row i of a, row j
+    #of b), as sparse header x n-gram matrices
+    codes = np.concatenate([codes_a, codes_b])
+    columns = sortedUnique(codes)
+    inverse = np.searchsorted(columns, codes)
+    a = sparse.csr_matrix((np.ones(len(codes_a)), inverse[:len(codes_a)], np.concatenate([[0], np.cumsum(lengths_a)])),
+                          shape=(len(lengths_a), len(columns)))
+    b = sparse.csr_matrix((np.ones(len(codes_b)), inverse[len(codes_a):], np.concatenate([[0], np.cumsum(lengths_b)])),
+                          shape=(len(lengths_b), len(columns)))
+    shared = np.asarray(a[pairs[:, 0]].multiply(b[pairs[:, 1]]).sum(axis=1)).ravel()
+    return shared / (lengths_a[pairs[:, 0]] + lengths_b[pairs[:, 1]] - shared)
+
+
+def _numbers(keys, numbers=None):
+    #headers with different numbers (e.g. admin 1 and admin 2) never match,
+    #so each header's numbers are numbered to compare them. The ids of the
+    #numbers (numbers -> id) are only comparable between calls sharing the
+    #same dictionary, new numbers are added to it
+    if numbers is None:
+        numbers = {}
+    return np.array([numbers.setdefault(' '.join(_NUMBERS.findall(k)), len(numbers)) for k in keys], dtype=np.int64)
+
+
+def matchHeaders(headers, threshold=0.7, ngram=3, num_perm=64, bands=None, rows=None, seed=0):
+    '''
+    Groups headers with the same or similar normalised forms and maps each to
+    a canonical header: the most frequent header of its group (the shortest
+    if tied).
+
+    Input:
+        - list of headers, repeated as often as they are found (e.g. the
+          variables of all datasets), the counts choose the canonical headers
+        - minimum n-gram Jaccard similarity of normalised headers to match
+        - length of the n-grams
+        - number of hash functions in the MinHash signatures
+        - number of LSH bands and rows per band, chosen from the threshold if
+          None (more bands find more matches but score more candidates)
+        - random seed of the hash functions
+
+    Output:
+        - dictionary of header -> canonical header
+    '''
+    counts = Counter(headers)
+    normalised = {h : normaliseHeader(h) for h in counts}
+    keys = sorted(set(k for k in normalised.values() if k != ''))
+    position = {k : i for i, k in enumerate(keys)}
+    codes, lengths = headerShingles(keys, ngram)
+    signatures = flatMinhashSignatures(codes, lengths, num_perm, seed)
+    if bands is None or rows is None:
+        bands, rows = lshParameters(threshold, num_perm)
+    pairs = lshCandidatePairs(signatures, bands, rows)
+    numbers = _numbers(keys)
+    pairs = pairs[numbers[pairs[:, 0]] == numbers[pairs[:, 1]]]
+    matched = pairs[_jaccard(codes, lengths, codes, lengths, pairs) >= threshold]
+
+    #group the matching normalised headers (connected components)
+    links = sparse.coo_matrix((np.ones(len(matched)), (matched[:, 0], matched[:, 1])), shape=(len(keys), len(keys)))
+    num_groups, group = connected_components(links, directed=False)
+
+    canonical = {}
+    for h in sorted(counts, key=lambda h: (-counts[h], len(str(h)), str(h))):
+        if normalised[h] in position:
+            canonical.setdefault(group[position[normalised[h]]], h)
+    return {h : canonical[group[position[normalised[h]]]] if normalised[h] in position else h for h in counts}
+
+
+def headerIndex(headers, threshold=0.7, ngram=3, num_perm=64, bands=None, rows=None, seed=0):
+    '''
+    Indexes a set of known headers (e.g. the variables of the graph loaded by
+    app.py) so new headers can be matched to them with lookupHeaders.
+
+    Input:
+        - list of known headers
+        - as for matchHeaders
+
+    Output:
+        - dictionary with the headers, their normalised forms, n-grams,
+          sorted LSH bands and parameters
+    '''
+    if bands is None or rows is None:
+        #only a few headers are looked up at a time and every candidate is
+        #checked exactly, so missed matches cost more than extra candidates
+        bands, rows = lshParameters(threshold, num_perm, 0.1, 0.9)
+    by_key = {}
+    for h in sorted(set(headers), key=str):
+        k = normaliseHeader(h)
+        if k != '':
+            by_key.setdefault(k, h)
+    keys = sorted(by_key)
+    codes, lengths = headerShingles(keys, ngram)
+    signatures = flatMinhashSignatures(codes, lengths, num_perm, seed)
+    #each band's values sorted, so new headers are looked up by binary search
+    band_keys = []
+    band_order = []
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band*rows:(band+1)*rows])
+        keys_of_band = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        order = np.argsort(keys_of_band, kind='stable')
+        band_keys.append(keys_of_band[order])
+        band_order.append(order)
+    number_ids = {}
+    return {'headers' : set(headers), 'keys' : keys, 'by_key' : by_key, 'codes' : codes, 'lengths' : lengths,
+            'numbers' : _numbers(keys, number_ids), 'number_ids' : number_ids, 'band_keys' : band_keys, 'band_order' : band_order,
+            'threshold' : threshold, 'ngram' : ngram, 'num_perm' : num_perm, 'bands' : bands, 'rows' : rows, 'seed' : seed}
+
+
+def lookupHeaders(index, headers):
+    '''
+    Matches new headers to the known headers of an index: the header itself
+    if known, else the known header with the same normalised form, else the
+    most similar known header above the threshold.
+
+    Input:
+        - index returned by headerIndex
+        - list of new headers
+
+    Output:
+        - dictionary of new header -> known header (or None if no match)
+    '''
+    matches = {}
+    unknown = []
+    for h in set(headers):
+        k = normaliseHeader(h)
+        if h in index['headers']:
+            matches[h] = h
+        elif k in index['by_key']:
+            matches[h] = index['by_key'][k]
+        else:
+            matches[h] = None
+            if k != '':
+                unknown.append((h, k))
+    if len(unknown) == 0 or len(index['keys']) == 0:
+        return matches
+    keys = [k for h, k in unknown]
+    codes, lengths = headerShingles(keys, index['ngram'])
+    signatures = flatMinhashSignatures(codes, lengths, index['num_perm'], index['seed'])
+    rows = index['rows']
+    pairs = []
+    for band in range(index['bands']):
+        block = np.ascontiguousarray(signatures[:, band*rows:(band+1)*rows])
+        keys_of_band = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        left = np.searchsorted(index['band_keys'][band], keys_of_band, side='left')
+        right = np.searchsorted(index['band_keys'][band], keys_of_band, side='right')
+        for q in range(len(keys)):
+            pairs.extend((q, i) for i in index['band_order'][band][left[q]:right[q]])
+    pairs = np.unique(np.array(pairs, dtype=np.int64).reshape(-1, 2), axis=0)
+    #numbered with a copy of the index's ids, so numbers not in the index get new ids
+    numbers = _numbers(keys, dict(index['number_ids']))
+    pairs = pairs[numbers[pairs[:, 0]] == index['numbers'][pairs[:, 1]]] if len(pairs) > 0 else pairs
+    if len(pairs) == 0:
+        return matches
+    similarity = _jaccard(codes, lengths, index['codes'], index['lengths'], pairs)
+    best = {}
+    for (q, i), s in zip(pairs, similarity):
+        if s >= index['threshold'] and s > best.get(q, (0, None))[0]:
+            best[q] = (s, i)
+    for q, (s, i) in best.items():
+        matches[unknown[q][0]] = index['by_key'][index['keys'][i]]
+    return matches
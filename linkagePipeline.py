@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+Description: streaming record linkage between two dataframes that scales
+            past memory. Candidate pairs are generated block by block (pairs
+            of records with the same values of the blocking variables), their
+            comparison vectors are computed in chunks of a fixed number of
+            pairs, and the matches are appended to a csv file as soon as they
+            are found. Only one chunk per process is held in memory, however
+            many pairs there are, and blocks can be linked in parallel by
+            several processes. The dataframes are cleaned beforehand in one
+            pass over all their string columns and cached as Parquet files,
+            so they are only read and cleaned again when the source file or
+            the cleaning changes. The blocking variables and comparisons of a
+            pair of datasets can also be chosen automatically from the
+            variables they share (see linkDatasetPair, used by
+            linkage_orchestrator.py).
+
+Requirements: recordlinkage, pandas, numpy, pyarrow (for the Parquet cache),
+              headerMatch.py
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+import recordlinkage
+
+from headerMatch import normaliseHeader
+
+
+#arguments of recordlinkage.preprocessing.clean used for the string columns
+CLEAN_ARGS = {'lowercase' : True, 'replace_by_none' : '[^ \\-\\_A-Za-z0-9]+', 'replace_by_whitespace' : '[\\-\\_]',
+              'strip_accents' : None, 'remove_brackets' : True, 'encoding' : 'utf-8', 'decode_error' : 'strict'}
+
+
+def cleanColumns(df, columns, clean_args=CLEAN_ARGS):
+    '''
+    Cleans string columns of a dataframe with recordlinkage's clean, stacking
+    them into a single series so the regular expressions are applied once
+    rather than once per column. Columns that don't only hold text are
+    cleaned on their own, as clean would treat them column by column (it
+    raises for numeric columns rather than returning them empty).
+
+    Input:
+        - dataframe
+        - list of columns to clean (columns not in the dataframe are skipped),
+          None to clean all text columns
+        - dictionary of arguments of recordlinkage.preprocessing.clean
+
+    Output:
+        - copy of the dataframe with the columns cleaned
+    '''
+    from recordlinkage.preprocessing import clean
+
+    if columns is None:
+        columns = [c for c in df.columns if df[c].dtype == object]
+    columns = [c for c in columns if c in df.columns]
+    df = df.copy()
+    if len(columns) == 0:
+        return df
+    text = [c for c in columns if pd.api.types.infer_dtype(df[c], skipna=True) in ['string', 'empty']]
+    for c in columns:
+        if c not in text:
+            df[c] = clean(df[c], **clean_args)
+    if len(text) == 0:
+        return df
+    stacked = clean(pd.concat([df[c].astype(object) for c in text], ignore_index=True), **clean_args)
+    for ind_c, c in enumerate(text):
+        df[c] = stacked.iloc[ind_c*len(df):(ind_c+1)*len(df)].values
+    return df
+
+
+def _fileDigest(file_name, block_size=1 << 20):
+    #sha1 of a file's contents, read in blocks
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def preprocessFrame(path, columns, cache_dir, clean_args=CLEAN_ARGS, read=pd.read_excel):
+    '''
+    Reads a dataset and cleans its string columns (see cleanColumns), caching
+    the result as a Parquet file named after a hash of the source file's
+    contents, the columns, the cleaning arguments and the read function. The cached frame is
+    returned while none of them change, without reading the source file.
+    Frames Parquet can't store (e.g. columns of mixed numbers and text) are
+    cached as pickle files instead.
+
+    Input:
+        - path of the source file
+        - list of string columns to clean, None to clean all text columns
+        - folder of the cached frames (created if needed)
+        - dictionary of arguments of recordlinkage.preprocessing.clean
+        - function reading the source file into a dataframe
+
+    Output:
+        - cleaned dataframe
+    '''
+    spec = json.dumps({'columns' : list(columns) if columns is not None else None, 'clean_args' : clean_args,
+                       'read' : getattr(read, '__module__', '') + '.' + getattr(read, '__qualname__', repr(read))}, sort_keys=True)
+    key = hashlib.sha1((_fileDigest(path) + spec).encode('utf-8')).hexdigest()[:16]
+    cached = os.path.join(cache_dir, os.path.splitext(os.path.basename(path))[0] + '_' + key)
+    if os.path.isfile(cached + '.parquet'):
+        return pd.read_parquet(cached + '.parquet')
+    if os.path.isfile(cached + '.pkl'):
+        return pd.read_pickle(cached + '.pkl')
+    df = cleanColumns(read(path), columns, clean_args)
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        df.to_parquet(cached + '.parquet')
+    except (ValueError, TypeError, ImportError):
+        if os.path.isfile(cached + '.parquet'):
+            os.remove(cached + '.parquet')
+        df.to_pickle(cached + '.pkl')
+    return df
+
+
+def buildCompare(comparisons):
+    '''
+    Builds a recordlinkage Compare object from a list of comparisons, so the
+    comparisons can be sent to other processes (and written in config).
+
+    Input:
+        - list of (method, column in first dataframe, column in second
+          dataframe, dictionary of arguments), where method is a method of
+          recordlinkage.Compare ('exact', 'string', 'numeric', 'geo' or
+          'date') and the arguments are passed to it, e.g.
+          ('string', 'district', 'district', {'method' : 'jarowinkler'}).
+          The label defaults to the first column
+
+    Output:
+        - recordlinkage.Compare object
+    '''
+    comp = recordlinkage.Compare()
+    for method, left_on, right_on, kwargs in comparisons:
+        kwargs = dict(kwargs or {})
+        kwargs.setdefault('label', left_on)
+        getattr(comp, method)(left_on, right_on, **kwargs)
+    return comp
+
+
+def blockPositions(df_a, df_b, blocking_vars):
+    '''
+    Finds the blocks of records of two dataframes with the same values of the
+    blocking variables (records with missing values are left out, as with
+    recordlinkage.BlockIndex).
+
+    Input:
+        - two dataframes
+        - list of blocking variables (in both dataframes)
+
+    Output:
+        - list of (block values, positions of records in the first dataframe,
+          positions in the second), largest blocks first
+    '''
+    if len(blocking_vars) == 0:
+        return [((), np.arange(len(df_a)), np.arange(len(df_b)))]
+    groups_a = df_a.groupby(list(blocking_vars), sort=False).indices
+    groups_b = df_b.groupby(list(blocking_vars), sort=False).indices
+    blocks = [(key, groups_a[key], groups_b[key]) for key in groups_a if key in groups_b]
+    return sorted(blocks, key=lambda block: -len(block[1]) * len(block[2]))
+
+
+#dataframes and comparisons of the linkage, set once in each process
+_link = {}
+
+
+def _initLinkWorker(df_a, df_b, comparisons, threshold, chunk_size):
+    _link.update({'df_a' : df_a, 'df_b' : df_b, 'compare' : buildCompare(comparisons),
+                  'threshold' : threshold, 'chunk_size' : chunk_size})
+
+
+def _linkBlock(block):
+    #compares every pair of records of a block, chunk_size pairs at a time,
+    #and returns the matches (pairs with a summed similarity above threshold)
+    key, pos_a, pos_b = block
+    df_a, df_b, chunk_size = _link['df_a'], _link['df_b'], _link['chunk_size']
+    num_pairs = len(pos_a) * len(pos_b)
+    matches = []
+    for start in range(0, num_pairs, chunk_size):
+        flat = np.arange(start, min(start + chunk_size, num_pairs))
+        pairs = pd.MultiIndex.from_arrays([df_a.index[pos_a[flat // len(pos_b)]], df_b.index[pos_b[flat % len(pos_b)]]],
+                                          names=['index_a', 'index_b'])
+        features = _link['compare'].compute(pairs, df_a, df_b)
+        score = features.sum(axis=1)
+        features = features[score > _link['threshold']]
+        if len(features) > 0:
+            matches.append(features.assign(score=score[score > _link['threshold']]))
+    return num_pairs, pd.concat(matches) if len(matches) > 0 else None
+
+
+def linkBlocks(df_a, df_b, blocking_vars, comparisons, threshold, out_file, chunk_size=50000, numWorkers=1):
+    '''
+    Links two dataframes block by block (see the description above) and
+    writes the matches to a csv file as they are found.
+
+    Input:
+        - two dataframes
+        - list of blocking variables (in both dataframes)
+        - list of comparisons (see buildCompare)
+        - pairs with a sum of the comparison similarities above the threshold
+          are matches
+        - csv file to write the matches to (replaced if it exists): the
+          indexes of both records, the similarity of each comparison and the
+          score (summed similarities)
+        - number of pairs compared at a time in each process
+        - number of processes linking blocks in parallel (e.g. os.cpu_count()),
+          1 links them one at a time in this process
+
+    Output:
+        - dictionary of the number of blocks, pairs compared and matches
+    '''
+    columns = list(dict.fromkeys(list(blocking_vars) + [c[1] for c in comparisons]))
+    df_a = df_a[columns]
+    df_b = df_b[[c for c in dict.fromkeys(list(blocking_vars) + [c[2] for c in comparisons])]]
+    blocks = blockPositions(df_a, df_b, blocking_vars)
+    if os.path.isfile(out_file):
+        os.remove(out_file)
+    summary = {'blocks' : len(blocks), 'pairs' : 0, 'matches' : 0}
+
+    def write(result):
+        num_pairs, matches = result
+        summary['pairs'] += num_pairs
+        if matches is not None:
+            matches.to_csv(out_file, mode='a', header=summary['matches'] == 0)
+            summary['matches'] += len(matches)
+
+    if numWorkers == 1:
+        _initLinkWorker(df_a, df_b, comparisons, threshold, chunk_size)
+        for block in blocks:
+            write(_linkBlock(block))
+        return summary
+    #the dataframes are sent to each process once, and only a few blocks are
+    #queued at a time so the results don't build up in memory
+    with ProcessPoolExecutor(max_workers=numWorkers, initializer=_initLinkWorker,
+                             initargs=(df_a, df_b, comparisons, threshold, chunk_size)) as executor:
+        pending = set()
+        for block in blocks:
+            if len(pending) >= 2 * numWorkers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(executor.submit(_linkBlock, block))
+        for future in wait(pending).done:
+            write(future.result())
+    return summary
+
+
+def readDataset(path):
+    '''
+    Reads a csv, xls or xlsx dataset (as found by create_graph) into a
+    dataframe, leaving out the row of hxl tags if there is one so the types
+    of the columns are inferred from the data.
+    '''
+    read = pd.read_csv if os.path.splitext(path)[1].lower() == '.csv' else pd.read_excel
+    df = read(path)
+    if len(df) > 0:
+        first = [str(v) for v in df.iloc[0] if not pd.isnull(v)]
+        if len(first) > 0 and all(v.startswith('#') for v in first):
+            df = read(path, skiprows=[1])
+    return df
+
+
+def matchColumns(df, variables):
+    '''
+    Finds the columns of a dataframe for variables as extracted by
+    create_graph (spaces removed, or replaced by a similar variable with
+    fuzzyMatchVars).
+
+    Input:
+        - dataframe
+        - list of variables
+
+    Output:
+        - dictionary of variable -> column, for the variables found
+    '''
+    by_name = {}
+    by_normalised = {}
+    for c in df.columns:
+        by_name.setdefault(str(c).replace(" ",""), c)
+        by_normalised.setdefault(normaliseHeader(c), c)
+    columns = {}
+    for var in variables:
+        if var in by_name:
+            columns[var] = by_name[var]
+        elif normaliseHeader(var) != '' and normaliseHeader(var) in by_normalised:
+            columns[var] = by_normalised[normaliseHeader(var)]
+    return columns
+
+
+def _blockedPairs(df_a, df_b, blocking_vars):
+    #number of candidate pairs when blocking on the variables
+    if len(blocking_vars) == 0:
+        return len(df_a) * len(df_b)
+    sizes = pd.concat([df_a.groupby(blocking_vars).size().rename('a'), df_b.groupby(blocking_vars).size().rename('b')],
+                      axis=1, join='inner')
+    return int((sizes['a'] * sizes['b']).sum())
+
+
+def chooseLinkage(df_a, df_b, max_pairs=5000000, max_block_keys=3, max_categories=100, min_filled=0.5):
+    '''
+    Chooses blocking variables and comparisons for two dataframes from the
+    columns they share (with the same names). Variables with few categories
+    and few missing values are used for blocking, one at a time (the one
+    leaving the fewest candidate pairs first) until there are at most
+    max_pairs pairs. The other variables are compared: exactly if they have
+    few categories, as numbers if both columns are numeric, otherwise as
+    strings (Jaro-Winkler).
+
+    Input:
+        - two dataframes
+        - maximum number of candidate pairs wanted
+        - maximum number of blocking variables
+        - maximum number of categories of blocking variables and of variables
+          compared exactly
+        - minimum proportion of values that aren't missing in both dataframes
+          for blocking variables
+
+    Output:
+        - list of blocking variables, list of comparisons (see buildCompare),
+          number of candidate pairs
+    '''
+    from pandas.api.types import is_numeric_dtype
+
+    shared = [c for c in df_a.columns if c in df_b.columns]
+    categories = {c : max(df_a[c].nunique(), df_b[c].nunique()) for c in shared}
+    blockable = [c for c in shared if 1 < categories[c] <= max_categories
+                 and df_a[c].notna().mean() >= min_filled and df_b[c].notna().mean() >= min_filled]
+    blocking_vars = []
+    num_pairs = _blockedPairs(df_a, df_b, [])
+    while num_pairs > max_pairs and len(blocking_vars) < max_block_keys:
+        options = [(_blockedPairs(df_a, df_b, blocking_vars + [c]), c) for c in blockable if c not in blocking_vars]
+        if len(options) == 0 or min(options)[0] >= num_pairs:
+            break
+        num_pairs, c = min(options)
+        blocking_vars.append(c)
+    comparisons = []
+    for c in shared:
+        if c in blocking_vars:
+            continue
+        if categories[c] <= max_categories:
+            comparisons.append(('exact', c, c, {}))
+        elif is_numeric_dtype(df_a[c]) and is_numeric_dtype(df_b[c]):
+            comparisons.append(('numeric', c, c, {}))
+        else:
+            comparisons.append(('string', c, c, {'method' : 'jarowinkler'}))
+    return blocking_vars, comparisons, num_pairs
+
+
+def linkageRisk(matches_file, size_a, size_b, chunk_size=1000000):
+    '''
+    Calculates the linkage risk of two datasets from their matches: the
+    largest proportion of records of either dataset with at least one match.
+
+    Input:
+        - csv file of matches written by linkBlocks
+        - number of records in each dataset
+
+    Output:
+        - linkage risk (0-1)
+    '''
+    if not os.path.isfile(matches_file) or size_a == 0 or size_b == 0:
+        return 0.0
+    matched_a, matched_b = set(), set()
+    for chunk in pd.read_csv(matches_file, usecols=['index_a', 'index_b'], chunksize=chunk_size):
+        matched_a.update(chunk['index_a'])
+        matched_b.update(chunk['index_b'])
+    return max(len(matched_a) / size_a, len(matched_b) / size_b)
+
+
+def linkDatasetPair(task):
+    '''
+    Links two datasets sharing variables (e.g. the datasets of an edge of a
+    graph created by create_graph), choosing the blocking variables and
+    comparisons from the shared variables (see chooseLinkage). The datasets
+    are read with preprocessFrame, so frames already cleaned and cached are
+    reused.
+
+    Input:
+        - dictionary with the paths of the datasets ('path_a', 'path_b'), the
+          shared variables ('variables'), the cache folder ('cache_dir'), the
+          csv file of matches ('out_file'), the proportion of the comparisons
+          a pair must match to be a match ('match_fraction'), the number of
+          pairs compared at a time ('chunk_size') and the settings of
+          chooseLinkage ('max_pairs', 'max_block_keys', 'max_categories')
+
+    Output:
+        - dictionary with the blocking variables, number of comparisons,
+          candidate pairs and matches, the linkage risk and an error message
+          (None if it worked)
+    '''
+    result = {'blocking' : [], 'comparisons' : 0, 'pairs' : 0, 'matches' : 0, 'risk' : None, 'error' : None}
+    try:
+        frames = []
+        for path in [task['path_a'], task['path_b']]:
+            df = preprocessFrame(path, None, task['cache_dir'], read=readDataset)
+            columns = matchColumns(df, task['variables'])
+            frames.append(df[list(columns.values())].rename(columns={c : var for var, c in columns.items()}))
+        df_a, df_b = frames
+        blocking_vars, comparisons, num_pairs = chooseLinkage(df_a, df_b, task['max_pairs'], task['max_block_keys'], task['max_categories'])
+        result.update({'blocking' : blocking_vars, 'comparisons' : len(comparisons), 'pairs' : num_pairs})
+        if len(comparisons) == 0:
+            result['error'] = 'no variables to compare'
+        elif num_pairs > task['max_pairs']:
+            result['error'] = 'too many candidate pairs'
+        else:
+            summary = linkBlocks(df_a, df_b, blocking_vars, comparisons, task['match_fraction'] * len(comparisons) - 1e-9,
+                                 task['out_file'], chunk_size=task['chunk_size'])
+            result['matches'] = summary['matches']
+            result['risk'] = linkageRisk(task['out_file'], len(df_a), len(df_b))
+    except Exception as e:
+        result['error'] = str(e)
+    return result
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Description: runs record linkage for every pair of connected datasets of a
+            graph created by create_graph and writes a linkage risk score
+            back onto its edges. For each edge the blocking variables and
+            comparisons are chosen from the variables the two datasets share,
+            the pairs of datasets are linked in parallel, and every dataset
+            is read and cleaned only once (the cleaned frames are cached).
+            The risk of an edge is the largest proportion of records of
+            either dataset with a likely match in the other.
+
+Requirements: myFunctions.py, linkagePipeline.py, recordlinkage, pandas,
+              networkx
+"""
+
+# =============================================================================
+# User inputs
+# =============================================================================
+
+graphName = 'Afghanistan_test'      # name of the graph created by create_graph
+graphPath = 'C:/Users/cmcinerney/Desktop/UNOCHA Fellowship/python output/'  # where the graphs are saved
+dataPath = 'C:/Users/cmcinerney/AppData/Local/HDXdata/Afghanistan'     # folder of the datasets of the graph
+fileTypes = ['csv', 'xls', 'xlsx']  # valid filetypes for loading
+cachePath = graphPath + 'linkage_cache'             # cleaned datasets are cached in this folder
+matchesPath = graphPath + graphName + '_matches'    # the matches of each edge are saved in this folder
+minSharedVars = 2                   # only link datasets sharing at least this many variables
+matchFraction = 0.9                 # pairs of records similar in at least this proportion of the compared variables are matches
+maxPairs = 5000000                  # skip pairs of datasets with more candidate pairs of records than this (after blocking)
+maxBlockKeys = 3                    # maximum number of variables used for blocking
+maxCategories = 100                 # variables with at most this many values are used for blocking or compared exactly
+chunkSize = 50000                   # number of candidate pairs compared at a time (limits the memory used)
+numWorkers = 1                      # number of processes linking pairs of datasets in parallel (e.g. os.cpu_count())
+writeBack = True                    # save the linkage risk of each edge in the graph files (gexf and snapshot)
+
+# =============================================================================
+# Import libs
+# =============================================================================
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+import pandas as pd
+
+from linkagePipeline import preprocessFrame, readDataset, linkDatasetPair
+from myFunctions import readGraphSnapshot, snapshotToGraph, writeGraphSnapshot
+
+
+def preprocess(path):
+    try:
+        preprocessFrame(path, None, cachePath, read=readDataset)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+# everything below only runs in the main process (worker processes import
+# this script again on Windows)
+if __name__ == '__main__':
+
+    # =============================================================================
+    # Load the graph and find the dataset of each node
+    # =============================================================================
+    snapshot = graphPath + graphName + ".snapshot"
+    if os.path.isdir(snapshot):
+        G = snapshotToGraph(readGraphSnapshot(snapshot))
+    else:
+        G = nx.read_gexf(graphPath + graphName + ".gexf")
+    files = {os.path.splitext(f)[0] : os.path.join(dataPath, f) for f in sorted(os.listdir(dataPath))
+             if os.path.splitext(f)[1][1:].lower() in fileTypes}
+
+    tasks = []
+    for u, v in G.edges():
+        title_u, title_v = G.nodes[u].get('title'), G.nodes[v].get('title')
+        if title_u not in files or title_v not in files:
+            continue
+        vars_u = set(G.nodes[u].get('variables', '').split(",")) - {''}
+        shared = sorted(vars_u & set(G.nodes[v].get('variables', '').split(",")))
+        if len(shared) < minSharedVars:
+            continue
+        tasks.append(((u, v), {'path_a' : files[title_u], 'path_b' : files[title_v], 'variables' : shared,
+                               'cache_dir' : cachePath, 'out_file' : os.path.join(matchesPath, str(u) + '_' + str(v) + '.csv'),
+                               'match_fraction' : matchFraction, 'chunk_size' : chunkSize, 'max_pairs' : maxPairs,
+                               'max_block_keys' : maxBlockKeys, 'max_categories' : maxCategories}))
+    print("Linking " + str(len(tasks)) + " of " + str(G.number_of_edges()) + " pairs of datasets")
+    os.makedirs(matchesPath, exist_ok=True)
+
+    # =============================================================================
+    # Clean each dataset once (cached), then link the pairs of datasets
+    # =============================================================================
+    paths = sorted(set(task['path_a'] for edge, task in tasks) | set(task['path_b'] for edge, task in tasks))
+    if numWorkers > 1:
+        with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+            errors = list(executor.map(preprocess, paths))
+            results = list(executor.map(linkDatasetPair, [task for edge, task in tasks]))
+    else:
+        errors = [preprocess(path) for path in paths]
+        results = [linkDatasetPair(task) for edge, task in tasks]
+    for path, error in zip(paths, errors):
+        if error is not None:
+            print('Couldn\'t load resource: ', path, error)
+
+    # =============================================================================
+    # Save the linkage risk of each edge
+    # =============================================================================
+    rows = []
+    for ((u, v), task), result in zip(tasks, results):
+        rows.append({'source' : G.nodes[u].get('title'), 'target' : G.nodes[v].get('title'), 'shared_variables' : ", ".join(task['variables']),
+                     'blocking' : ", ".join(result['blocking']), 'comparisons' : result['comparisons'], 'candidate_pairs' : result['pairs'],
+                     'matches' : result['matches'], 'linkage_risk' : result['risk'], 'error' : result['error']})
+        if result['risk'] is not None:
+            G.edges[u, v]['linkage_risk'] = round(result['risk'], 4)
+            G.edges[u, v]['linkage_matches'] = result['matches']
+        print(G.nodes[u].get('title') + " - " + G.nodes[v].get('title') + ": " +
+              (str(round(result['risk'], 4)) if result['risk'] is not None else result['error']))
+    pd.DataFrame(rows).to_csv(graphPath + graphName + "_linkage.csv", index = False)
+
+    if writeBack:
+        if os.path.isfile(graphPath + graphName + ".gexf"):
+            nx.write_gexf(G, graphPath + graphName + ".gexf")
+        if os.path.isdir(snapshot):
+            writeGraphSnapshot(G, snapshot)
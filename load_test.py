@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Description: load generator for the Data Environment Mapping tool. Simulated
+            users upload a file and wait for the datasets it shares
+            variables with, as the browser does (the same two Dash callback
+            requests), and the throughput and response times are printed.
+            An upload counts as an error (and isn't timed) if a request fails
+            or the file wasn't stored or matched (no upload key, or neither a
+            new network nor the new node was sent back).
+            If startServer is True the tool is started with gunicorn
+            (wsgi.py, gunicorn.conf.py) once for each number of workers in
+            workerCounts, to show how throughput scales with the workers.
+            The tool is started with serverCacheType, each run with an empty
+            cache. More than one worker needs a shared cache ('filesystem'
+            or 'redis'), otherwise gunicorn runs one and the runs with more
+            workers are skipped.
+
+Requirements: requests, gunicorn (if startServer), app.py, wsgi.py
+"""
+
+# =============================================================================
+# User inputs
+# =============================================================================
+
+serverUrl = 'http://127.0.0.1:8050'  # address of the tool
+startServer = True                  # start the tool with gunicorn for each of workerCounts, otherwise test the tool running at serverUrl
+workerCounts = [1, 2, 4]            # numbers of gunicorn workers to test (if startServer)
+serverCacheType = 'filesystem'      # cacheType of app.py for the tool started (if startServer), 'filesystem' or 'redis' to test more than one worker
+numClients = 8                      # number of simulated users uploading at the same time
+numUploads = 200                    # number of uploads per test
+uploadFile = None                   # csv/xls/xlsx file to upload, None for a small generated csv
+uniqueUploads = True                # make every upload different, so matches aren't found in the cache
+startupTimeout = 300                # seconds to wait for the tool to start
+
+# =============================================================================
+# Import libs
+# =============================================================================
+
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def upload_contents(ind_u):
+    """
+    Returns the name and dcc.Upload contents of one simulated upload.
+    """
+    if uploadFile is not None:
+        name = os.path.basename(uploadFile)
+        with open(uploadFile, 'rb') as f:
+            data = f.read()
+    else:
+        name = 'load_test.csv'
+        rows = "\n".join(",".join(str(ind_r * 4 + ind_c) for ind_c in range(4)) for ind_r in range(100))
+        data = ("Admin1 Name,Date,Population,Sector\n#adm1+name,#date,#population,#sector\n" + rows + "\n").encode('utf-8')
+    if uniqueUploads and name.lower().endswith('.csv'):
+        #a different last line gives a different hash
+        data = data + (",".join([str(ind_u)] * 4) + "\n").encode('utf-8')
+    return name, 'data:application/octet-stream;base64,' + base64.b64encode(data).decode('ascii')
+
+
+def callback(session, dependencies, output, inputs, state):
+    """
+    Calls a Dash callback of the tool (as the browser does) and returns its
+    response.
+    """
+    spec = [d for d in dependencies if d['output'] == output][0]
+    outputs = [{'id' : o.split('.')[0], 'property' : o.split('.')[1]} for o in output.strip('.').split('...')]
+    r = session.post(serverUrl + '/_dash-update-component',
+                     json={'output' : output, 'outputs' : outputs if output.startswith('..') else outputs[0],
+                           'inputs' : inputs, 'state' : state,
+                           'changedPropIds' : [i['id'] + '.' + i['property'] for i in inputs[:1]]})
+    r.raise_for_status()
+    return r.json()['response']
+
+
+def upload(ind_u):
+    """
+    Uploads one file and waits for its matches, returns the response time in
+    seconds, or None if the upload failed.
+    """
+    session = requests.Session()
+    dependencies = session.get(serverUrl + '/_dash-dependencies').json()
+    graph_output = [d['output'] for d in dependencies if 'graph-iframe.src' in d['output']][0]
+    name, contents = upload_contents(ind_u)
+    start = time.perf_counter()
+    try:
+        stored = callback(session, dependencies, 'upload-keys.data',
+                          [{'id' : 'upload-data', 'property' : 'contents', 'value' : [contents]}],
+                          [{'id' : 'upload-data', 'property' : 'filename', 'value' : [name]},
+                           {'id' : 'upload-data', 'property' : 'last_modified', 'value' : [time.time()]}])['upload-keys']['data']
+        #the file is stored under a key unless it couldn't be read or the server was busy
+        if not stored or stored[0]['key'] is None:
+            print('Upload ' + str(ind_u) + ' wasn\'t stored: ' + str(stored))
+            return None
+        response = callback(session, dependencies, graph_output,
+                            [{'id' : 'upload-keys', 'property' : 'data', 'value' : stored},
+                             {'id' : 'cluster-view', 'property' : 'value', 'value' : 'overview'}],
+                            [{'id' : 'graph-delta', 'property' : 'data', 'value' : None}])
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print('Upload ' + str(ind_u) + ' failed: ' + str(e))
+        return None
+    #a redrawn network (iframe src) or the new node to add to the network shown
+    src = response.get('graph-iframe', {}).get('src')
+    delta = (response.get('graph-delta') or {}).get('data')
+    if not src and not (delta and any(n['id'] == 'upload-1' for n in delta['nodes'])):
+        print('Upload ' + str(ind_u) + ' wasn\'t matched')
+        return None
+    return time.perf_counter() - start
+
+
+def run_load():
+    """
+    Runs numUploads uploads from numClients simulated users, returns
+    (successful uploads per second, median and 95th percentile response time
+    of the successful uploads, number of failed uploads).
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=numClients) as executor:
+        results = list(executor.map(upload, range(numUploads)))
+    elapsed = time.perf_counter() - start
+    times = sorted(t for t in results if t is not None)
+    errors = len(results) - len(times)
+    if len(times) == 0:
+        return 0, float('nan'), float('nan'), errors
+    return len(times) / elapsed, times[len(times) // 2], times[min(int(len(times) * 0.95), len(times) - 1)], errors
+
+
+def wait_for_server(process):
+    start = time.time()
+    while time.time() - start < startupTimeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError('The server stopped while starting')
+        try:
+            if requests.get(serverUrl + '/_dash-layout', timeout=5).ok:
+                return
+        except requests.exceptions.ConnectionError:
+            pass
+        time.sleep(1)
+    raise RuntimeError('The server didn\'t start in ' + str(startupTimeout) + ' seconds')
+
+
+# =============================================================================
+# Run the load tests
+# =============================================================================
+
+if __name__ == '__main__':
+    results = []
+    for num_workers in (workerCounts if startServer else [None]):
+        process = None
+        if startServer:
+            if num_workers > 1 and serverCacheType not in ['filesystem', 'redis']:
+                print("Skipping " + str(num_workers) + " workers: cacheType '" + serverCacheType +
+                      "' isn't shared by worker processes, so gunicorn would run 1 worker")
+                continue
+            #each run starts with an empty cache
+            cache_dir = tempfile.mkdtemp(prefix='load_test_cache_')
+            env = dict(os.environ, DEM_CACHE_TYPE=serverCacheType, DEM_CACHE_DIR=cache_dir)
+            process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(num_workers),
+                                        '-b', serverUrl.split('://')[-1], '--access-logfile', '', 'wsgi:server'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        try:
+            wait_for_server(process)
+            throughput, median, p95, errors = run_load()
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+                shutil.rmtree(cache_dir, ignore_errors=True)
+        results.append((num_workers, throughput, median, p95, errors))
+        print(str(num_workers or 'running') + " workers: " + str(round(throughput, 2)) + " uploads/s, median " +
+              str(round(median, 3)) + " s, 95th percentile " + str(round(p95, 3)) + " s, " +
+              str(errors) + " of " + str(numUploads) + " uploads failed")
+
+    print("\nworkers  uploads/s  median (s)  p95 (s)  errors")
+    for num_workers, throughput, median, p95, errors in results:
+        print(str(num_workers or '-').ljust(9) + str(round(throughput, 2)).ljust(11) + str(round(median, 3)).ljust(12) +
+              str(round(p95, 3)).ljust(9) + str(errors))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Description: MinHash sketches and locality sensitive hashing (LSH) to find
+            pairs of similar sets (e.g. the character n-grams of two column
+            headers, or the variables of two datasets) without comparing
+            every pair. Each set is summarised by a signature of num_perm
+            minimum hash values, where the proportion of equal values of two
+            signatures estimates the Jaccard similarity of the sets. The
+            signatures are split into bands of rows, and only sets with an
+            identical band are returned as candidate pairs, which can then be
+            scored exactly.
+
+Requirements: numpy
+"""
+
+import numpy as np
+
+#the hash functions are (a * x + b) >> 32 with wrap-around 64 bit arithmetic
+#(multiply-shift hashing), which numpy calculates without any division
+SHIFT = np.uint64(32)
+MAX_HASH = np.uint32(2**32 - 1)
+
+
+def sortedUnique(values):
+    '''
+    Sorted unique values of an integer array (by sorting, which is much
+    faster than np.unique for large arrays in recent numpy versions).
+    '''
+    values = np.sort(values)
+    return values[np.concatenate([[True], values[1:] != values[:-1]])] if len(values) > 0 else values
+
+
+def minhashSignatures(sets, num_perm=64, seed=0, chunk=16):
+    '''
+    Calculates the MinHash signatures of a list of sets. The hash functions
+    are applied to every value of every set at once (num_perm/chunk numpy
+    operations in total), so it is fast for many small sets.
+
+    Input:
+        - list of sets, each an array of integer values (e.g. token ids)
+        - number of hash functions (length of each signature)
+        - random seed of the hash functions, signatures are only comparable
+          if they use the same seed and num_perm
+        - number of hash functions applied at a time (limits the memory used)
+
+    Output:
+        - numpy array of uint32 signatures, one row per set. Empty sets get a
+          row of MAX_HASH and should be left out when finding pairs
+    '''
+    lengths = np.array([len(s) for s in sets], dtype=np.int64)
+    values = np.concatenate([np.asarray(s, dtype=np.uint64) for s in sets] + [np.zeros(0, dtype=np.uint64)])
+    return flatMinhashSignatures(values, lengths, num_perm, seed, chunk)
+
+
+def flatMinhashSignatures(values, lengths, num_perm=64, seed=0, chunk=16):
+    '''
+    As minhashSignatures, for sets given as one array of all their values
+    (set after set) and an array of the number of values in each set.
+    '''
+    rng = np.random.RandomState(seed)
+    a = rng.randint(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.randint(0, 2**63, size=num_perm, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    signatures = np.full((len(lengths), num_perm), MAX_HASH, dtype=np.uint32)
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return signatures
+    values = np.asarray(values, dtype=np.uint64)
+    starts = np.concatenate([[0], np.cumsum(lengths[nonempty])[:-1]])
+    for c in range(0, num_perm, chunk):
+        hashed = (a[c:c+chunk, None] * values[None, :] + b[c:c+chunk, None]) >> SHIFT
+        signatures[nonempty, c:c+chunk] = np.minimum.reduceat(hashed, starts, axis=1).T
+    return signatures
+
+
+def lshParameters(threshold, num_perm=64, false_positive_weight=0.5, false_negative_weight=0.5):
+    '''
+    Chooses the number of bands and rows per band so pairs with a Jaccard
+    similarity above the threshold are likely to be candidates and pairs
+    below it are not, by minimising the weighted areas under the probability
+    curve 1 - (1 - s^rows)^bands on either side of the threshold. Increase
+    false_negative_weight to find more of the similar pairs (recall) at the
+    cost of scoring more candidates.
+
+    Input:
+        - Jaccard similarity threshold
+        - number of hash functions in the signatures
+        - weights of the false positive and false negative areas
+
+    Output:
+        - number of bands, number of rows per band
+    '''
+    s = np.linspace(0, 1, 1001)
+    ds = s[1] - s[0]
+    best = None
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        probability = 1 - (1 - s ** rows) ** bands
+        false_positive = np.where(s < threshold, probability, 0).sum() * ds
+        false_negative = np.where(s >= threshold, 1 - probability, 0).sum() * ds
+        error = false_positive_weight * false_positive + false_negative_weight * false_negative
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def lshCandidatePairs(signatures, bands, rows, valid=None):
+    '''
+    Finds the pairs of signatures with at least one identical band.
+
+    Input:
+        - numpy array of signatures (see minhashSignatures)
+        - number of bands and rows per band (bands * rows <= num_perm)
+        - optional boolean array of the signatures to use (e.g. leaving out
+          empty sets)
+
+    Output:
+        - numpy array of unique candidate pairs (i, j) with i < j, one row
+          per pair
+    '''
+    n = len(signatures)
+    rows_used = np.flatnonzero(valid) if valid is not None else np.arange(n)
+    codes = []
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[rows_used, band*rows:(band+1)*rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        members = rows_used[np.argsort(inverse.ravel(), kind='stable')]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        #buckets of the same size are expanded into pairs together
+        for size in np.unique(counts[counts > 1]):
+            groups = members[starts[counts == size][:, None] + np.arange(size)]
+            first, second = np.triu_indices(size, 1)
+            i, j = groups[:, first].ravel(), groups[:, second].ravel()
+            codes.append(np.minimum(i, j).astype(np.int64) * n + np.maximum(i, j))
+    if len(codes) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    codes = sortedUnique(np.concatenate(codes))
+    return np.stack([codes // n, codes % n], axis=1)
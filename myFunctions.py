@@ -2,6 +2,8 @@ import pandas as pd # for data wrangling
 import json # for cleaning the data entrys
 import base64
 import io
+import os
+import sys
 import dash_html_components as html
 import dash_table
 
@@ -67,7 +69,7 @@ def filterListbyTag(aList, tag):
     return filteredList
 
 
-def draw_graph3(networkx_graph,output_filename,notebook=False):
+def draw_graph3(networkx_graph,output_filename,notebook=False,physics=True):
     """
     This function accepts a networkx graph object,
     converts it to a pyvis network object preserving its node and edge attributes,
@@ -90,6 +92,8 @@ def draw_graph3(networkx_graph,output_filename,notebook=False):
         output_filename: Where to save the converted network
         show_buttons: Show buttons in saved version of network?
         only_physics_buttons: Show only buttons controlling physics of network?
+        physics: Run the physics simulation in the browser? Set to False when
+            the nodes already have "x" and "y" positions (see computeLayout)
     """    
     # import
     from pyvis import network as net
@@ -137,14 +141,14 @@ def draw_graph3(networkx_graph,output_filename,notebook=False):
                 "hideNodesOnDrag": false
             },
             "physics": {
-                "enabled": true,
+                "enabled": """ + ('true' if physics else 'false') + """,
                 "barnesHut": {
                     "springLength": 300,
                     "damping": 0.6
                 },
                 "minVelocity": 0.75,
                 "stabilization": {
-                    "enabled": true,
+                    "enabled": """ + ('true' if physics else 'false') + """,
                     "fit": true,
                     "iterations": 1000,
                     "onlyDynamicEdges": false,
@@ -157,39 +161,1707 @@ def draw_graph3(networkx_graph,output_filename,notebook=False):
     # return and also save
     return pyvis_graph.save_graph(output_filename)
 
-def parse_contents(contents, filename, date):
-    content_type, content_string = contents.split(',')
+def computeLayout(G, weight=None, iterations=50, seed=0, scale=None):
+    '''
+    Calculates the position of every node with a force-directed
+    (Fruchterman-Reingold) layout, vectorised with numpy, and stores them as
+    "x" and "y" node attributes. The positions are saved with the graph, so
+    the network can be drawn with draw_graph3(..., physics=False) and the
+    browser doesn't have to run the physics simulation.
+    
+    Input:
+        - networkx graph
+        - edge attribute to use as the strength of the edges (None: all equal)
+        - number of iterations of the layout algorithm
+        - seed for the random starting positions
+        - size of the layout in pixels (default 100 * sqrt(number of nodes))
+    
+    Output:
+        - dictionary of node -> (x, y), the graph is also updated in place
+    
+    Requires:
+        - networkx, numpy, scipy
+    '''
+    import math
+    import networkx as nx
+    
+    if G.number_of_nodes() == 0:
+        return {}
+    if scale is None:
+        scale = 100 * math.sqrt(G.number_of_nodes())
+    pos = nx.spring_layout(G, weight=weight, iterations=iterations, seed=seed, scale=scale)
+    for node, (x, y) in pos.items():
+        G.nodes[node]['x'] = float(x)
+        G.nodes[node]['y'] = float(y)
+    return pos
+
+
+def placeNewNodes(G_base, overlay, spacing=30):
+    '''
+    Gives new nodes positions next to the nodes they are connected to, so they
+    can be added to a network with fixed positions (computeLayout) without
+    recalculating the layout. Each new node is placed at the mean position of
+    its neighbours (weighted by edge weight), moved slightly so it doesn't
+    cover them; nodes with no neighbours are placed above the network.
+    
+    Input:
+        - graph whose nodes have "x" and "y" attributes
+        - overlay graph of the new nodes and their edges to nodes in G_base
+        - distance (pixels) new nodes are moved from their neighbours' centre
+    
+    Output:
+        - None, the "x" and "y" attributes of the new nodes in the overlay
+          are set
+    '''
+    import math
+    
+    positioned = [d for n, d in G_base.nodes(data=True) if 'x' in d and 'y' in d]
+    if len(positioned) == 0:
+        return
+    top = min(d['y'] for d in positioned)
+    new_nodes = [n for n in overlay.nodes() if n not in G_base]
+    for ind_n, n in enumerate(new_nodes):
+        neighbours = [(m, abs(d.get('weight', 1)) or 1) for m, d in overlay[n].items()
+                      if m in G_base and 'x' in G_base.nodes[m] and 'y' in G_base.nodes[m]]
+        angle = 2 * math.pi * ind_n / max(len(new_nodes), 1)
+        if len(neighbours) > 0:
+            total = sum(w for m, w in neighbours)
+            x = sum(G_base.nodes[m]['x'] * w for m, w in neighbours) / total
+            y = sum(G_base.nodes[m]['y'] * w for m, w in neighbours) / total
+        else:
+            x, y = 0, top - 2 * spacing
+        overlay.nodes[n]['x'] = x + spacing * math.cos(angle)
+        overlay.nodes[n]['y'] = y + spacing * math.sin(angle)
+
+def detectCommunities(G, weight='weight', seed=0, min_size=2):
+    '''
+    Groups the datasets into clusters of closely linked datasets (Louvain
+    community detection on the weighted edges, or label propagation with older
+    versions of networkx) and stores the cluster of each node in a
+    "community" node attribute. Clusters are numbered from the largest (0),
+    datasets in clusters smaller than min_size (e.g. datasets linked to no
+    others) are put together in one "unclustered" group, numbered -1.
+    
+    Input:
+        - networkx graph
+        - edge attribute to use as the strength of the edges, negative
+          weights are treated as 0
+        - seed for the random parts of the algorithm
+        - smallest number of datasets in a cluster
+    
+    Output:
+        - dictionary of node -> cluster number, the graph is also updated
+          in place
+    
+    Requires:
+        - networkx
+    '''
+    import networkx as nx
+    from networkx.algorithms import community
+    
+    H = nx.Graph()
+    H.add_nodes_from(G.nodes())
+    H.add_weighted_edges_from((u, v, max(d.get(weight, 1), 0)) for u, v, d in G.edges(data=True))
+    if hasattr(community, 'louvain_communities'):
+        clusters = community.louvain_communities(H, weight='weight', seed=seed)
+    else:
+        clusters = community.asyn_lpa_communities(H, weight='weight', seed=seed)
+    clusters = sorted(clusters, key=lambda c: (-len(c), min(map(str, c))))
+    communities = {}
+    for ind_c, cluster in enumerate(clusters):
+        for node in cluster:
+            communities[node] = ind_c
+            G.nodes[node]['community'] = ind_c
+    return groupSmallCommunities(G, min_size)
+
+
+def groupSmallCommunities(G, min_size=2):
+    '''
+    Puts the datasets of clusters smaller than min_size together in one
+    "unclustered" group (cluster -1), so isolated datasets don't each get a
+    cluster of their own. Used by detectCommunities, and for graphs saved
+    with one cluster per isolated dataset.
+    
+    Input:
+        - networkx graph with a "community" node attribute
+        - smallest number of datasets in a cluster
+    
+    Output:
+        - dictionary of node -> cluster number, the graph is also updated
+          in place
+    '''
+    sizes = {}
+    for n, d in G.nodes(data=True):
+        sizes[d['community']] = sizes.get(d['community'], 0) + 1
+    communities = {}
+    for n, d in G.nodes(data=True):
+        if sizes[d['community']] < min_size:
+            d['community'] = -1
+        communities[n] = d['community']
+    return communities
+
+
+def communityGraph(G, num_titles=10):
+    '''
+    Collapses a graph into one node per cluster (see detectCommunities), so
+    large networks can be shown as an overview. Cluster nodes are sized by
+    the number of datasets in them and are linked if any of their datasets
+    are, with the summed weight of those edges. The unclustered datasets
+    (cluster -1) are shown as one node.
+    
+    Input:
+        - networkx graph with a "community" node attribute
+        - number of dataset names shown in the title of each cluster node
+    
+    Output:
+        - networkx graph of the clusters, with node ids "cluster-<number>"
+    
+    Requires:
+        - networkx
+    '''
+    import networkx as nx
+    
+    members = {}
+    for n, d in G.nodes(data=True):
+        members.setdefault(d['community'], []).append(n)
+    C = nx.Graph()
+    for ind_c, nodes in sorted(members.items()):
+        titles = [str(G.nodes[n].get('title', n)) for n in nodes[:num_titles]]
+        if len(nodes) > num_titles:
+            titles.append('...')
+        name = 'Unclustered' if ind_c == -1 else 'Cluster ' + str(ind_c)
+        attrs = {'label' : name + ' (' + str(len(nodes)) + ')',
+                 'title' : name + ': ' + str(len(nodes)) + ' datasets<br> ' + '<br> '.join(titles),
+                 'value' : len(nodes), 'community' : ind_c}
+        #put the cluster where its datasets are, if they have positions
+        if all('x' in G.nodes[n] and 'y' in G.nodes[n] for n in nodes):
+            attrs['x'] = sum(G.nodes[n]['x'] for n in nodes) / len(nodes)
+            attrs['y'] = sum(G.nodes[n]['y'] for n in nodes) / len(nodes)
+        C.add_node('cluster-' + str(ind_c), **attrs)
+    for u, v, d in G.edges(data=True):
+        c_u = 'cluster-' + str(G.nodes[u]['community'])
+        c_v = 'cluster-' + str(G.nodes[v]['community'])
+        if c_u == c_v:
+            continue
+        if C.has_edge(c_u, c_v):
+            C.edges[c_u, c_v]['weight'] += d.get('weight', 1)
+            C.edges[c_u, c_v]['count'] += 1
+        else:
+            C.add_edge(c_u, c_v, weight = d.get('weight', 1), count = 1)
+    for u, v, d in C.edges(data=True):
+        d['title'] = str(d['count']) + ' linked pairs of datasets'
+    return C
+
+def overlayDelta(overlay):
+    '''
+    Converts a small overlay graph (new nodes and their edges to nodes already
+    in a pyvis network) into the vis.js node and edge data that can be added
+    to the network in the browser, so the whole graph doesn't need to be
+    redrawn. Attributes are converted the same way as in draw_graph3.
+    
+    Input:
+        - networkx graph holding the new nodes (with attributes) and their
+          edges, the existing nodes they connect to need no attributes (or
+          only their "community", see detectCommunities)
+    
+    Output:
+        - dictionary with lists of 'nodes' and 'edges' for vis.DataSet.add
+    '''
+    nodes = []
+    for node,node_attrs in overlay.nodes(data=True):
+        # only the new nodes have a title, the others are already drawn
+        if 'title' in node_attrs:
+            nodes.append(dict({'id' : str(node), 'label' : str(node), 'shape' : 'dot'}, **node_attrs))
+    edges = []
+    for source,target,edge_attrs in overlay.edges(data=True):
+        edge = dict({'id' : 'overlay-' + str(source) + '-' + str(target), 'from' : str(source), 'to' : str(target)}, **edge_attrs)
+        # cluster of the existing node, for linking to it in a cluster overview
+        for node in [source, target]:
+            if 'community' in overlay.nodes[node]:
+                edge['cluster'] = 'cluster-' + str(overlay.nodes[node]['community'])
+        # if value/width not specified directly, and weight is specified, set 'value' to 'weight'
+        if not 'value' in edge_attrs and not 'width' in edge_attrs and 'weight' in edge_attrs:
+            edge['value'] = edge_attrs['weight']
+        edges.append(edge)
+    return {'nodes' : nodes, 'edges' : edges}
 
+def uploadFormat(filename):
+    '''
+    Returns the format of an uploaded file from its name: 'csv', 'xlsx' or
+    'xls', or None for other files.
+    '''
+    if "csv" in filename.lower():
+        return 'csv'
+    elif "xls" in filename.lower():
+        return 'xlsx' if "xlsx" in filename.lower() else 'xls'
+    return None
+
+def parseUpload(contents, filename, nrows=2, max_preview_bytes=None):
+    '''
+    Decodes an uploaded file (the contents of a dcc.Upload) once and reads
+    both the hxls and variables of the file, assuming the vars are in the 1st
+    row and the hxls in the 2nd, and the file as a dataframe for the
+    preview. The preview is cut to the first rows that fit in
+    max_preview_bytes (in memory), so the size of a cached upload is bounded
+    however large the file is. The header rows are streamed (readHeaderRows), only text cells
+    are kept, lowercased and with spaces removed as in create_graph.
+    
+    Input:
+        - base64 contents of the upload ("data:<type>;base64,<data>")
+        - name of the uploaded file, used to find its format
+        - number of rows to read for the hxls/vars (default 2)
+        - maximum size of the preview dataframe in bytes (None for no limit)
+    
+    Output:
+        - dictionary with the 'hxls', 'vars', 'columns', 'num_rows' and
+          'preview_rows' (rows kept for the preview) of the table (None if
+          the file couldn't be read as a table) and the
+          start of the contents ('raw'), or None if the file is not a csv,
+          xlsx or xls file. Only what comes from the contents (and format)
+          is kept, so the same file uploaded under another name can share it
+        - dataframe of the file for the preview (None if it couldn't be
+          read as a table), kept apart so the small header dictionary can be
+          cached and read without it
+    '''
+    fileFormat = uploadFormat(filename)
+    if fileFormat is None:
+        return None, None
+    content_type, content_string = contents.split(',')
     decoded = base64.b64decode(content_string)
+    vars_hxls = readHeaderRows(io.BytesIO(decoded), fileFormat, nrows=nrows)
+    vars_hxls = vars_hxls + [[]] * (2 - len(vars_hxls))
+    h = [n.lower().replace(" ","") for n in vars_hxls[1] if isinstance(n, str)]
+    v = [n.lower().replace(" ","") for n in vars_hxls[0] if isinstance(n, str)]
     try:
-        if 'csv' in filename.lower():
-            # Assume that the user uploaded a CSV file
-            df = pd.read_csv(
-                io.StringIO(decoded.decode('utf-8')))
-        elif 'xls' in filename.lower():
-            # Assume that the user uploaded an excel file (.xls or .xlsx)
+        if fileFormat == 'csv':
+            df = pd.read_csv(io.BytesIO(decoded))
+        else:
             df = pd.read_excel(io.BytesIO(decoded))
     except Exception as e:
         print(e)
+        df = None
+    num_rows = None if df is None else len(df)
+    if df is not None and max_preview_bytes is not None and len(df) > 0:
+        row_bytes = df.memory_usage(deep=True).sum() / len(df)
+        df = df.iloc[:max(int(max_preview_bytes // max(row_bytes, 1)), 1)]
+    upload = {'hxls' : [n for n in h if n != 'nan'], 'vars' : [n for n in v if n != 'nan'],
+              'columns' : None if df is None else [str(i) for i in df.columns],
+              'num_rows' : num_rows, 'preview_rows' : None if df is None else len(df), 'raw' : contents[0:200]}
+    return upload, df
+
+def parse_contents(key, name, upload, date, page_size=20, busy=False):
+    '''
+    Shows an uploaded file (see parseUpload) as a table. Only the columns
+    and number of pages are set here, the rows of the page shown are sent by
+    a callback (page_action='custom', see previewPage) from the frame cached
+    on the server, so large files aren't sent to the browser.
+    
+    Input:
+        - key the upload is cached under, used as the index of the table id
+          ({'type' : 'upload-table', 'index' : key})
+        - name of the uploaded file
+        - header dictionary returned by parseUpload
+        - last modified time of the file (timestamp)
+        - number of rows per page
+        - True if the file wasn't read because the server was busy
+    
+    Output:
+        - html.Div of the file name, date and table
+    '''
+    if busy:
+        return html.Div([
+            'This file is still being processed, the server is busy with other uploads. Please upload it again in a moment.'
+        ])
+    if upload is None or upload['columns'] is None:
         return html.Div([
             'There was an error processing this file.'
         ])
 
+    #large files only have their first rows in the preview
+    shown = ('Showing the first ' + str(upload['preview_rows']) + ' of ' + str(upload['num_rows']) + ' rows'
+             if upload['preview_rows'] < upload['num_rows'] else '')
+
     return html.Div([
-        html.H5(filename),
+        html.H5(name),
         html.H6(datetime.fromtimestamp(date)),
+        html.Div(shown),
 
         dash_table.DataTable(
-            data=df.to_dict('records'),
-            columns=[{'name': i, 'id': i} for i in df.columns]
+            id={'type' : 'upload-table', 'index' : key},
+            columns=[{'name': i, 'id': i} for i in upload['columns']],
+            page_current=0,
+            page_size=page_size,
+            page_count=max(-(-upload['preview_rows'] // page_size), 1),
+            page_action='custom'
         ),
 
         html.Hr(),  # horizontal line
 
         # For debugging, display the raw contents provided by the web browser
         html.Div('Raw Content'),
-        html.Pre(contents[0:200] + '...', style={
+        html.Pre(upload['raw'] + '...', style={
             'whiteSpace': 'pre-wrap',
             'wordBreak': 'break-all'
         })
-    ])
\ No newline at end of file
+    ])
+
+def previewPage(df, page_current, page_size):
+    '''
+    Returns one page of the rows of an uploaded file for the table made by
+    parse_contents.
+    
+    Input:
+        - dataframe returned by parseUpload (or None if it is no longer
+          cached)
+        - page number (from 0) and number of rows per page
+    
+    Output:
+        - list of row dictionaries
+    '''
+    if df is None:
+        return []
+    page_current = page_current or 0
+    page = df.iloc[page_current * page_size:(page_current + 1) * page_size]
+    return page.rename(columns=str).to_dict('records')
+
+def invertedIndex(dict_of_tokens):
+    '''
+    Builds an inverted index (token -> posting list of dataset ids) from a
+    dictionary of the variables or hxls found in each dataset.
+    
+    Input:
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+    
+    Output:
+        - dictionary of token -> list of dataset ids containing that token,
+          ids are kept in the order the datasets were added
+    '''
+    index = {}
+    for ind_x, tokens in dict_of_tokens.items():
+        for token in set(tokens):
+            index.setdefault(token, []).append(ind_x)
+    return index
+
+
+def sharedTokenPairs(dict_of_tokens):
+    '''
+    Finds every pair of datasets that share at least one token by walking the
+    posting lists of an inverted index, so only co-occurring pairs are ever
+    visited (rather than comparing all pairs of datasets).
+    
+    Input:
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+    
+    Output:
+        - dictionary of (later dataset id, earlier dataset id) -> set of
+          tokens shared by the two datasets
+    '''
+    pairs = {}
+    for token, postings in invertedIndex(dict_of_tokens).items():
+        for ind_b, b in enumerate(postings):
+            for a in postings[:ind_b]:
+                pairs.setdefault((b, a), set()).add(token)
+    return pairs
+
+
+def edgeAttributes(pairs, dict_of_tokens, weights, include_weights=True):
+    '''
+    Calculates the edge attributes (count, prop and weight) for each pair of
+    datasets sharing tokens.
+    
+    Input:
+        - dictionary of (dataset id, dataset id) -> set of shared tokens
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+        - dictionary of token -> "expert judgement" weight, tokens that aren't
+          in the dictionary get the default weight of 0.5
+        - include_weights: if False every edge has weight 1
+    
+    Output:
+        - dictionary of (dataset id, dataset id) -> dictionary of edge
+          attributes: tokens (sorted list), count, prop and weight
+    '''
+    sizes = {ind_x : len(set(tokens)) for ind_x, tokens in dict_of_tokens.items()}
+    edges = {}
+    for (ind_x, ind_j), intersect in sorted(pairs.items()):
+        count = len(intersect)
+        #proportion of tokens in common (denominator: total tokens in smaller dataset)
+        prop = round(count/min(sizes[ind_x], sizes[ind_j]), 2)
+        if include_weights:
+            #sum weights of each token if in dictionary, else +0.5 (default)
+            jud_weight = sum(weights.get(token, 0.5) for token in intersect)
+        else:
+            jud_weight = 1
+        edges[(ind_x, ind_j)] = {'tokens' : sorted(intersect), 'count' : count, 'prop' : prop, 'weight' : jud_weight}
+    return edges
+
+
+def addEdges(G, edges):
+    '''
+    Adds edges between datasets sharing tokens to a graph. If the edge already
+    exists (e.g. the datasets share hxls and variables) the tokens are added
+    to the title and the weights are summed.
+    
+    Input:
+        - networkx graph
+        - dictionary of (dataset id, dataset id) -> edge attributes, as
+          returned by edgeAttributes
+    
+    Output:
+        - None, the graph is updated in place
+    '''
+    for (ind_x, ind_j), attrs in edges.items():
+        title = '<br> '.join(map(str, attrs['tokens']))
+        if G.has_edge(ind_x, ind_j):
+            G.edges[ind_x,ind_j]['weight'] = G.edges[ind_x,ind_j]['weight'] + attrs['weight']
+            G.edges[ind_x,ind_j]['title'] = G.edges[ind_x,ind_j]['title'] + '<br> ' + title
+        else:
+            G.add_edge(ind_x, ind_j, weight = attrs['weight'], title = title, prop = attrs['prop'], count = attrs['count'])
+
+
+def pairIntersection(pairs, ind_a, ind_b):
+    '''
+    Looks up the tokens shared by two datasets in a sparse pair store (the
+    order of the two dataset ids doesn't matter).
+    
+    Input:
+        - dictionary of (dataset id, dataset id) -> set of shared tokens, as
+          returned by sharedTokenPairs
+        - the ids of the two datasets
+    
+    Output:
+        - set of shared tokens (empty if the datasets share nothing)
+    '''
+    return pairs.get((ind_a, ind_b), pairs.get((ind_b, ind_a), set()))
+
+
+def savePairStore(stores, file_name):
+    '''
+    Saves one or more sparse pair stores to a json file, only pairs that share
+    tokens are written.
+    
+    Input:
+        - dictionary of store name (e.g. 'hxls', 'vars') -> dictionary of
+          (dataset id, dataset id) -> set of shared tokens
+        - name of the file to write
+    
+    Output:
+        - None
+    
+    Requires:
+        - json
+    '''
+    data = {name : [[ind_x, ind_j, sorted(shared)] for (ind_x, ind_j), shared in sorted(pairs.items())]
+            for name, pairs in stores.items()}
+    with open(file_name, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def loadPairStore(file_name):
+    '''
+    Loads sparse pair stores saved by savePairStore.
+    
+    Input:
+        - name of the json file
+    
+    Output:
+        - dictionary of store name -> dictionary of (dataset id, dataset id)
+          -> set of shared tokens
+    
+    Requires:
+        - json
+    '''
+    with open(file_name, encoding='utf-8') as f:
+        data = json.load(f)
+    return {name : {(ind_x, ind_j) : set(shared) for ind_x, ind_j, shared in pairs}
+            for name, pairs in data.items()}
+
+
+def tokenIncidenceMatrix(dict_of_tokens):
+    '''
+    Builds a sparse dataset x token incidence matrix, with a 1 where the
+    dataset contains the token.
+    
+    Input:
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+    
+    Output:
+        - scipy csr matrix (datasets x tokens)
+        - list of dataset ids (the rows)
+        - list of tokens (the columns)
+    
+    Requires:
+        - numpy, scipy
+    '''
+    import numpy as np
+    from scipy import sparse
+    
+    ids = list(dict_of_tokens)
+    tokens = sorted(set(token for t in dict_of_tokens.values() for token in t))
+    columns = {token : ind_t for ind_t, token in enumerate(tokens)}
+    indptr = [0]
+    indices = []
+    for ind_x in ids:
+        indices.extend(sorted(columns[token] for token in set(dict_of_tokens[ind_x])))
+        indptr.append(len(indices))
+    A = sparse.csr_matrix((np.ones(len(indices)), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                          shape=(len(ids), len(tokens)))
+    return A, ids, tokens
+
+
+def sparseEdgeAttributes(dict_of_tokens, weights, include_weights=True):
+    '''
+    Vectorised version of sharedTokenPairs + edgeAttributes. The counts and
+    "expert judgement" weights of the tokens shared by every pair of datasets
+    are calculated at once with sparse matrix products (A.Aᵀ and A.W.Aᵀ, where
+    A is the dataset x token incidence matrix and W the diagonal matrix of
+    token weights), so no python loop over pairs or tokens is needed to find
+    the edges.
+    
+    Input:
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+        - dictionary of token -> "expert judgement" weight, tokens that aren't
+          in the dictionary get the default weight of 0.5
+        - include_weights: if False every edge has weight 1
+    
+    Output:
+        - dictionary of (dataset id, dataset id) -> dictionary of edge
+          attributes: tokens (sorted list), count, prop and weight, the same
+          as returned by edgeAttributes
+    
+    Requires:
+        - numpy, scipy
+    '''
+    import numpy as np
+    from scipy import sparse
+    
+    A, ids, tokens = tokenIncidenceMatrix(dict_of_tokens)
+    if len(tokens) == 0:
+        return {}
+    W = sparse.diags(np.array([weights.get(token, 0.5) for token in tokens], dtype=float))
+    #number of tokens in common and sum of their weights for every pair (upper
+    #triangle only, row i was added before row j)
+    counts = sparse.triu(A @ A.T, k=1).tocoo()
+    rows, cols = counts.row, counts.col
+    jud_weights = np.asarray((A @ W @ A.T).tocsr()[rows, cols]).ravel()
+    sizes = np.diff(A.indptr)
+    #proportion of tokens in common (denominator: total tokens in smaller dataset)
+    smaller = np.minimum(sizes[rows], sizes[cols])
+    
+    #sets of tokens in each dataset, only needed for the edge titles
+    token_sets = [set(tokens[t] for t in A.indices[A.indptr[r]:A.indptr[r+1]]) for r in range(len(ids))]
+    order = np.lexsort((rows, cols))
+    edges = {}
+    for i, j, count, jud_weight, size in zip(cols[order].tolist(), rows[order].tolist(), counts.data[order].astype(int).tolist(),
+                                             jud_weights[order].tolist(), smaller[order].tolist()):
+        edges[(ids[i], ids[j])] = {'tokens' : sorted(token_sets[i] & token_sets[j]),
+                                   'count' : count,
+                                   'prop' : round(count/size, 2),
+                                   'weight' : jud_weight if include_weights else 1}
+    return edges
+
+
+def minhashEdgeAttributes(dict_of_tokens, weights, include_weights=True, threshold=0.3, num_perm=128, bands=None, rows=None, seed=0):
+    '''
+    Approximate version of sparseEdgeAttributes for very large collections of
+    datasets (e.g. all of HDX), where too many pairs share at least one common
+    token. The tokens of each dataset are sketched with MinHash, and only the
+    pairs of datasets found by LSH banding are compared, keeping those whose
+    Jaccard similarity (tokens in common / tokens in either) is at least the
+    threshold. Every edge returned is exact, but some pairs above the
+    threshold can be missed: more bands (or a lower threshold) find more of
+    them at the cost of comparing more pairs. Check the trade-off with
+    compareEdges, e.g. in evaluate_minhash.py.
+
+    Input:
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+        - dictionary of token -> "expert judgement" weight, tokens that aren't
+          in the dictionary get the default weight of 0.5
+        - include_weights: if False every edge has weight 1
+        - minimum Jaccard similarity of the pairs of datasets to link
+        - number of hash functions in the MinHash signatures
+        - number of LSH bands and rows per band, chosen from the threshold if
+          None
+        - random seed of the hash functions
+
+    Output:
+        - dictionary of (dataset id, dataset id) -> dictionary of edge
+          attributes, the same as returned by edgeAttributes
+
+    Requires:
+        - numpy, scipy, minHash.py
+    '''
+    import numpy as np
+    from minHash import flatMinhashSignatures, lshParameters, lshCandidatePairs
+
+    A, ids, tokens = tokenIncidenceMatrix(dict_of_tokens)
+    if len(tokens) == 0:
+        return {}
+    sizes = np.diff(A.indptr)
+    signatures = flatMinhashSignatures(A.indices.astype(np.uint64), sizes, num_perm, seed)
+    if bands is None or rows is None:
+        bands, rows = lshParameters(threshold, num_perm)
+    pairs = lshCandidatePairs(signatures, bands, rows, valid = sizes > 0)
+    #exact counts and weights of the candidate pairs only
+    w = np.array([weights.get(token, 0.5) for token in tokens], dtype=float)
+    shared = A[pairs[:, 0]].multiply(A[pairs[:, 1]]).tocsr()
+    counts = np.asarray(shared.sum(axis=1)).ravel()
+    keep = counts / np.maximum(sizes[pairs[:, 0]] + sizes[pairs[:, 1]] - counts, 1) >= threshold
+    keep &= counts > 0
+    rows_, cols = pairs[keep, 0], pairs[keep, 1]
+    counts, jud_weights = counts[keep], (shared @ w)[keep]
+    smaller = np.minimum(sizes[rows_], sizes[cols])
+
+    token_sets = [set(tokens[t] for t in A.indices[A.indptr[r]:A.indptr[r+1]]) for r in range(len(ids))]
+    order = np.lexsort((rows_, cols))
+    edges = {}
+    for i, j, count, jud_weight, size in zip(cols[order].tolist(), rows_[order].tolist(), counts[order].astype(int).tolist(),
+                                             jud_weights[order].tolist(), smaller[order].tolist()):
+        edges[(ids[i], ids[j])] = {'tokens' : sorted(token_sets[i] & token_sets[j]),
+                                   'count' : count,
+                                   'prop' : round(count/size, 2),
+                                   'weight' : jud_weight if include_weights else 1}
+    return edges
+
+
+def compareEdges(exact_edges, approx_edges, dict_of_tokens, threshold=0):
+    '''
+    Compares approximate edges (e.g. from minhashEdgeAttributes) with the
+    exact edges (from sparseEdgeAttributes or edgeAttributes) of the same
+    datasets.
+
+    Input:
+        - dictionaries of (dataset id, dataset id) -> edge attributes
+        - dictionary of dataset id -> list of tokens, to calculate the Jaccard
+          similarity of each exact edge
+        - Jaccard similarity threshold used for the approximate edges
+
+    Output:
+        - dictionary of: number of exact and approximate edges, number of
+          exact edges above the threshold, precision (approximate edges that
+          are exact edges), recall (of all exact edges), recall above the
+          threshold and recall of the total weight of the edges above the
+          threshold
+    '''
+    sizes = {ind_x : len(set(tokens)) for ind_x, tokens in dict_of_tokens.items()}
+    above = {pair for pair, attrs in exact_edges.items()
+             if attrs['count'] / (sizes[pair[0]] + sizes[pair[1]] - attrs['count']) >= threshold}
+    found = set(approx_edges) & set(exact_edges)
+    weight_above = sum(abs(exact_edges[pair]['weight']) for pair in above)
+    return {'exact_edges' : len(exact_edges),
+            'approx_edges' : len(approx_edges),
+            'exact_above_threshold' : len(above),
+            'precision' : len(found) / len(approx_edges) if len(approx_edges) > 0 else 1.0,
+            'recall' : len(found) / len(exact_edges) if len(exact_edges) > 0 else 1.0,
+            'recall_above_threshold' : len(found & above) / len(above) if len(above) > 0 else 1.0,
+            'weight_recall_above_threshold' : sum(abs(exact_edges[pair]['weight']) for pair in found & above) / weight_above if weight_above > 0 else 1.0}
+
+
+def readHeaderRows(source, fileFormat, nrows=2):
+    '''
+    Reads only the first rows of a csv, xlsx or xls file (the variables and
+    hxls), without parsing the rest of the file. Csv files are read line by
+    line, the first xlsx sheet is streamed with openpyxl's read-only parser
+    (stopping after nrows rows) and xls workbooks are opened on demand with
+    xlrd so only the first sheet is loaded.
+    
+    Input:
+        - file name or binary file-like object (e.g. an uploaded file)
+        - file format: 'csv', 'xlsx' or 'xls'
+        - number of rows to read (default 2)
+    
+    Output:
+        - list of rows (at most nrows), each a list of cell values with None
+          for empty cells, an empty list if the file has no data
+    
+    Requires:
+        - csv, openpyxl (xlsx), xlrd (xls)
+    '''
+    fileFormat = fileFormat.lower()
+    if fileFormat == 'csv':
+        import csv
+        wrapped = not isinstance(source, (str, bytes, os.PathLike))
+        if wrapped:
+            f = io.TextIOWrapper(source, newline='', encoding='utf-8-sig')
+        else:
+            f = open(source, newline='', encoding='utf-8-sig')
+        try:
+            #skip blank lines, as pandas does
+            lines = (row for row in csv.reader(f) if len(row) > 0)
+            rows = [[n if n.strip() != '' else None for n in row] for row, _ in zip(lines, range(nrows))]
+        finally:
+            if wrapped:
+                #don't close the caller's file object
+                f.detach()
+            else:
+                f.close()
+    elif fileFormat == 'xlsx':
+        #openpyxl's load_workbook scans every row of every sheet without a
+        #<dimension> element (common for generated files) before reading
+        #anything, so read the workbook parts and stream the first sheet directly
+        from openpyxl.reader.excel import ExcelReader
+        from openpyxl.styles.stylesheet import apply_stylesheet
+        from openpyxl.worksheet._reader import WorkSheetParser
+        reader = ExcelReader(source, read_only=True, data_only=True)
+        try:
+            reader.read_manifest()
+            reader.read_strings()
+            reader.read_workbook()
+            apply_stylesheet(reader.archive, reader.wb)
+            sheet_path = next(rel.target for sheet, rel in reader.parser.find_sheets() if rel.Type.endswith('/worksheet'))
+            rows = [[] for r in range(nrows)]
+            with reader.archive.open(sheet_path) as src:
+                parser = WorkSheetParser(src, reader.shared_strings, data_only=True, epoch=reader.wb.epoch,
+                                         date_formats=reader.wb._date_formats, timedelta_formats=reader.wb._timedelta_formats)
+                for idx, row in parser.parse():
+                    if idx > nrows:
+                        break
+                    for cell in row:
+                        rows[idx-1].extend([None] * (cell['column'] - len(rows[idx-1])))
+                        rows[idx-1][cell['column']-1] = cell['value']
+        finally:
+            reader.archive.close()
+        #drop missing rows at the end of short sheets
+        while len(rows) > 0 and len(rows[-1]) == 0:
+            rows.pop()
+    elif fileFormat == 'xls':
+        import xlrd
+        if isinstance(source, (str, bytes, os.PathLike)):
+            wb = xlrd.open_workbook(source, on_demand=True)
+        else:
+            wb = xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+        try:
+            sheet = wb.sheet_by_index(0)
+            rows = [sheet.row_values(r) for r in range(min(nrows, sheet.nrows))]
+        finally:
+            wb.release_resources()
+        #empty cells are '' and numbers are floats in xlrd, match the other formats
+        rows = [[None if n == '' else int(n) if isinstance(n, float) and n.is_integer() else n for n in row] for row in rows]
+    else:
+        raise ValueError("Can't load " + fileFormat + " files")
+    # check if it got any actual data
+    if not any(n is not None for row in rows for n in row):
+        return []
+    return rows
+
+
+def openHeaderCache(file_name):
+    '''
+    Opens (or creates) an on-disk SQLite cache of the header rows extracted
+    from each file, so files that haven't changed aren't parsed again.
+    
+    Input:
+        - name of the SQLite database file
+    
+    Output:
+        - sqlite3 connection, pass to lookupHeaderCache/storeHeaderCache
+          and commit/close when finished
+    
+    Requires:
+        - sqlite3
+    '''
+    import sqlite3
+    cache = sqlite3.connect(file_name)
+    cache.execute('CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT, nrows INTEGER, rows TEXT)')
+    cache.execute('CREATE INDEX IF NOT EXISTS headers_hash ON headers (hash)')
+    return cache
+
+
+def fileHash(file_name, block_size=1 << 20):
+    '''
+    Returns the sha1 hex digest of a file's contents, read in blocks.
+    
+    Requires:
+        - hashlib
+    '''
+    import hashlib
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def lookupHeaderCache(cache, file_name, nrows=2):
+    '''
+    Looks for the header rows of a file in the header cache. Files with the
+    same path, size and modification time as when they were cached are found
+    straight away, otherwise the contents are hashed and the rows of a file
+    with the same hash and size (e.g. re-downloaded or moved) are reused.
+    
+    Input:
+        - sqlite3 connection returned by openHeaderCache
+        - file name
+        - number of rows (default 2)
+    
+    Output:
+        - cached rows, or None if the file has to be read
+        - sha1 digest of the file for storeHeaderCache, None if the file
+          was found by its path
+    
+    Requires:
+        - json, sqlite3
+    '''
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    cached = cache.execute('SELECT size, mtime, rows FROM headers WHERE path = ? AND nrows = ?', (path, nrows)).fetchone()
+    if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+        return json.loads(cached[2]), None
+    digest = fileHash(path)
+    cached = cache.execute('SELECT rows FROM headers WHERE hash = ? AND size = ? AND nrows = ?', (digest, stat.st_size, nrows)).fetchone()
+    if cached is not None:
+        return json.loads(cached[0]), digest
+    return None, digest
+
+
+def storeHeaderCache(cache, file_name, rows, nrows=2, digest=None):
+    '''
+    Adds (or replaces) the header rows of a file in the header cache. The
+    contents are hashed unless the digest is given.
+    
+    Requires:
+        - json, sqlite3
+    '''
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    if digest is None:
+        digest = fileHash(path)
+    cache.execute('INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?)', (path, stat.st_size, stat.st_mtime, digest, nrows, json.dumps(rows, default=str)))
+
+
+def headerRowsWorker(task):
+    '''
+    Reads the header rows of one file, for use in a process pool. Errors are
+    returned rather than raised so one bad file doesn't stop the others.
+    
+    Input:
+        - tuple of (file name, file format, number of rows)
+    
+    Output:
+        - tuple of (rows or None, error or None)
+    '''
+    file_name, fileFormat, nrows = task
+    try:
+        return readHeaderRows(file_name, fileFormat, nrows=nrows), None
+    except Exception:
+        return None, str(sys.exc_info()[0])
+
+
+def headerRowsChunk(tasks):
+    '''
+    Reads the header rows of a chunk of files (headerRowsWorker for each), for
+    use in a process pool.
+    '''
+    return [headerRowsWorker(task) for task in tasks]
+
+
+def extractHeaderRows(tasks, numWorkers=1, chunksize=16):
+    '''
+    Reads the header rows of many files, in parallel using a pool of
+    numWorkers processes. Files are sent to the workers in chunks of
+    chunksize files and the results are returned in the same order as the
+    tasks, whatever order the workers finish in. If a worker dies (e.g. a
+    workbook makes it run out of memory) the pool is replaced: the chunks
+    that were being read are read again one at a time to find the one that
+    killed it, whose files are reported as failed, and the other files
+    carry on in the new pool.
+    
+    Input:
+        - list of tasks, as taken by headerRowsWorker
+        - number of worker processes (1 reads the files in this process)
+        - number of files sent to a worker at a time
+    
+    Output:
+        - list of (rows, error) for each task, as returned by
+          headerRowsWorker
+    
+    Requires:
+        - concurrent.futures
+    '''
+    if numWorkers <= 1 or len(tasks) <= 1:
+        return [headerRowsWorker(task) for task in tasks]
+    
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+    chunks = [range(start, min(start + chunksize, len(tasks))) for start in range(0, len(tasks), chunksize)]
+    results = [None] * len(tasks)
+    waiting = deque(range(len(chunks)))
+    suspects = []
+    while len(waiting) > 0 or len(suspects) > 0:
+        if len(suspects) > 0:
+            #a chunk that was being read when a worker died, read on its own
+            ind_c = suspects.pop()
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                try:
+                    chunk_results = executor.submit(headerRowsChunk, [tasks[i] for i in chunks[ind_c]]).result()
+                except BrokenProcessPool:
+                    chunk_results = [(None, str(BrokenProcessPool))] * len(chunks[ind_c])
+            for i, result in zip(chunks[ind_c], chunk_results):
+                results[i] = result
+            continue
+        #at most one chunk per worker is sent at a time, so the chunks being
+        #read when a worker dies are known
+        running = {}
+        with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+            try:
+                while len(waiting) > 0 or len(running) > 0:
+                    while len(waiting) > 0 and len(running) < numWorkers:
+                        ind_c = waiting.popleft()
+                        running[executor.submit(headerRowsChunk, [tasks[i] for i in chunks[ind_c]])] = ind_c
+                    done, not_done = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk_results = future.result()
+                        for i, result in zip(chunks[running.pop(future)], chunk_results):
+                            results[i] = result
+            except BrokenProcessPool:
+                suspects = list(running.values())
+    return results
+
+
+def pooledSession(numThreads):
+    '''
+    Returns a requests session whose connection pool can keep numThreads
+    connections per host open, for sharing between threads.
+    
+    Requires:
+        - requests
+    '''
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=numThreads, pool_maxsize=numThreads)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def hostLimiter(perHostLimit):
+    '''
+    Returns a function giving the semaphore for a url's host, use it with
+    "with" to allow at most perHostLimit requests to the same host at once.
+    
+    Requires:
+        - threading
+    '''
+    import threading
+    from urllib.parse import urlparse
+    host_limits = {}
+    host_lock = threading.Lock()
+    
+    def limit(url):
+        with host_lock:
+            return host_limits.setdefault(urlparse(url).netloc, threading.BoundedSemaphore(perHostLimit))
+    return limit
+
+
+def downloadFiles(downloads, numThreads=8, perHostLimit=4, retries=3, backoff=1.0, timeout=60, block_size=1 << 16):
+    '''
+    Downloads many files at once using a bounded pool of threads sharing one
+    pooled HTTP session. Each host gets at most perHostLimit downloads at a
+    time, failed downloads are retried with exponential backoff and partial
+    files (saved as <file name>.part) are resumed with HTTP Range requests.
+    Each file name is only downloaded once: later downloads to a file name
+    already in the list aren't started (they would write to the same partial
+    file) and are reported as failed.
+    
+    Input:
+        - list of (url, file name) to download
+        - number of threads (downloads running at once)
+        - maximum number of downloads from the same host at once
+        - number of times to retry a failed download
+        - backoff: seconds to wait before the first retry, doubled each time
+        - timeout (seconds) for connecting/reading
+        - size of the blocks written to disk
+    
+    Output:
+        - list of dictionaries (in the same order as downloads) with the url,
+          file name, bytes downloaded and error (None if it downloaded)
+    
+    Requires:
+        - requests, threading, concurrent.futures
+    '''
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    session = pooledSession(numThreads)
+    host_limit = hostLimiter(perHostLimit)
+    
+    def download(url, file_name):
+        limit = host_limit(url)
+        part_name = file_name + '.part'
+        downloaded = 0
+        for attempt in range(retries + 1):
+            try:
+                with limit:
+                    #resume from the end of a partial file if there is one
+                    offset = os.path.getsize(part_name) if os.path.isfile(part_name) else 0
+                    headers = {'Range' : 'bytes=' + str(offset) + '-'} if offset > 0 else {}
+                    with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+                        if r.status_code == 416:
+                            #nothing left to download
+                            pass
+                        else:
+                            r.raise_for_status()
+                            #the server may ignore the range and send the whole file
+                            mode = 'ab' if r.status_code == 206 else 'wb'
+                            with open(part_name, mode) as f:
+                                for block in r.iter_content(block_size):
+                                    f.write(block)
+                                    downloaded += len(block)
+                os.replace(part_name, file_name)
+                return {'url' : url, 'file' : file_name, 'bytes' : downloaded, 'error' : None}
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                #don't retry client errors (e.g. 404) apart from timeouts/rate limits
+                if attempt == retries or (status is not None and 400 <= status < 500 and status not in [408, 429]):
+                    return {'url' : url, 'file' : file_name, 'bytes' : downloaded, 'error' : repr(e)}
+                time.sleep(backoff * 2 ** attempt)
+    
+    #the first download to each file name
+    first = {}
+    for ind_d, (url, file_name) in enumerate(downloads):
+        first.setdefault(os.path.abspath(file_name), ind_d)
+    unique = sorted(first.values())
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=numThreads) as executor:
+        results = dict(zip(unique, executor.map(lambda d: download(*d), [downloads[ind_d] for ind_d in unique])))
+    session.close()
+    results = [results[ind_d] if ind_d in results else
+               {'url' : url, 'file' : file_name, 'bytes' : 0, 'error' : 'Another download in the list has the same file name'}
+               for ind_d, (url, file_name) in enumerate(downloads)]
+    elapsed = time.perf_counter() - start
+    total = sum(result['bytes'] for result in results)
+    print('Downloaded ' + str(sum(result['error'] is None for result in results)) + '/' + str(len(downloads)) + ' files, '
+          + str(round(total/1e6, 1)) + ' MB in ' + str(round(elapsed, 1)) + ' s (' + str(round(total/1e6/max(elapsed, 1e-9), 2)) + ' MB/s)')
+    return results
+
+
+def fetchHeaderRows(session, url, fileFormat, nrows=2, start_bytes=8192, max_bytes=1 << 22, timeout=60):
+    '''
+    Gets the header rows of a resource from its url without downloading the
+    whole file. For csv files only the leading bytes are requested (HTTP
+    Range), doubling the range until it holds nrows complete rows. Excel
+    files can't be read from their first bytes so they are fetched into
+    memory. Nothing is written to disk.
+    
+    Input:
+        - requests session
+        - url of the resource
+        - file format: 'csv', 'xlsx' or 'xls'
+        - number of rows to read (default 2)
+        - size of the first range requested, and the largest range before
+          giving up on finding the end of the rows
+        - timeout (seconds) for connecting/reading
+    
+    Output:
+        - list of rows, as returned by readHeaderRows
+        - number of bytes transferred
+    
+    Requires:
+        - requests, csv
+    '''
+    import csv
+    
+    if fileFormat.lower() != 'csv':
+        r = session.get(url, timeout=timeout)
+        r.raise_for_status()
+        return readHeaderRows(io.BytesIO(r.content), fileFormat, nrows=nrows), len(r.content)
+    
+    transferred = 0
+    size = start_bytes
+    while True:
+        with session.get(url, headers={'Range' : 'bytes=0-' + str(size - 1)}, stream=True, timeout=timeout) as r:
+            if r.status_code == 416:
+                #the range can't be satisfied, the file is empty
+                return readHeaderRows(io.BytesIO(b''), 'csv', nrows=nrows), transferred
+            r.raise_for_status()
+            #servers that ignore the range send the whole file, stop reading after size bytes
+            data = b''
+            for block in r.iter_content(1 << 16):
+                data += block
+                if len(data) >= size:
+                    break
+            data = data[:size]
+            transferred += len(data)
+            complete = len(data) < size
+        if complete:
+            return readHeaderRows(io.BytesIO(data), 'csv', nrows=nrows), transferred
+        #only use whole lines, the rows are complete once the row after them has started
+        lines = data[:data.rfind(b'\n') + 1]
+        text = lines.decode('utf-8-sig', errors='replace')
+        if sum(1 for row in csv.reader(io.StringIO(text, newline='')) if len(row) > 0) > nrows:
+            return readHeaderRows(io.BytesIO(lines), 'csv', nrows=nrows), transferred
+        if size >= max_bytes:
+            raise ValueError('Couldn\'t find the first ' + str(nrows) + ' rows in the first ' + str(size) + ' bytes')
+        size = size * 2
+
+
+def fetchAllHeaderRows(resources, nrows=2, numThreads=8, perHostLimit=4, retries=3, backoff=1.0):
+    '''
+    Gets the header rows of many resources straight from their urls (see
+    fetchHeaderRows), several at a time.
+    
+    Input:
+        - list of (url, file format)
+        - number of rows to read (default 2)
+        - number of threads (requests running at once)
+        - maximum number of requests to the same host at once
+        - number of times to retry a failed request, waiting backoff seconds
+          before the first retry and doubling each time
+    
+    Output:
+        - list of (rows or None, error or None) in the same order as the
+          resources
+    
+    Requires:
+        - requests, threading, concurrent.futures
+    '''
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    session = pooledSession(numThreads)
+    host_limit = hostLimiter(perHostLimit)
+    transferred = []
+    
+    def fetch(url, fileFormat):
+        for attempt in range(retries + 1):
+            try:
+                with host_limit(url):
+                    rows, size = fetchHeaderRows(session, url, fileFormat, nrows=nrows)
+                transferred.append(size)
+                return rows, None
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if attempt == retries or isinstance(e, ValueError) or (status is not None and 400 <= status < 500 and status not in [408, 429]):
+                    return None, repr(e)
+                time.sleep(backoff * 2 ** attempt)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=numThreads) as executor:
+        results = list(executor.map(lambda resource: fetch(*resource), resources))
+    session.close()
+    elapsed = time.perf_counter() - start
+    print('Fetched headers of ' + str(len(transferred)) + '/' + str(len(resources)) + ' resources, '
+          + str(round(sum(transferred)/1e6, 2)) + ' MB in ' + str(round(elapsed, 1)) + ' s')
+    return results
+
+
+def readWeights(hxl_file='hxl_dictionary_weighted.xlsx', var_file='var_dictionary_weighted.xlsx'):
+    '''
+    Reads the "expert judgement" weights for particular hxls/vars.
+    
+    Input:
+        - names of the hxl and variable weight excel files
+    
+    Output:
+        - dictionary of hxl -> weight
+        - dictionary of variable -> weight
+    
+    Requires:
+        - pandas
+    '''
+    hxls_weights = pd.read_excel(hxl_file, usecols = ['HXL', 'Weight'])
+    hxls_weights = hxls_weights.set_index('HXL').T.to_dict('records')[0]
+    vars_weights = pd.read_excel(var_file, usecols = ['Var_name', 'Weight'])
+    vars_weights = vars_weights.set_index('Var_name').T.to_dict('records')[0]
+    return hxls_weights, vars_weights
+
+
+def graphIndex(G, hxls_weights=None, vars_weights=None, snapshot=None):
+    '''
+    Builds an in-memory index of a data environment graph (as created by
+    create_graph) so new datasets can be matched against it without
+    re-reading the graph: a postings list of the nodes containing each
+    hxl/variable, plus the weights. The postings are also kept as sparse
+    token x node matrices so many new datasets can be matched at once
+    (matchIndexBatch). If the graph was loaded from a snapshot the matrices
+    are built straight from its token arrays, rather than splitting the
+    comma-joined node attributes again.
+    
+    Input:
+        - networkx graph with comma-joined 'hxls' and 'variables' node
+          attributes
+        - dictionaries of hxl/variable -> "expert judgement" weight
+        - snapshot the graph was rebuilt from (readGraphSnapshot and
+          snapshotToGraph), or None
+    
+    Output:
+        - dictionary with the graph, list of nodes, postings lists of hxl ->
+          node positions and variable -> node positions, the weights, and
+          for 'hxls' and 'vars' a '<key>_matrix' (tokens x nodes, in the
+          order of the postings lists) and '<key>_token_weights' (weight of
+          each row, 0.5 if not in the weights)
+    
+    Requires:
+        - numpy, scipy
+    '''
+    import numpy as np
+    from scipy import sparse
+    
+    nodes = list(G.nodes())
+    index = {'graph' : G, 'nodes' : nodes, 'hxls' : {}, 'vars' : {},
+             'hxls_weights' : hxls_weights or {}, 'vars_weights' : vars_weights or {}}
+    if snapshot is not None:
+        tokens = snapshot['tokens']
+        for key in ['hxls', 'vars']:
+            indptr = np.asarray(snapshot['node_' + key + '_indptr'])
+            cols = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+            matrix = sparse.csr_matrix((np.ones(len(cols)), (np.asarray(snapshot['node_' + key + '_indices']), cols)),
+                                       shape=(len(tokens), len(nodes)))
+            #a token listed twice for a node counts once
+            matrix.sum_duplicates()
+            matrix.data[:] = 1
+            used = np.array([ind_t for ind_t in np.flatnonzero(np.diff(matrix.indptr)) if tokens[ind_t] != ''], dtype=np.int64)
+            matrix = matrix[used]
+            index[key] = {tokens[ind_t] : matrix.indices[matrix.indptr[ind_r]:matrix.indptr[ind_r + 1]].tolist()
+                          for ind_r, ind_t in enumerate(used)}
+            index[key + '_matrix'] = matrix
+            index[key + '_token_weights'] = np.array([index[key + '_weights'].get(tokens[ind_t], 0.5) for ind_t in used], dtype=float)
+        return index
+    for ind_n, n in enumerate(nodes):
+        for key, attr in [('hxls', 'hxls'), ('vars', 'variables')]:
+            for token in set(G.nodes[n].get(attr, '').split(",")):
+                if token != '':
+                    index[key].setdefault(token, []).append(ind_n)
+    for key in ['hxls', 'vars']:
+        postings = index[key]
+        lengths = np.fromiter((len(p) for p in postings.values()), dtype=np.int64, count=len(postings))
+        rows = np.repeat(np.arange(len(postings)), lengths)
+        cols = np.fromiter((ind_n for p in postings.values() for ind_n in p), dtype=np.int64, count=int(lengths.sum()))
+        index[key + '_matrix'] = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(postings), len(nodes)))
+        index[key + '_token_weights'] = np.array([index[key + '_weights'].get(token, 0.5) for token in postings], dtype=float)
+    return index
+
+
+def matchIndexBatch(index, uploads):
+    '''
+    Finds the nodes of an indexed graph that share hxls or variables with
+    each of several new datasets. All the new datasets are scored in one
+    sparse product (datasets x tokens times tokens x nodes), the shared
+    hxls/vars are then only collected for the pairs that match.
+    
+    Input:
+        - index returned by graphIndex
+        - list of (list of hxls, list of variables), one per new dataset
+    
+    Output:
+        - list (one per new dataset) of lists of (node, set of shared hxls,
+          set of shared variables, summed "expert judgement" weight) in
+          graph node order
+    
+    Requires:
+        - numpy, scipy
+    '''
+    import numpy as np
+    from scipy import sparse
+    
+    num_nodes = len(index['nodes'])
+    counts = sparse.csr_matrix((len(uploads), num_nodes))
+    scores = sparse.csr_matrix((len(uploads), num_nodes))
+    tokens = {key : list(index[key]) for key in ['hxls', 'vars']}
+    upload_rows = {}
+    for key, ind_s in [('hxls', 0), ('vars', 1)]:
+        rows = {token : ind_t for ind_t, token in enumerate(tokens[key])}
+        #rows of the tokens of each new dataset (tokens not in the graph are ignored)
+        upload_rows[key] = [np.array(sorted(set(rows[token] for token in upload[ind_s] if token in rows)), dtype=np.int64)
+                            for upload in uploads]
+        lengths = [len(r) for r in upload_rows[key]]
+        cols = np.concatenate(upload_rows[key]) if len(uploads) > 0 else np.zeros(0, dtype=np.int64)
+        queries = sparse.csr_matrix((np.ones(len(cols)), (np.repeat(np.arange(len(uploads)), lengths), cols)),
+                                    shape=(len(uploads), len(tokens[key])))
+        counts = counts + queries @ index[key + '_matrix']
+        #the weight of each shared token is summed (0.5 if not in the weights)
+        scores = scores + queries.multiply(index[key + '_token_weights']).tocsr() @ index[key + '_matrix']
+    counts = counts.tocsr()
+    counts.sort_indices()
+    scores = scores.tocsr()
+    
+    results = []
+    for ind_u in range(len(uploads)):
+        matched = counts.indices[counts.indptr[ind_u]:counts.indptr[ind_u + 1]]
+        shared = {ind_n : (set(), set()) for ind_n in matched}
+        for key, ind_s in [('hxls', 0), ('vars', 1)]:
+            incidence = index[key + '_matrix'][upload_rows[key][ind_u]].tocoo()
+            for ind_t, ind_n in zip(upload_rows[key][ind_u][incidence.row], incidence.col):
+                shared[ind_n][ind_s].add(tokens[key][ind_t])
+        weights = scores[ind_u].toarray().ravel()
+        results.append([(index['nodes'][ind_n], shared[ind_n][0], shared[ind_n][1], float(weights[ind_n]))
+                        for ind_n in matched])
+    return results
+
+
+def cachedMatchIndexBatch(index, uploads, keys, cache, version, timeout=None):
+    '''
+    Same as matchIndexBatch, but the matches of each new dataset are kept in
+    a cache (e.g. flask_caching) under a key made from the hash of the
+    dataset and the version of the graph/weights (graphVersion), so the same
+    file uploaded again (in any browser tab or, with a shared cache backend,
+    any worker process) isn't matched again. Only the datasets that aren't
+    cached are matched, in one batch. Matches that are found in the cache are
+    stored again, so they expire timeout seconds after they were last used
+    and the least recently used are removed first when the cache is full.
+    
+    Input:
+        - index returned by graphIndex
+        - list of (list of hxls, list of variables), one per new dataset
+        - list of keys identifying the contents of each new dataset
+        - cache with get_many/set_many (flask_caching.Cache)
+        - version of the graph, weights and matching settings
+        - seconds the matches are kept (None for the cache's default)
+    
+    Output:
+        - same as matchIndexBatch
+    
+    Requires:
+        - hashlib
+    '''
+    import hashlib
+    
+    cache_keys = ['matches-' + hashlib.sha1((version + '-' + key).encode('utf-8')).hexdigest() for key in keys]
+    results = list(cache.get_many(*cache_keys)) if len(cache_keys) > 0 else []
+    missing = [ind_u for ind_u, result in enumerate(results) if result is None]
+    if len(missing) > 0:
+        for ind_u, matches in zip(missing, matchIndexBatch(index, [uploads[ind_u] for ind_u in missing])):
+            results[ind_u] = matches
+    cache.set_many({cache_key : result for cache_key, result in zip(cache_keys, results)}, timeout=timeout)
+    return results
+
+
+
+def fileSystemCache(app, config, args, options):
+    '''
+    flask_caching backend factory (CACHE_TYPE 'myFunctions.fileSystemCache')
+    for a cache kept in files, shared by all the worker processes of a server.
+    It uses cachelib's FileSystemCache directly, because the 'filesystem'
+    backend of some flask_caching versions (e.g. 1.11) can't read the files
+    written by newer cachelib versions (every get fails with "invalid load
+    key"). Each CACHE_KEY_PREFIX gets its own sub-folder of CACHE_DIR.
+    
+    Input:
+        - Flask app
+        - flask_caching config (CACHE_DIR, CACHE_THRESHOLD, CACHE_KEY_PREFIX)
+        - extra positional arguments (CACHE_ARGS)
+        - extra keyword arguments (CACHE_OPTIONS and default_timeout)
+    
+    Output:
+        - cachelib.FileSystemCache
+    
+    Requires:
+        - cachelib
+    '''
+    from cachelib import FileSystemCache
+    
+    cache_dir = os.path.join(config['CACHE_DIR'], config.get('CACHE_KEY_PREFIX') or '')
+    options = dict(options)
+    options.setdefault('threshold', config.get('CACHE_THRESHOLD', 500))
+    return FileSystemCache(cache_dir, *args, **options)
+
+def graphVersion(paths, *settings):
+    '''
+    Returns a version string for a graph: the sha1 hex digest of the contents
+    of its files (the gexf or every file of the snapshot folder, the weight
+    files, ...) and of any settings that change how datasets are matched to
+    it. Files that don't exist are skipped.
+    
+    Requires:
+        - hashlib
+    '''
+    import hashlib
+    
+    digest = hashlib.sha1(repr(settings).encode('utf-8'))
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+        else:
+            files = [path] if os.path.isfile(path) else []
+        for file_name in files:
+            digest.update((os.path.basename(file_name) + fileHash(file_name)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def storeArtifact(store_dir, name, write, max_bytes=None, max_age=None):
+    '''
+    Returns the path of a generated file (e.g. a network drawn by draw_graph3)
+    in a folder of generated files, only creating it if it isn't there yet.
+    Names should be made from a hash of what the file is made from, so the
+    same inputs give the same file and different ones never overwrite each
+    other. The file is written under a temporary name and then renamed, so
+    other processes never see a partly written file. The store is then
+    pruned (pruneArtifacts) to keep it below max_bytes and max_age.
+    
+    Input:
+        - folder of the store (created if needed)
+        - name of the file in the store
+        - function writing the file to the path it is given
+        - maximum total size (bytes) and age (seconds since last used) of
+          the files in the store, None for no limit
+    
+    Output:
+        - path of the file
+    '''
+    import uuid
+    
+    path = os.path.join(store_dir, name)
+    if os.path.isfile(path):
+        #mark the file as used, so it is removed last
+        os.utime(path)
+        return path
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = os.path.join(store_dir, 'tmp-' + uuid.uuid4().hex + '-' + name)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+    pruneArtifacts(store_dir, max_bytes, max_age, keep=[name])
+    return path
+
+
+def pruneArtifacts(store_dir, max_bytes=None, max_age=None, keep=()):
+    '''
+    Removes the files of a store of generated files (see storeArtifact) that
+    haven't been used (modified time) for more than max_age seconds, then
+    the least recently used files until the store is no larger than
+    max_bytes. Files still being written (temporary names) are only removed
+    once they are older than max_age.
+    
+    Input:
+        - folder of the store
+        - maximum total size (bytes) and age (seconds), None for no limit
+        - names of files that are never removed
+    
+    Output:
+        - number of files removed
+    '''
+    import time
+    
+    if not os.path.isdir(store_dir):
+        return 0
+    now = time.time()
+    files = []
+    for entry in os.scandir(store_dir):
+        try:
+            if entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path, entry.name in keep, entry.name.startswith('tmp-')))
+        except FileNotFoundError:
+            #removed by another process
+            continue
+    files.sort()
+    removed = set()
+    if max_age is not None:
+        removed = set(path for mtime, size, path, kept, tmp in files if now - mtime > max_age and not kept)
+    if max_bytes is not None:
+        total = sum(size for mtime, size, path, kept, tmp in files if path not in removed)
+        for mtime, size, path, kept, tmp in files:
+            if total <= max_bytes:
+                break
+            if path not in removed and not kept and not tmp:
+                removed.add(path)
+                total -= size
+    for path in removed:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(removed)
+
+
+def writeGraphSnapshot(G, path):
+    '''
+    Saves a data environment graph as a compact snapshot: a folder of numpy
+    arrays (integer node ids, edge arrays and the hxls/vars of each node and
+    edge as indices into one interned token table) plus a small json file of
+    strings. The arrays can be memory-mapped, so the snapshot loads much
+    faster than GEXF (which is still the format to use with Gephi).
+    
+    Input:
+        - networkx graph, as created by create_graph
+        - name of the snapshot folder (created if it doesn't exist)
+    
+    Output:
+        - None
+    
+    Requires:
+        - numpy, json
+    '''
+    import numpy as np
+    
+    os.makedirs(path, exist_ok=True)
+    nodes = list(G.nodes())
+    node_pos = {n : ind_n for ind_n, n in enumerate(nodes)}
+    tokens = {}
+    
+    def token_lists(lists):
+        #intern tokens and return csr style (indptr, indices) arrays
+        indptr = [0]
+        indices = []
+        for t in lists:
+            indices.extend(tokens.setdefault(token, len(tokens)) for token in t)
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32)
+    
+    def split(attr):
+        return [] if attr in [None, ''] else str(attr).split(',')
+    
+    arrays = {}
+    arrays['node_hxls_indptr'], arrays['node_hxls_indices'] = token_lists(split(d.get('hxls')) for n, d in G.nodes(data=True))
+    arrays['node_vars_indptr'], arrays['node_vars_indices'] = token_lists(split(d.get('variables')) for n, d in G.nodes(data=True))
+    edges = list(G.edges(data=True))
+    arrays['edge_source'] = np.array([node_pos[u] for u, v, d in edges], dtype=np.int32)
+    arrays['edge_target'] = np.array([node_pos[v] for u, v, d in edges], dtype=np.int32)
+    arrays['edge_title_indptr'], arrays['edge_title_indices'] = token_lists((d['title'].split('<br> ') if d.get('title') else []) for u, v, d in edges)
+    
+    #other attributes: numbers are stored as arrays, anything else as strings
+    meta = {'nodes' : [str(n) for n in nodes], 'node_attrs' : {}, 'edge_attrs' : {}}
+    for key, items, skip in [('node_attrs', [d for n, d in G.nodes(data=True)], ['hxls', 'variables', 'label']),
+                             ('edge_attrs', [d for u, v, d in edges], ['title', 'id'])]:
+        for attr in sorted(set(a for d in items for a in d if a not in skip)):
+            values = [d.get(attr) for d in items]
+            #numbers missing for some nodes/edges (e.g. linkage_risk) are stored as nan
+            if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values if value is not None):
+                dtype = np.int64 if all(isinstance(value, int) for value in values) else np.float64
+                arrays[key.split('_')[0] + '_' + attr] = np.array([np.nan if value is None else value for value in values], dtype=dtype)
+                meta[key][attr] = str(np.dtype(dtype))
+            else:
+                meta[key][attr] = [None if value is None else str(value) for value in values]
+    meta['tokens'] = list(tokens)
+    
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+    with open(os.path.join(path, 'snapshot.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+
+def readGraphSnapshot(path, mmap=True):
+    '''
+    Loads a snapshot saved by writeGraphSnapshot.
+    
+    Input:
+        - name of the snapshot folder
+        - mmap: memory-map the arrays rather than reading them into memory
+    
+    Output:
+        - dictionary of the snapshot's arrays, plus 'nodes' (node ids),
+          'tokens' (token table), 'node_attrs' and 'edge_attrs'
+    
+    Requires:
+        - numpy, json
+    '''
+    import numpy as np
+    
+    with open(os.path.join(path, 'snapshot.json'), encoding='utf-8') as f:
+        snapshot = json.load(f)
+    for name in os.listdir(path):
+        if name.endswith('.npy'):
+            snapshot[name[:-4]] = np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+    return snapshot
+
+
+def snapshotToGraph(snapshot):
+    '''
+    Rebuilds the networkx graph from a snapshot loaded by readGraphSnapshot,
+    with the same node and edge attributes as the graph read from GEXF.
+    
+    Requires:
+        - networkx
+    '''
+    import networkx as nx
+    
+    nodes = snapshot['nodes']
+    tokens = snapshot['tokens']
+    
+    def token_lists(name):
+        indptr = snapshot[name + '_indptr'].tolist()
+        indices = snapshot[name + '_indices'].tolist()
+        return [[tokens[t] for t in indices[indptr[i]:indptr[i+1]]] for i in range(len(indptr) - 1)]
+    
+    def attr_values(key, prefix):
+        #nan marks a missing number
+        return {attr : ([None if value != value else value for value in snapshot[prefix + attr].tolist()] if isinstance(dtype, str) else dtype)
+                for attr, dtype in snapshot[key].items()}
+    
+    G = nx.Graph()
+    node_attrs = attr_values('node_attrs', 'node_')
+    for ind_n, (n, h, v) in enumerate(zip(nodes, token_lists('node_hxls'), token_lists('node_vars'))):
+        attrs = {attr : values[ind_n] for attr, values in node_attrs.items() if values[ind_n] is not None}
+        G.add_node(n, hxls = ",".join(h), variables = ",".join(v), **attrs)
+    edge_attrs = attr_values('edge_attrs', 'edge_')
+    for ind_e, (u, v, title) in enumerate(zip(snapshot['edge_source'].tolist(), snapshot['edge_target'].tolist(), token_lists('edge_title'))):
+        attrs = {attr : values[ind_e] for attr, values in edge_attrs.items() if values[ind_e] is not None}
+        G.add_edge(nodes[u], nodes[v], title = '<br> '.join(title), **attrs)
+    return G
+
+
+def filterCommonTokens(dict_of_tokens, max_df):
+    '''
+    Removes the tokens found in too many datasets (e.g. "date" or "#country")
+    before the edges are found, as they link almost every pair of datasets
+    without saying much about how they could be linked.
+    
+    Input:
+        - dictionary of dataset id -> list of tokens (variables or hxls)
+        - maximum document frequency: a number of datasets, or a fraction of
+          all datasets if less than 1
+    
+    Output:
+        - dictionary of dataset id -> list of tokens without the common ones
+        - dictionary of removed token -> number of datasets it was found in
+    '''
+    index = invertedIndex(dict_of_tokens)
+    if max_df < 1:
+        max_df = max_df * len(dict_of_tokens)
+    removed = {token : len(postings) for token, postings in index.items() if len(postings) > max_df}
+    filtered = {ind_x : [token for token in tokens if token not in removed] for ind_x, tokens in dict_of_tokens.items()}
+    return filtered, removed
+
+
+def pruneEdges(G, top_k=None, min_prop=None, alpha=None, weight='weight'):
+    '''
+    Extracts the backbone of a graph by removing weak edges, so the network
+    stays sparse when many datasets share a few tokens. An edge is kept only
+    if it passes every policy that is turned on (not None):
+        - top_k: it is one of the top_k edges (by weight) of either of its
+          datasets
+        - min_prop: its "prop" (proportion of hxls/vars in common) is at
+          least min_prop
+        - alpha: it is significant at level alpha for either of its datasets
+          under the disparity filter (Serrano et al. 2009), which keeps edges
+          carrying an unusually large share of a dataset's total weight.
+          Edges of datasets with only one edge are kept.
+    
+    Input:
+        - networkx graph
+        - the policies above
+        - edge attribute holding the weights (negative weights count as 0)
+    
+    Output:
+        - number of edges removed, the graph is updated in place
+    '''
+    def edge_weight(d):
+        return max(d.get(weight, 1), 0)
+    
+    remove = set()
+    if min_prop is not None:
+        remove.update((u, v) for u, v, d in G.edges(data=True) if d.get('prop', 1) < min_prop)
+    if top_k is not None:
+        keep = set()
+        for n in G.nodes():
+            strongest = sorted(G[n].items(), key=lambda item: (-edge_weight(item[1]), str(item[0])))[:top_k]
+            keep.update(frozenset((n, m)) for m, d in strongest)
+        remove.update((u, v) for u, v in G.edges() if frozenset((u, v)) not in keep)
+    if alpha is not None:
+        strength = {n : sum(edge_weight(d) for d in G[n].values()) for n in G.nodes()}
+        
+        def significant(n, w):
+            k = G.degree(n)
+            if k <= 1:
+                return True
+            p = w / strength[n] if strength[n] > 0 else 0
+            return (1 - p) ** (k - 1) < alpha
+        remove.update((u, v) for u, v, d in G.edges(data=True)
+                      if not significant(u, edge_weight(d)) and not significant(v, edge_weight(d)))
+    G.remove_edges_from(remove)
+    return len(remove)
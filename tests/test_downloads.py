@@ -0,0 +1,146 @@
+import http.server
+import os
+import threading
+
+import pytest
+
+from myFunctions import downloadFiles, fetchHeaderRows, pooledSession
+
+CSV = ''.join('var_a,var_b,var_c\n#adm1,#date,#population\n' if i == 0 else 'row' + str(i) + ',2020,' + str(i) + '\n'
+              for i in range(500)).encode('utf-8')
+FILES = {'/data.csv' : CSV, '/empty.csv' : b''}
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    #serves FILES, with Range support unless the path starts with /norange,
+    #and cuts the first response to paths starting with /truncate short
+    requests = []
+    truncated = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        RangeHandler.requests.append((self.path, self.headers.get('Range')))
+        path = self.path
+        ignore_range = path.startswith('/norange')
+        truncate = path.startswith('/truncate') and path not in RangeHandler.truncated
+        data = FILES.get(path.replace('/norange', '').replace('/truncate', ''))
+        if data is None:
+            self.send_error(404)
+            return
+        start, end = 0, len(data) - 1
+        status = 200
+        if self.headers.get('Range') and not ignore_range:
+            first, last = self.headers['Range'].split('=')[1].split('-')
+            start = int(first)
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */' + str(len(data)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        body = data[start:end + 1]
+        self.send_response(status)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(end) + '/' + str(len(data)))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if truncate:
+            #close the connection part way through the file
+            RangeHandler.truncated.add(path)
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    RangeHandler.requests = []
+    RangeHandler.truncated = set()
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:' + str(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+def test_download_resumes_truncated_transfer(server, tmp_path):
+    file_name = str(tmp_path / 'data.csv')
+    results = downloadFiles([(server + '/truncate/data.csv', file_name)], numThreads=1, backoff=0, block_size=256)
+    assert results[0]['error'] is None
+    assert read(file_name) == CSV
+    assert not os.path.exists(file_name + '.part')
+    #the second request only asked for the rest of the file
+    ranges = [r for path, r in RangeHandler.requests]
+    assert ranges[0] is None and ranges[1].startswith('bytes=') and ranges[1] != 'bytes=0-'
+
+
+def test_download_resumes_partial_file(server, tmp_path):
+    file_name = str(tmp_path / 'data.csv')
+    with open(file_name + '.part', 'wb') as f:
+        f.write(CSV[:1000])
+    results = downloadFiles([(server + '/data.csv', file_name)], numThreads=1, backoff=0)
+    assert results[0]['error'] is None and results[0]['bytes'] == len(CSV) - 1000
+    assert read(file_name) == CSV
+    assert RangeHandler.requests == [('/data.csv', 'bytes=1000-')]
+
+
+def test_download_server_ignoring_range(server, tmp_path):
+    file_name = str(tmp_path / 'data.csv')
+    with open(file_name + '.part', 'wb') as f:
+        f.write(CSV[:1000])
+    results = downloadFiles([(server + '/norange/data.csv', file_name)], numThreads=1, backoff=0)
+    #the whole file was sent (200), so the partial file is replaced rather than appended to
+    assert results[0]['error'] is None
+    assert read(file_name) == CSV
+
+
+def test_download_empty_file(server, tmp_path):
+    file_name = str(tmp_path / 'empty.csv')
+    results = downloadFiles([(server + '/empty.csv', file_name)], numThreads=1, backoff=0)
+    assert results[0]['error'] is None
+    assert read(file_name) == b''
+
+
+def test_download_same_file_name_once(server, tmp_path):
+    file_name = str(tmp_path / 'data.csv')
+    results = downloadFiles([(server + '/data.csv', file_name), (server + '/norange/data.csv', file_name)], numThreads=2, backoff=0)
+    assert results[0]['error'] is None and results[1]['error'] is not None
+    assert read(file_name) == CSV
+    assert [path for path, r in RangeHandler.requests] == ['/data.csv']
+
+
+def test_download_missing_file_not_retried(server, tmp_path):
+    results = downloadFiles([(server + '/missing.csv', str(tmp_path / 'missing.csv'))], numThreads=1, retries=3, backoff=0)
+    assert results[0]['error'] is not None
+    assert len(RangeHandler.requests) == 1
+
+
+def test_fetch_header_rows_with_range(server):
+    rows, transferred = fetchHeaderRows(pooledSession(1), server + '/data.csv', 'csv', start_bytes=16)
+    assert rows == [['var_a', 'var_b', 'var_c'], ['#adm1', '#date', '#population']]
+    #the range was doubled until it held the rows, not the whole file
+    assert transferred < len(CSV)
+    assert [r for path, r in RangeHandler.requests] == ['bytes=0-15', 'bytes=0-31', 'bytes=0-63']
+
+
+def test_fetch_header_rows_server_ignoring_range(server):
+    rows, transferred = fetchHeaderRows(pooledSession(1), server + '/norange/data.csv', 'csv', start_bytes=64)
+    assert rows == [['var_a', 'var_b', 'var_c'], ['#adm1', '#date', '#population']]
+    assert transferred == 64
+
+
+def test_fetch_header_rows_empty_file(server):
+    rows, transferred = fetchHeaderRows(pooledSession(1), server + '/empty.csv', 'csv')
+    assert rows == [] and transferred == 0
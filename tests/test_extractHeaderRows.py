@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+
+import pytest
+
+import myFunctions
+from myFunctions import extractHeaderRows, openHeaderCache, lookupHeaderCache, storeHeaderCache
+
+
+def write_csvs(folder, num_files):
+    tasks = []
+    for ind_f in range(num_files):
+        file_name = os.path.join(str(folder), 'file' + str(ind_f) + '.csv')
+        with open(file_name, 'w') as f:
+            f.write('var' + str(ind_f) + ',b\n#hxl' + str(ind_f) + ',#b\n1,2\n')
+        tasks.append((file_name, 'csv', 2))
+    return tasks
+
+
+def test_parallel_results_in_task_order(tmp_path):
+    tasks = write_csvs(tmp_path, 10)
+    results = extractHeaderRows(tasks, numWorkers=3, chunksize=2)
+    assert [rows for rows, error in results] == [[['var' + str(i), 'b'], ['#hxl' + str(i), '#b']] for i in range(10)]
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='needs forked worker processes')
+def test_crashing_worker_only_fails_its_chunk(tmp_path, monkeypatch):
+    tasks = write_csvs(tmp_path, 12)
+    crash = tasks[5][0]
+    read = myFunctions.readHeaderRows
+    
+    def read_or_crash(file_name, fileFormat, nrows=2):
+        #kill the worker process, as running out of memory would
+        if file_name == crash:
+            os._exit(1)
+        return read(file_name, fileFormat, nrows=nrows)
+    #the worker processes are forked, so they see the patched function
+    monkeypatch.setattr(myFunctions, 'readHeaderRows', read_or_crash)
+    results = extractHeaderRows(tasks, numWorkers=3, chunksize=2)
+    failed = [ind_t for ind_t, (rows, error) in enumerate(results) if error is not None]
+    assert failed == [4, 5]
+    assert all(results[i][0] == [['var' + str(i), 'b'], ['#hxl' + str(i), '#b']] for i in range(12) if i not in failed)
+
+
+def test_header_cache_finds_moved_file_by_hash(tmp_path):
+    (file_name, file_format, nrows), = write_csvs(tmp_path, 1)
+    cache = openHeaderCache(str(tmp_path / 'cache.sqlite'))
+    assert lookupHeaderCache(cache, file_name)[0] is None
+    storeHeaderCache(cache, file_name, [['var0', 'b'], ['#hxl0', '#b']])
+    assert lookupHeaderCache(cache, file_name) == ([['var0', 'b'], ['#hxl0', '#b']], None)
+    moved = str(tmp_path / 'moved.csv')
+    os.rename(file_name, moved)
+    rows, digest = lookupHeaderCache(cache, moved)
+    assert rows == [['var0', 'b'], ['#hxl0', '#b']] and digest is not None
+    cache.close()
@@ -0,0 +1,28 @@
+import networkx as nx
+
+from myFunctions import graphIndex, matchIndexBatch, writeGraphSnapshot, readGraphSnapshot, snapshotToGraph
+
+
+def make_graph():
+    G = nx.Graph()
+    G.add_node('a', hxls='#adm1,#date', variables='province,date,date')
+    G.add_node('b', hxls='', variables='province,population')
+    G.add_node('c', hxls='#adm1', variables='')
+    G.add_edge('a', 'b', weight=1.0, title='province')
+    return G
+
+
+def test_snapshot_index_matches_graph_index(tmp_path):
+    G = make_graph()
+    writeGraphSnapshot(G, str(tmp_path / 'graph.snapshot'))
+    snapshot = readGraphSnapshot(str(tmp_path / 'graph.snapshot'))
+    G_snapshot = snapshotToGraph(snapshot)
+    weights = {'#adm1' : 2.0}, {'province' : 3.0}
+    from_graph = graphIndex(G, *weights)
+    from_snapshot = graphIndex(G_snapshot, *weights, snapshot=snapshot)
+    for key in ['hxls', 'vars']:
+        assert from_snapshot[key] == from_graph[key]
+        rows = [list(from_snapshot[key]).index(token) for token in from_graph[key]]
+        assert (from_snapshot[key + '_matrix'][rows] != from_graph[key + '_matrix']).nnz == 0
+    uploads = [(['#adm1'], ['province', 'date']), ([], ['population'])]
+    assert matchIndexBatch(from_snapshot, uploads) == matchIndexBatch(from_graph, uploads)
@@ -0,0 +1,29 @@
+from headerMatch import headerIndex, lookupHeaders
+
+KNOWN = ['Admin1 Name', 'Admin2 Name', 'Population Total', 'Year', 'Latitude']
+
+
+def test_lookup_exact_and_normalised():
+    index = headerIndex(KNOWN)
+    matches = lookupHeaders(index, ['Year', 'admin1_name', 'ADM2_EN'])
+    assert matches == {'Year' : 'Year', 'admin1_name' : 'Admin1 Name', 'ADM2_EN' : 'Admin2 Name'}
+
+
+def test_lookup_misspelled_headers():
+    index = headerIndex(KNOWN)
+    matches = lookupHeaders(index, ['admin2 nam', 'admin1 nam', 'populaton total'])
+    assert matches == {'admin2 nam' : 'Admin2 Name', 'admin1 nam' : 'Admin1 Name',
+                       'populaton total' : 'Population Total'}
+
+
+def test_lookup_different_numbers_never_match():
+    index = headerIndex(['Admin1 Name', 'Population Total'])
+    #similar to Admin1 Name, but with another number
+    matches = lookupHeaders(index, ['admin2 nam', 'Admin3 Name'])
+    assert matches == {'admin2 nam' : None, 'Admin3 Name' : None}
+
+
+def test_lookup_numbers_not_in_index():
+    #the query's numbers must not be confused with the index's by position
+    index = headerIndex(['Admin2 Name', 'Year'])
+    assert lookupHeaders(index, ['admin1 nam', 'admin2 nam']) == {'admin1 nam' : None, 'admin2 nam' : 'Admin2 Name'}
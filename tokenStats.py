@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Description: statistics of the variables/hxls (tokens) found in a collection
+            of datasets: how many datasets each token is found in (document
+            frequency), its inverse document frequency (IDF) and how often
+            pairs of tokens are found in the same dataset (co-occurrence,
+            a sparse product of the dataset x token incidence matrix with
+            itself). They are calculated in a single pass over the datasets, can be
+            saved as tables (csv) and can be used to weight edges
+            automatically, with or without the "expert judgement" weights.
+
+Requirements: pandas, numpy, scipy
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def tokenStatistics(token_lists, cooccurrence=True):
+    '''
+    Counts the number of datasets each token is found in, and optionally the
+    number of datasets each pair of tokens is found in together, in a single
+    pass over the datasets (which can be a generator, e.g. while files are
+    read). Tokens repeated in a dataset are counted once. The co-occurrences
+    are counted with a sparse matrix product (AᵀA, where A is the dataset x
+    token incidence matrix) rather than by listing the pairs of each dataset.
+
+    Input:
+        - iterable of lists of tokens (variables or hxls), one per dataset,
+          e.g. dict_of_vars.values()
+        - whether to count the co-occurrences
+
+    Output:
+        - dictionary with the number of datasets ('num_datasets'), Counter of
+          token -> number of datasets ('df'), the sorted list of tokens
+          ('tokens') and a sparse upper triangular token x token matrix
+          (rows/columns in the order of 'tokens') of the number of datasets
+          each pair is found in ('cooccurrence', None if not counted)
+    '''
+    stats = {'num_datasets' : 0, 'df' : Counter(), 'tokens' : [], 'cooccurrence' : None}
+    columns = {}
+    indices = []
+    indptr = [0]
+    for tokens in token_lists:
+        tokens = set(tokens)
+        stats['num_datasets'] += 1
+        stats['df'].update(tokens)
+        if cooccurrence:
+            indices.extend(columns.setdefault(token, len(columns)) for token in tokens)
+            indptr.append(len(indices))
+    stats['tokens'] = sorted(stats['df'])
+    if cooccurrence:
+        #columns numbered in the order the tokens were found, renumbered in sorted order
+        order = np.empty(len(columns), dtype=np.int64)
+        position = {token : ind_t for ind_t, token in enumerate(stats['tokens'])}
+        for token, ind_c in columns.items():
+            order[ind_c] = position[token]
+        A = sparse.csr_matrix((np.ones(len(indices)), order[np.array(indices, dtype=np.int64)], np.array(indptr, dtype=np.int64)),
+                              shape=(stats['num_datasets'], len(columns)))
+        stats['cooccurrence'] = sparse.triu(A.T @ A, k=1).tocsr()
+    return stats
+
+
+def idfWeights(stats):
+    '''
+    Calculates an automatic weight for each token from its inverse document
+    frequency, scaled to the range of the "expert judgement" weights: tokens
+    found in every dataset (e.g. "#date") get 0 and tokens found in only one
+    dataset get 1.
+
+    Input:
+        - statistics as returned by tokenStatistics
+
+    Output:
+        - dictionary of token -> weight
+    '''
+    n = stats['num_datasets']
+    if n <= 1:
+        return {token : 1.0 for token in stats['df']}
+    return {token : round(math.log(n / df) / math.log(n), 4) for token, df in stats['df'].items()}
+
+
+def combineWeights(expert_weights, auto_weights, scheme='expert'):
+    '''
+    Chooses the weights used for edges.
+
+    Input:
+        - dictionary of token -> "expert judgement" weight
+        - dictionary of token -> automatic weight (e.g. from idfWeights)
+        - 'expert' to use the expert weights only (tokens not in the
+          dictionary get the default weight), 'idf' to use the automatic
+          weights only, or 'combined' to use the expert weight of tokens in
+          the dictionary and the automatic weight of all other tokens
+
+    Output:
+        - dictionary of token -> weight
+    '''
+    if scheme == 'expert':
+        return expert_weights
+    if scheme == 'idf':
+        return auto_weights
+    if scheme == 'combined':
+        weights = dict(auto_weights)
+        weights.update(expert_weights)
+        return weights
+    raise ValueError("Unknown weight scheme: " + str(scheme))
+
+
+def tokenTable(stats, weights=None, num_cooccurring=5):
+    '''
+    Makes a table of the token statistics, sorted by document frequency.
+
+    Input:
+        - statistics as returned by tokenStatistics
+        - optional dictionary of token -> weight used for edges
+        - number of most frequently co-occurring tokens to list for each token
+
+    Output:
+        - pandas dataframe with columns token, df (number of datasets),
+          df_prop (proportion of datasets), idf, weight (if weights are
+          given) and cooccurring (tokens most often found in the same
+          datasets, with counts)
+    '''
+    n = max(stats['num_datasets'], 1)
+    partners = {}
+    if stats['cooccurrence'] is not None:
+        #both halves of the (upper triangular) co-occurrence matrix
+        both = (stats['cooccurrence'] + stats['cooccurrence'].T).tocsr()
+        tokens = np.array(stats['tokens'], dtype=object)
+        for ind_t, token in enumerate(stats['tokens']):
+            start, end = both.indptr[ind_t], both.indptr[ind_t + 1]
+            if end > start:
+                #most frequent first, ties in token order
+                order = np.lexsort((both.indices[start:end], -both.data[start:end]))[:num_cooccurring]
+                partners[token] = list(zip(tokens[both.indices[start:end][order]], both.data[start:end][order].astype(int)))
+    rows = []
+    for token, df in sorted(stats['df'].items(), key=lambda item: (-item[1], str(item[0]))):
+        row = {'token' : token, 'df' : df, 'df_prop' : round(df / n, 4), 'idf' : round(math.log(n / df), 4)}
+        if weights is not None:
+            row['weight'] = weights.get(token)
+        row['cooccurring'] = ", ".join(str(t) + " (" + str(c) + ")" for t, c in partners.get(token, []))
+        rows.append(row)
+    columns = ['token', 'df', 'df_prop', 'idf'] + (['weight'] if weights is not None else []) + ['cooccurring']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def cooccurrenceTable(stats, min_count=2):
+    '''
+    Makes a table of the pairs of tokens found in the same datasets.
+
+    Input:
+        - statistics as returned by tokenStatistics
+        - minimum number of datasets a pair must be found in
+
+    Output:
+        - pandas dataframe with columns token_a, token_b, count (number of
+          datasets with both) and jaccard (count / number of datasets with
+          either), sorted by count
+    '''
+    if stats['cooccurrence'] is None:
+        return pd.DataFrame(columns=['token_a', 'token_b', 'count', 'jaccard'])
+    pairs = stats['cooccurrence'].tocoo()
+    keep = pairs.data >= min_count
+    rows, cols, counts = pairs.row[keep], pairs.col[keep], pairs.data[keep].astype(int)
+    tokens = np.array(stats['tokens'], dtype=object)
+    df = np.array([stats['df'][token] for token in stats['tokens']], dtype=float)
+    table = pd.DataFrame({'token_a' : tokens[rows], 'token_b' : tokens[cols], 'count' : counts,
+                          'jaccard' : np.round(counts / (df[rows] + df[cols] - counts), 4)})
+    #ties in token order
+    return table.sort_values(['count', 'jaccard', 'token_a', 'token_b'], ascending=[False, False, True, True],
+                             kind='mergesort').reset_index(drop=True)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Description: production entry point of the Data Environment Mapping tool
+            (app.py) for a WSGI server such as gunicorn:
+
+                gunicorn -c gunicorn.conf.py wsgi:server
+
+            The graph, weights and index are loaded once by load_server. With
+            preload_app (see gunicorn.conf.py) this happens in the master
+            process before the workers are forked, so the workers share the
+            loaded graph copy-on-write rather than each loading their own.
+            The objects loaded are then frozen (gc.freeze) so the garbage
+            collector of each worker doesn't write to them and un-share them.
+
+Requirements: app.py and its requirements, gunicorn (or another WSGI server)
+"""
+
+import gc
+import os
+
+
+def load_server():
+    """
+    Loads the app (the graph, weights and index of app.py) and returns its
+    Flask server. The files of the app are found relative to this file, so
+    the server can be started from any folder.
+    """
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import app
+    #move everything loaded so far out of the collected generations
+    gc.collect()
+    gc.freeze()
+    return app.server
+
+
+server = load_server()